@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Commit-graph resolver against git describe --contains on a generated history.
+
+    python -m benchmarks.bench_commit_graph --commits 50000
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from typing import List
+
+from lk_compat_helper.commit_graph import CCommitGraphResolver
+from lk_compat_helper.local_git import CLocalGitRepo
+from tests.git_repo import make_history
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def report(name: str, samples: List[float]) -> None:
+    print(
+        f"{name:>14}: mean {statistics.mean(samples) * 1e6:10.1f} us, "
+        f"p50 {percentile(samples, 50) * 1e6:10.1f} us, "
+        f"p99 {percentile(samples, 99) * 1e6:10.1f} us"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commits", type=int, default=50000)
+    parser.add_argument("--tag-every", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--describe-queries", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        start = time.perf_counter()
+        repo = make_history(path, args.commits, tag_every=args.tag_every)
+        repo.write_commit_graph()
+        print(f"Generated {args.commits} commits in {time.perf_counter() - start:.1f} s")
+
+        start = time.perf_counter()
+        resolver = CCommitGraphResolver.open(repo.git_dir)
+        assert resolver is not None
+        print(f"Opened the commit-graph in {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+        shas = repo.git("rev-list", "--all").split()
+        queries = random.Random(0).sample(shas, min(args.queries, len(shas)))
+        graph_samples: List[float] = []
+        for sha in queries:
+            start = time.perf_counter()
+            resolver.get_tag(sha)
+            graph_samples.append(time.perf_counter() - start)
+
+        local_repo = CLocalGitRepo(repo.git_dir)
+        local_repo.commit_graph = None
+        describe_samples: List[float] = []
+        for sha in queries[: args.describe_queries]:
+            start = time.perf_counter()
+            local_repo.get_tag(sha)
+            describe_samples.append(time.perf_counter() - start)
+        local_repo.close()
+
+        report("commit-graph", graph_samples)
+        report("git describe", describe_samples)
+
+
+if __name__ == "__main__":
+    main()
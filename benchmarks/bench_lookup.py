@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Requests, bytes, wall time and peak RSS of lookups against a local fake Github.
+
+    python -m benchmarks.bench_lookup --tags 1800 --commits 1000000 --latency 0.02
+    python -m benchmarks.bench_lookup --json > benchmarks/baseline.json
+    python -m benchmarks.bench_lookup --baseline benchmarks/baseline.json
+
+Every run is made in a fresh process so its peak RSS is its own. Requests and bytes are
+deterministic for a given history, with --baseline growing by more than --tolerance fails the
+run, the way a change to the search strategy shows up in CI (tox -e bench). The baseline is
+committed, regenerate it with the default options when a change makes fewer requests.
+"""
+
+import argparse
+import json
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+from tests.fake_github import CFakeGithub, CSyntheticCommits, make_tags
+
+START = datetime(2005, 6, 17)
+# Compared with the baseline, wall time and RSS vary too much between runners.
+DETERMINISTIC = ("requests", "bytes")
+# Growth allowed over the baseline, a fraction of it.
+DEFAULT_TOLERANCE = 0.05
+
+
+def _run(
+    url: str, backend: str, tag_order: str, cache_dir: Optional[str], commits: List[str]
+) -> Tuple[float, int, List[str]]:
+    lk_repo = CLinuxKernelRepo(
+        None, commits[0], cache_dir, backend=backend, api_url=url, tag_order=tag_order
+    )
+    start = time.perf_counter()
+    tags = [tag for _, tag in lk_repo.get_tags_for_commits(commits)]
+    elapsed = time.perf_counter() - start
+    # Kilobytes on Linux.
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, tags
+
+
+def measure(
+    fake: CFakeGithub,
+    backend: str,
+    tag_order: str,
+    cache_dir: Optional[str],
+    commits: List[str],
+) -> Dict[str, float]:
+    with fake.lock:
+        num_requests, num_bytes = len(fake.requests), fake.bytes_sent
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+        elapsed, peak_rss, _ = pool.submit(
+            _run, fake.url, backend, tag_order, cache_dir, commits
+        ).result()
+    with fake.lock:
+        num_requests, num_bytes = len(fake.requests) - num_requests, fake.bytes_sent - num_bytes
+    return {
+        "commits": len(commits),
+        "requests": num_requests,
+        "bytes": num_bytes,
+        "wall_s": round(elapsed, 4),
+        "peak_rss_mib": round(peak_rss / 2**20, 1),
+    }
+
+
+def run_benchmarks(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    tags = make_tags(args.tags)
+    commits = CSyntheticCommits(args.commits, START, START + timedelta(weeks=args.tags + 4))
+    rng = random.Random(0)
+    batch = [commits.sha(rng.randrange(args.commits))[:12] for _ in range(args.batch)]
+    results: Dict[str, Dict[str, float]] = {}
+    with CFakeGithub(tags) as fake:
+        fake.synthetic = commits
+        fake.latency = args.latency
+        for backend in ("rest", "graphql"):
+            for tag_order in ("listing", "version"):
+                name = f"{backend}-{tag_order}"
+                with tempfile.TemporaryDirectory() as cache_dir:
+                    results[f"{name}-cold"] = measure(fake, backend, tag_order, None, batch[:1])
+                    # The first run fills the cache, the second is warm.
+                    measure(fake, backend, tag_order, cache_dir, batch[:1])
+                    results[f"{name}-warm"] = measure(
+                        fake, backend, tag_order, cache_dir, batch[1:2]
+                    )
+                results[f"{name}-batch"] = measure(fake, backend, tag_order, None, batch)
+                print(f"{name} done", file=sys.stderr)
+    return results
+
+
+def regressions(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> Iterator[str]:
+    for name, result in sorted(results.items()):
+        for key in DETERMINISTIC:
+            expected = baseline.get(name, {}).get(key)
+            if expected is not None and result[key] > expected * (1 + tolerance):
+                yield f"{name}: {key} {expected} -> {result[key]}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tags", type=int, default=1800)
+    parser.add_argument("--commits", type=int, default=1000000)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--baseline", help="fail if requests or bytes grew from these results")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="growth over the baseline allowed, a fraction of it, default: %(default)s",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print(
+            f"{'scenario':24} {'commits':>7} {'requests':>8} {'KiB':>9} {'wall s':>8} {'RSS MiB':>8}"
+        )
+        for name, result in results.items():
+            print(
+                f"{name:24} {result['commits']:7} {result['requests']:8} "
+                f"{result['bytes'] / 1024:9.1f} {result['wall_s']:8.3f} "
+                f"{result['peak_rss_mib']:8.1f}"
+            )
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            found = list(regressions(results, json.load(baseline_file), args.tolerance))
+        for regression in found:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Snapshot load time and offline lookups for a kernel sized history.
+
+    python -m benchmarks.bench_snapshot --tags 1800 --commits 1000000
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import tempfile
+import time
+
+from lk_compat_helper.graphql import parse_date
+from lk_compat_helper.snapshot import CSnapshot, write_snapshot
+from lk_compat_helper.tag_index import from_epoch, to_epoch
+from tests.fake_github import make_tags
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tags", type=int, default=1800)
+    parser.add_argument("--commits", type=int, default=1000000)
+    parser.add_argument("--loads", type=int, default=20)
+    parser.add_argument("--lookups", type=int, default=100000)
+    args = parser.parse_args()
+
+    tags = [(name, parse_date(date)) for name, _, date in make_tags(args.tags)]
+    oldest, newest = to_epoch(tags[-1][1]), to_epoch(tags[0][1])
+    rng = random.Random(0)
+    shas = [hashlib.sha1(str(idx).encode()).hexdigest() for idx in range(args.commits)]
+    commit_dates = {sha: from_epoch(rng.randint(oldest, newest)) for sha in shas}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "linux.lkts")
+        start = time.perf_counter()
+        write_snapshot(path, tags, commit_dates)
+        print(
+            f"Wrote {args.tags} tags and {args.commits} commits in "
+            f"{time.perf_counter() - start:.1f} s, {os.path.getsize(path) / 2**20:.1f} MiB"
+        )
+
+        samples = []
+        for _ in range(args.loads):
+            start = time.perf_counter()
+            snapshot = CSnapshot(path)
+            samples.append(time.perf_counter() - start)
+            snapshot.close()
+        samples.sort()
+        print(
+            f"Load: min {samples[0] * 1e3:.2f} ms, median {samples[len(samples) // 2] * 1e3:.2f} ms"
+        )
+
+        snapshot = CSnapshot(path)
+        queries = rng.sample(shas, min(args.lookups, len(shas)))
+        start = time.perf_counter()
+        for sha in queries:
+            commit_ts = snapshot.commit_epoch(sha[:12])
+            assert commit_ts is not None
+            snapshot.timeline.lookup(commit_ts)
+        elapsed = time.perf_counter() - start
+        print(f"Lookup: {elapsed / len(queries) * 1e6:.1f} us a commit (abbreviated SHA)")
+        snapshot.close()
+
+
+if __name__ == "__main__":
+    main()
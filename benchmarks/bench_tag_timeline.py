@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tag timeline batch lookups against the binary search over the tag list.
+
+    python -m benchmarks.bench_tag_timeline --dates 100000
+"""
+
+import argparse
+import random
+import time
+
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+from lk_compat_helper.graphql import parse_date
+from lk_compat_helper.tag_index import TagEntry, from_epoch, to_epoch
+from lk_compat_helper.tag_timeline import CTagTimeline, numpy
+from tests.fake_github import make_tags
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tags", type=int, default=900)
+    parser.add_argument("--dates", type=int, default=100000)
+    parser.add_argument("--search-dates", type=int, default=10000)
+    args = parser.parse_args()
+
+    fake_tags = make_tags(args.tags)
+    dates = [parse_date(date) for _, _, date in fake_tags]
+    tags = [TagEntry(name, str(sha), date) for (name, sha, _), date in zip(fake_tags, dates)]
+    oldest, newest = to_epoch(dates[-1]), to_epoch(dates[0])
+    rng = random.Random(0)
+    epochs = [rng.randint(oldest - 86400, newest + 86400) for _ in range(args.dates)]
+
+    start = time.perf_counter()
+    timeline = CTagTimeline.from_tags(tags)
+    assert timeline is not None
+    print(
+        f"Built the timeline of {len(timeline)} tags in {(time.perf_counter() - start) * 1e3:.2f} ms"
+    )
+
+    start = time.perf_counter()
+    answers = timeline.lookup_many(epochs)
+    elapsed = time.perf_counter() - start
+    print(
+        f"lookup_many ({'numpy' if numpy is not None else 'bisect'}): {len(epochs)} dates in "
+        f"{elapsed * 1e3:.1f} ms, {elapsed / len(epochs) * 1e9:.0f} ns a date"
+    )
+
+    lk_repo = CLinuxKernelRepo(None, "1e28eed17697")
+    lk_repo.swap_tags((tags, len(tags)))
+    lk_repo.timeline = None
+    sample = epochs[: args.search_dates]
+    start = time.perf_counter()
+    searched = lk_repo.get_tags_for_dates([from_epoch(epoch) for epoch in sample])
+    elapsed = time.perf_counter() - start
+    print(
+        f"binary search: {len(sample)} dates in {elapsed * 1e3:.1f} ms, "
+        f"{elapsed / len(sample) * 1e9:.0f} ns a date"
+    )
+    assert searched == answers[: len(sample)]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+    cast,
+)
+
+from lk_compat_helper.errors import LOOKUP_ERRORS, CResolveError, to_resolve_error
+from lk_compat_helper.tag_index import TagEntry, to_epoch
+from lk_compat_helper.tag_pages import CTagPages
+from lk_compat_helper.tag_probes import ProbeRecord
+
+if TYPE_CHECKING:  # pragma: no cover
+    from lk_compat_helper.commit_to_tag import CLinuxKernelRepo, Tags
+
+logger = logging.getLogger("__main__")
+
+# Github's secondary rate limits allow 100 concurrent requests, stay well below.
+DEFAULT_MAX_IN_FLIGHT = 32
+
+T = TypeVar("T")
+
+
+class CAsyncResolver:
+    """
+    Resolves a batch of commits with up to max_in_flight Github requests at once, with the
+    answers of CLinuxKernelRepo.get_tag.
+
+    The commits are fetched while the tags are listed, 100 a GraphQL query with a token, the
+    pages of a REST listing all at once, and the searches of the commits run side by side, a tag
+    date probed by several of them is fetched once. The requests go through the repo's session,
+    so its rate limiter, caches and cassette, over a pool of max_in_flight keep-alive connections.
+    """
+
+    def __init__(
+        self,
+        repo: "CLinuxKernelRepo",
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    ):
+        if max_in_flight < 1:
+            raise ValueError(f"max_in_flight must be at least 1, not {max_in_flight}")
+        self.repo = repo
+        self.max_in_flight = max_in_flight
+        repo.resize_pool(max_in_flight)
+        # Per batch, the requests in flight and the tag dates being probed.
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.pending_probes: Dict[int, "asyncio.Future[ProbeRecord]"] = {}
+        # Full SHA and date of each commit of the last batch.
+        self.details: Dict[str, Tuple[str, datetime]] = {}
+
+    async def _call(self, function: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def _load_tags(self) -> Tuple["Tags", int]:
+        repo = self.repo
+        if repo.tags is not None:
+            return repo.tags
+        tags, num_tags = await self._call(repo._load_tags)
+        if isinstance(tags, CTagPages) and tags.num_pages is not None:
+            # The first and the last pages are known, the ones between are fetched at once.
+            missing = [page for page in range(1, tags.num_pages + 1) if page not in tags.pages]
+            fetched = await asyncio.gather(
+                *(self._call(tags._request_page, page) for page in missing)
+            )
+            pages = {**tags.pages, **dict(zip(missing, fetched))}
+            listing = [tag for page in sorted(pages) for tag in pages[page]]
+            repo.swap_tags((listing, len(listing)))
+            return (listing, len(listing))
+        return (tags, num_tags)
+
+    async def _fetch_probe(self, tags: "Tags", tag_idx: int) -> ProbeRecord:
+        tag = tags[tag_idx]
+        if isinstance(tag, TagEntry) and tag.date is None:
+            tag_dt = (await self._call(self.repo.fetch_commit, tag.sha))[1]
+            tags[tag_idx] = tag._replace(date=tag_dt)  # type: ignore[index]
+            if self.repo.tag_index is not None:
+                self.repo.tag_index.set_date(tag.name, tag_dt)
+        else:
+            # Already dated, no request.
+            tag_dt = self.repo._get_tag_date(tags, tag_idx)
+        record = (to_epoch(tag_dt), tag.name)
+        self.repo.probes.records[tag_idx] = record
+        return record
+
+    async def _probe(self, tags: "Tags", tag_idx: int) -> ProbeRecord:
+        record = self.repo.probes.records.get(tag_idx)
+        pending = self.pending_probes.get(tag_idx)
+        # A probe another search is waiting for is a hit too.
+        self.repo.probes.count(record is not None or pending is not None)
+        if record is not None:
+            return record
+        if pending is None:
+            pending = asyncio.ensure_future(self._fetch_probe(tags, tag_idx))
+            self.pending_probes[tag_idx] = pending
+        return await pending
+
+    async def _resolve(
+        self,
+        commit: str,
+        loading: "asyncio.Future[Tuple[Tags, int]]",
+        prefetching: "asyncio.Future[None]",
+    ) -> str:
+        repo = self.repo
+        repo.stats.count("lookups")
+        await prefetching
+        cached = repo.take_prefetched(commit)
+        if cached is None and repo.commit_cache is not None:
+            cached = repo.commit_cache.get(commit)
+            if cached is not None:
+                repo.stats.count("commit_cache_hits")
+        if cached is not None:
+            sha, commit_date = cached
+        else:
+            with repo.stats.phase("commit_fetch"):
+                sha, commit_date = await self._call(self.repo.fetch_commit, commit)
+            if repo.commit_cache is not None:
+                repo.commit_cache.put(sha, commit_date)
+        self.details[commit] = (sha, commit_date)
+
+        tags, num_tags = await loading
+        if not tags:
+            logger.error("Failed to query tags")
+            return "Unknown"
+        commit_ts = to_epoch(commit_date)
+        if repo.timeline is not None:
+            with repo.stats.phase("timeline_lookup"):
+                return repo.timeline.lookup(commit_ts)
+        search = repo.search_tags(tags, num_tags, commit_ts)
+        try:
+            tag_idx = next(search)
+            while True:
+                tag_idx = search.send(await self._probe(tags, tag_idx))
+        except StopIteration as stop:
+            return stop.value
+
+    async def _resolve_many(
+        self, commits: Sequence[str], return_exceptions: bool = False
+    ) -> List[Union[str, BaseException]]:
+        self.pending_probes = {}
+        with ThreadPoolExecutor(self.max_in_flight) as self.executor:
+            loading = asyncio.ensure_future(self._load_tags())
+            # With a token, the commits are fetched 100 a GraphQL query while the tags load.
+            prefetching = asyncio.ensure_future(self._call(self.repo.prefetch_commits, commits))
+            return await asyncio.gather(
+                *(self._resolve(commit, loading, prefetching) for commit in commits),
+                return_exceptions=return_exceptions,
+            )
+
+    def resolve_many(self, commits: Sequence[str]) -> List[Tuple[str, str]]:
+        """
+        (commit, tag) for each commit, in the order given.
+        """
+        repo = self.repo
+        self.details = {}
+        if not commits:
+            return []
+        if repo.local_repo is not None or repo.snapshot is not None:
+            # No Github round trips to overlap.
+            return list(repo.get_tags_for_commits(commits))
+        return list(zip(commits, cast(List[str], asyncio.run(self._resolve_many(commits)))))
+
+    def resolve_each(self, commits: Sequence[str]) -> List[Tuple[str, Union[str, CResolveError]]]:
+        """
+        (commit, tag) for each commit, in the order given, the error in place of the tag of a
+        commit whose lookup failed.
+        """
+        repo = self.repo
+        self.details = {}
+        if not commits:
+            return []
+        if repo.local_repo is not None or repo.snapshot is not None:
+            return list(repo.resolve_each(commits))
+        results = []
+        for commit, result in zip(commits, asyncio.run(self._resolve_many(commits, True))):
+            if isinstance(result, LOOKUP_ERRORS):
+                result = to_resolve_error(result, commit)
+            elif isinstance(result, BaseException):
+                raise result
+            results.append((commit, result))
+        return results
+
+    def get_tag(self, commit: str) -> str:
+        return self.resolve_many([commit])[0][1]
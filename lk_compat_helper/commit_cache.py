@@ -0,0 +1,138 @@
+import os
+import re
+import sqlite3
+import time
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Callable, ContextManager, Dict, Iterable, Optional, Tuple
+
+from lk_compat_helper.file_lock import CKeyLocks
+from lk_compat_helper.tag_index import BUSY_TIMEOUT, from_epoch, to_epoch
+
+# Fix commits are looked up again and again, a hundred thousand of them take a few MiB.
+DEFAULT_MAX_ENTRIES = 100000
+# git's default abbreviation, shorter prefixes may well be ambiguous on Github.
+MIN_PREFIX = 7
+# Reads whose recency is written in one transaction.
+USE_BATCH = 100
+# A full cache is trimmed by a tenth of max_entries at once, rather than by an entry an insert.
+TRIM_FRACTION = 10
+HEX = re.compile(r"[0-9a-f]+")
+
+
+class CCommitCache:
+    """
+    Persistent committer dates by full SHA, abbreviated SHAs resolve locally if unique in it.
+
+    Commit dates never change, entries are only evicted, least recently used first, once there
+    are more than max_entries. The reads are recorded USE_BATCH at a time, and on close.
+
+    With a lock directory, the processes sharing the cache fetch a missing commit once, the
+    others wait for it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        clock: Callable[[], float] = time.time,
+        lock_dir: Optional[str] = None,
+    ):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.locks = CKeyLocks(lock_dir) if lock_dir else None
+        self.max_entries = max_entries
+        self.clock = clock
+        # Not thread safe, a CResolver's threads take its lock around each call.
+        self.db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        # The runs sharing the cache read while another one writes.
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS commits (
+                sha TEXT PRIMARY KEY,
+                date INTEGER NOT NULL,
+                used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS commits_used ON commits (used);
+            """)
+        # When each SHA read since the last flush was read.
+        self.uses: Dict[str, float] = {}
+        # As of the last count plus those put since, the entries the other processes sharing the
+        # cache add are only seen by the next count.
+        self.num_entries = len(self)
+
+    def close(self) -> None:
+        self.flush()
+        self.db.close()
+
+    def flush(self) -> None:
+        """
+        Write when the entries read since the last flush were used, for the evictions.
+        """
+        uses, self.uses = self.uses, {}
+        if uses:
+            with self.db:
+                self.db.executemany(
+                    "UPDATE commits SET used = ? WHERE sha = ?",
+                    [(used, sha) for sha, used in uses.items()],
+                )
+
+    def lock_many(self, commits: Iterable[str]) -> ContextManager[None]:
+        return self.locks.lock_many(commits) if self.locks is not None else nullcontext()
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM commits").fetchone()[0]
+
+    def get(self, commit: str) -> Optional[Tuple[str, datetime]]:
+        """
+        Full SHA and committer date of the commit, None if not cached or ambiguous.
+        """
+        commit = commit.lower()
+        if len(commit) < MIN_PREFIX or len(commit) > 40 or not HEX.fullmatch(commit):
+            return None
+        # Hex digits sort below "g", the range is every SHA starting with the prefix.
+        rows = self.db.execute(
+            "SELECT sha, date FROM commits WHERE sha >= ? AND sha < ? LIMIT 2",
+            (commit, commit + "g"),
+        ).fetchall()
+        if len(rows) != 1:
+            return None
+        sha, date = rows[0]
+        self.uses[sha] = self.clock()
+        if len(self.uses) >= USE_BATCH:
+            self.flush()
+        return (sha, from_epoch(date))
+
+    def put(self, sha: str, date: datetime) -> None:
+        sha = sha.lower()
+        self.uses.pop(sha, None)
+        values = (to_epoch(date), self.clock(), sha)
+        with self.db:
+            added = self.db.execute(
+                "INSERT OR IGNORE INTO commits (date, used, sha) VALUES (?, ?, ?)", values
+            ).rowcount
+            if not added:
+                self.db.execute("UPDATE commits SET date = ?, used = ? WHERE sha = ?", values)
+        self.num_entries += added
+        if self.num_entries > self.max_entries:
+            self.trim()
+
+    def trim(self) -> None:
+        """
+        Evict the least recently used entries, down to max_entries - max_entries // TRIM_FRACTION.
+        """
+        self.flush()
+        with self.db:
+            excess = len(self) - (self.max_entries - self.max_entries // TRIM_FRACTION)
+            if excess > 0:
+                self.db.execute(
+                    "DELETE FROM commits WHERE sha IN "
+                    "(SELECT sha FROM commits ORDER BY used LIMIT ?)",
+                    (excess,),
+                )
+        self.num_entries = len(self)
+
+    def dates(self) -> Dict[str, datetime]:
+        return {
+            sha: from_epoch(date) for sha, date in self.db.execute("SELECT sha, date FROM commits")
+        }
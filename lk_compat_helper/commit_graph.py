@@ -0,0 +1,218 @@
+import mmap
+import os
+import struct
+import subprocess
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+SIGNATURE = b"CGPH"
+HASH_LENGTHS = {1: 20, 2: 32}
+CHUNK_OIDF = b"OIDF"
+CHUNK_OIDL = b"OIDL"
+CHUNK_CDAT = b"CDAT"
+CHUNK_EDGE = b"EDGE"
+PARENT_NONE = 0x70000000
+PARENT_EXTRA = 0x80000000
+GENERATION_NUMBER_ZERO = 0
+
+
+class CCommitGraph:
+    """
+    Reader for git's commit-graph file (objects/info/commit-graph), mmap'ed, no git process.
+
+    See Documentation/gitformat-commit-graph.txt in git for the format.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as graph_file:
+            self.data = mmap.mmap(graph_file.fileno(), 0, access=mmap.ACCESS_READ)
+        signature, version, hash_version, num_chunks, num_bases = struct.unpack_from(
+            ">4sBBBB", self.data, 0
+        )
+        if signature != SIGNATURE or version != 1 or hash_version not in HASH_LENGTHS:
+            raise ValueError(f"{path}: unsupported commit-graph")
+        if num_bases:
+            raise ValueError(f"{path}: split commit-graphs are not supported")
+        self.hash_len = HASH_LENGTHS[hash_version]
+
+        chunks: Dict[bytes, int] = {}
+        for chunk_idx in range(num_chunks):
+            chunk_id, offset = struct.unpack_from(">4sQ", self.data, 8 + chunk_idx * 12)
+            chunks[chunk_id] = offset
+        for chunk_id in (CHUNK_OIDF, CHUNK_OIDL, CHUNK_CDAT):
+            if chunk_id not in chunks:
+                raise ValueError(f"{path}: {chunk_id.decode()} chunk is missing")
+        self.fanout = chunks[CHUNK_OIDF]
+        self.oids = chunks[CHUNK_OIDL]
+        self.commit_data = chunks[CHUNK_CDAT]
+        self.extra_edges = chunks.get(CHUNK_EDGE)
+        self.num_commits = struct.unpack_from(">I", self.data, self.fanout + 255 * 4)[0]
+        self.cdat_len = self.hash_len + 16
+
+    def close(self) -> None:
+        self.data.close()
+
+    def _fanout(self, first_byte: int) -> int:
+        if first_byte < 0:
+            return 0
+        return struct.unpack_from(">I", self.data, self.fanout + first_byte * 4)[0]
+
+    def _oid_bytes(self, pos: int) -> bytes:
+        start = self.oids + pos * self.hash_len
+        return self.data[start : start + self.hash_len]
+
+    def oid(self, pos: int) -> str:
+        return self._oid_bytes(pos).hex()
+
+    def lookup(self, commit: str) -> Optional[int]:
+        """
+        Position of the commit in the graph, abbreviated SHAs are accepted if unique.
+        """
+        if len(commit) < 2 or len(commit) > self.hash_len * 2:
+            return None
+        try:
+            # The smallest OID starting with an odd length prefix is the prefix and a 0.
+            prefix = bytes.fromhex(commit if len(commit) % 2 == 0 else commit + "0")
+        except ValueError:
+            return None
+        # First position with an OID >= prefix, within the range of the first byte.
+        low, high = self._fanout(prefix[0] - 1), self._fanout(prefix[0])
+        while low < high:
+            mid = (low + high) // 2
+            if self._oid_bytes(mid) < prefix:
+                low = mid + 1
+            else:
+                high = mid
+        matches = [
+            pos
+            for pos in range(low, min(low + 2, self.num_commits))
+            if self.oid(pos).startswith(commit.lower())
+        ]
+        return matches[0] if len(matches) == 1 else None
+
+    def _generation_and_time(self, pos: int) -> int:
+        # Topological level in the top 30 bits, commit time in the other 34 bits.
+        offset = self.commit_data + pos * self.cdat_len + self.hash_len + 8
+        return struct.unpack_from(">Q", self.data, offset)[0]
+
+    def generation(self, pos: int) -> int:
+        return self._generation_and_time(pos) >> 34
+
+    def commit_time(self, pos: int) -> int:
+        return self._generation_and_time(pos) & 0x3FFFFFFFF
+
+    def parents(self, pos: int) -> List[int]:
+        parent1, parent2 = struct.unpack_from(
+            ">II", self.data, self.commit_data + pos * self.cdat_len + self.hash_len
+        )
+        parents = []
+        if parent1 != PARENT_NONE:
+            parents.append(parent1)
+        if parent2 == PARENT_NONE:
+            return parents
+        if not parent2 & PARENT_EXTRA:
+            parents.append(parent2)
+            return parents
+        # Octopus merge, the rest of the parents are in the extra edge list.
+        assert self.extra_edges is not None
+        edge_idx = parent2 & ~PARENT_EXTRA
+        while True:
+            (edge,) = struct.unpack_from(">I", self.data, self.extra_edges + edge_idx * 4)
+            parents.append(edge & ~PARENT_EXTRA)
+            if edge & PARENT_EXTRA:
+                return parents
+            edge_idx += 1
+
+
+class TagTip(NamedTuple):
+    name: str
+    sha: str
+    rc: bool
+
+
+class CCommitGraphResolver:
+    """
+    First release tag containing a commit, from the commit-graph and a table of tag tips.
+
+    The tags are walked oldest first, pruning the commits with a generation number not above the
+    commit's one (they cannot reach it) and the commits already walked for an older tag.
+    """
+
+    def __init__(self, graph: CCommitGraph, tag_tips: List[TagTip]):
+        self.graph = graph
+        positions = [(tag, graph.lookup(tag.sha)) for tag in tag_tips]
+        # Oldest first, a tag missing in the graph is newer than the graph.
+        self.tags: List[Tuple[TagTip, Optional[int]]] = sorted(
+            positions,
+            key=lambda item: graph.commit_time(item[1]) if item[1] is not None else 1 << 34,
+        )
+
+    @classmethod
+    def open(cls, git_dir: str) -> Optional["CCommitGraphResolver"]:
+        path = os.path.join(git_dir, "objects", "info", "commit-graph")
+        if not os.path.exists(path):
+            return None
+        try:
+            graph = CCommitGraph(path)
+        except ValueError:
+            return None
+        return cls(graph, cls.read_tag_tips(git_dir))
+
+    @staticmethod
+    def read_tag_tips(git_dir: str) -> List[TagTip]:
+        refs = subprocess.run(
+            [
+                "git",
+                "--git-dir",
+                git_dir,
+                "for-each-ref",
+                "--format=%(refname:short) %(objectname) %(*objectname)",
+                "refs/tags/v*",
+            ],
+            check=True,
+            stdout=subprocess.PIPE,
+            encoding="UTF-8",
+        ).stdout
+        tag_tips = []
+        for line in refs.splitlines():
+            # Annotated tags are peeled to the commit, lightweight ones point to it.
+            name, sha, *peeled = line.split()
+            tag_tips.append(TagTip(name, peeled[0] if peeled else sha, "-rc" in name))
+        return tag_tips
+
+    def _contains(self, tip: int, pos: int, generation: int, walked: bytearray) -> bool:
+        stack = [tip]
+        while stack:
+            node = stack.pop()
+            if walked[node]:
+                continue
+            walked[node] = 1
+            if node == pos:
+                return True
+            if self.graph.generation(node) <= generation:
+                continue
+            stack.extend(self.graph.parents(node))
+        return False
+
+    def get_tag(self, commit: str) -> Optional[str]:
+        """
+        Earliest release with the commit, None if the graph cannot answer it.
+        """
+        pos = self.graph.lookup(commit)
+        if pos is None:
+            return None
+        generation = self.graph.generation(pos)
+        if generation == GENERATION_NUMBER_ZERO:
+            return None
+        walked = bytearray(self.graph.num_commits)
+        in_rc = False
+        for tag, tip in self.tags:
+            if tip is None:
+                return None
+            if self._contains(tip, pos, generation, walked):
+                if not tag.rc:
+                    return tag.name
+                in_rc = True
+                # The walk stopped at the commit, the walked commits may reach it after all.
+                walked = bytearray(self.graph.num_commits)
+        # Only in RCs so far, there is no release yet.
+        return "Unknown" if in_rc else "Unmerged"
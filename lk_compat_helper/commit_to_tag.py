@@ -1,53 +1,387 @@
 #!/usr/bin/env python3
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import itertools
+import json
 import logging
 import os
+import signal
 import sys
-from typing import Optional, Tuple
+import time
+from typing import (
+    Any,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+)
 
 import github
 from github import Github, GithubException  # type: ignore
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s: %(message)s")
+from lk_compat_helper.async_resolver import CAsyncResolver
+from lk_compat_helper.commit_cache import CCommitCache
+from lk_compat_helper.daemon import (
+    DEFAULT_REFRESH_INTERVAL,
+    CDaemonClient,
+    CResolverServer,
+    default_socket_path,
+)
+from lk_compat_helper.errors import (
+    LOOKUP_ERRORS,
+    CResolveError,
+    error_message,
+    github_json,
+    to_resolve_error,
+)
+from lk_compat_helper.graphql import COMMITS_PER_QUERY, CGraphQLClient, graphql_url, parse_date
+from lk_compat_helper.local_git import CLocalGitRepo
+from lk_compat_helper.rate_limit import DEFAULT_RATE, GRAPHQL, CRateLimiter, parse_tokens
+from lk_compat_helper.snapshot import (
+    CSnapshot,
+    cached_commit_dates,
+    default_snapshot_path,
+    import_snapshot,
+    write_snapshot,
+)
+from lk_compat_helper.stable import CStableRepo, parse_series
+from lk_compat_helper.stats import CStats
+from lk_compat_helper.tag_index import (
+    DEFAULT_MAX_AGE,
+    CTagIndex,
+    TagEntry,
+    default_cache_dir,
+    from_epoch,
+    to_epoch,
+)
+from lk_compat_helper.tag_pages import API_URL, CTagPages
+from lk_compat_helper.tag_probes import CTagProbes, ProbeRecord
+from lk_compat_helper.tag_timeline import CTagTimeline
+from lk_compat_helper.tag_version import is_rc, sort_by_version
+from lk_compat_helper.transport import (
+    CCassette,
+    CGithubAdapter,
+    CResponseCache,
+    new_session,
+    route_pygithub,
+)
+
 logger = logging.getLogger("__main__")
 
+LINUX_REPO = "torvalds/linux"
+BACKENDS = ("rest", "graphql")
+TAG_ORDERS = ("listing", "version")
+# The resolver daemon answers with its own, lookups given other ones are made in the process.
+RESOLVER_OPTIONS = ("api_token", "backend", "tag_order", "api_url", "git_dir", "no_cache")
+
+
+Tags = Union[Sequence[github.Tag.Tag], List[TagEntry], CTagPages]
+
+
+def _cache_file(repo_name: str, name: str) -> str:
+    # torvalds/linux keeps the file names it always had.
+    if repo_name == LINUX_REPO:
+        return f"{name}.sqlite"
+    return f"{name}-{repo_name.replace('/', '-')}.sqlite"
+
+
+def load_snapshot(path: str) -> CSnapshot:
+    """
+    Map the snapshot at path, raises OSError or ValueError if it cannot be read.
+    """
+    start = time.perf_counter()
+    snapshot = CSnapshot(path)
+    logger.debug(f"Snapshot loaded in {(time.perf_counter() - start) * 1000:.2f}ms")
+    return snapshot
+
 
 class CLinuxKernelRepo:
-    def __init__(self, token: str, commit: str):
-        self.handle = Github(token)
+    def __init__(
+        self,
+        token: Optional[str],
+        commit: str,
+        cache_dir: Optional[str] = None,
+        index_max_age: int = DEFAULT_MAX_AGE,
+        backend: str = "rest",
+        api_url: str = API_URL,
+        git_dir: Optional[str] = None,
+        request_rate: float = DEFAULT_RATE,
+        tag_order: str = "listing",
+        snapshot: Union[str, CSnapshot, None] = None,
+        cassette: Optional[CCassette] = None,
+        repo_name: str = LINUX_REPO,
+        shared_with: Optional["CLinuxKernelRepo"] = None,
+    ):
+        if cassette is not None:
+            # Recordings need every lookup to make its requests, replays leave the caches alone.
+            cache_dir = None
+        # Comma separated tokens are pooled, the rate limiter picks one for each request.
+        tokens = parse_tokens(token)
+        token = tokens[0] if tokens else None
+        self.repo_name = repo_name
+        if shared_with is None:
+            self.rate_limiter = CRateLimiter(tokens, request_rate)
+            # Requests, cache hits and time per phase of the lookups, for --stats.
+            self.stats = CStats()
+            # One session for the REST, GraphQL and PyGithub traffic, sharing the transport.
+            self.http_cache = None
+            if cache_dir:
+                # Shared by the runs on the host, one of them sends a missing request.
+                self.http_cache = CResponseCache(
+                    os.path.join(cache_dir, "http"), os.path.join(cache_dir, "locks")
+                )
+            self.adapter = CGithubAdapter(self.http_cache, self.rate_limiter, self.stats, cassette)
+            self.session = new_session(self.adapter)
+        else:
+            # Trees resolved together share the rate limits, the caches and the connection pool.
+            self.rate_limiter = shared_with.rate_limiter
+            self.stats = shared_with.stats
+            self.http_cache = shared_with.http_cache
+            self.adapter = shared_with.adapter
+            self.session = shared_with.session
+        self.token = token
+        self.api_url = api_url
+        self.handle = Github(token, base_url=api_url)
+        route_pygithub(self.handle, self.session)
         self.commit = commit
         self.commit_date: Optional[datetime] = None
-        self.linux_kernel_repo = self.handle.get_repo("torvalds/linux")
+        # Full SHA, known once the commit is fetched or found in the commit cache.
+        self.commit_sha: Optional[str] = None
+        # Whether the last lookup answered "Unknown" for want of the tags or of the commit, rather
+        # than for a commit only in RCs so far.
+        self.lookup_failed = False
+        # Lazy, a warm lookup from the tag index should only cost the commit fetch.
+        self.linux_kernel_repo = self.handle.get_repo(repo_name, lazy=True)
+        self.tag_pages = CTagPages(token, repo_name, api_url, self.session)
+        # GraphQL gets the tag dates along with the listing, 100 tags a request.
+        self.graphql: Optional[CGraphQLClient] = None
+        if backend == "graphql":
+            self.graphql = CGraphQLClient(token, graphql_url(api_url), self.session)
+        self.tag_order = tag_order
+        self.tags: Optional[Tuple[Tags, int]] = None
+        # With every tag date known, lookups need no probes at all.
+        self.timeline: Optional[CTagTimeline] = None
+        self.probes = CTagProbes(self._get_tag_date, self.stats)
+        self.tag_index: Optional[CTagIndex] = None
+        # Backports to the stable series, their tags are only listed through GraphQL.
+        self.stable = CStableRepo(
+            CGraphQLClient(token, graphql_url(api_url), self.session),
+            token,
+            api_url,
+            self.session,
+            cache_dir,
+            index_max_age,
+        )
+        # Commit dates of a batch 100 commits a query, GraphQL takes no anonymous requests.
+        self.commit_graphql: Optional[CGraphQLClient] = None
+        if token:
+            self.commit_graphql = CGraphQLClient(token, graphql_url(api_url), self.session)
+        # Fetched ahead by prefetch_commits, None for the commits the tree does not have.
+        self.prefetched: Dict[str, Optional[Tuple[str, datetime]]] = {}
+        # Commit dates never change, a commit looked up before costs no request.
+        self.commit_cache: Optional[CCommitCache] = None
+        if cache_dir:
+            self.tag_index = CTagIndex(
+                os.path.join(cache_dir, _cache_file(repo_name, "tags")), index_max_age
+            )
+            # Per tree, finding the commit is what tells it has landed there.
+            self.commit_cache = CCommitCache(
+                os.path.join(cache_dir, _cache_file(repo_name, "commits")),
+                lock_dir=os.path.join(cache_dir, "locks"),
+            )
+        # A local linux.git answers exactly and without any API request.
+        self.local_repo: Optional[CLocalGitRepo] = None
+        if git_dir:
+            if CLocalGitRepo.is_git_dir(git_dir):
+                self.local_repo = CLocalGitRepo(git_dir)
+            else:
+                logger.warning(f"{git_dir} is not a git repository, using Github")
+        # Offline, the snapshot answers instead of Github, given by its path or loaded already.
+        self.snapshot: Optional[CSnapshot] = None
+        if isinstance(snapshot, CSnapshot):
+            self.snapshot = snapshot
+        elif snapshot:
+            self.snapshot = load_snapshot(snapshot)
+
+    def _list_tags(self, tag_pages: Optional[CTagPages] = None) -> Iterator[TagEntry]:
+        if self.graphql is not None:
+            return self.graphql.iter_tags(self.repo_name)
+        return iter(self.tag_pages if tag_pages is None else tag_pages)
+
+    def _get_indexed_tags(
+        self, tag_index: CTagIndex, tag_pages: Optional[CTagPages] = None, sync: bool = False
+    ) -> Tuple[List[TagEntry], int]:
+        if sync or not tag_index.is_fresh():
+            # The listing is lazy, nothing is requested if another process synced meanwhile.
+            num_new_tags = tag_index.sync(self._list_tags(tag_pages), force=sync)
+            logger.debug(f"Tag index synced, {num_new_tags} new tags")
+        tags = tag_index.get_tags()
+        return (tags, len(tags))
+
+    def _get_tags(
+        self,
+        tag_pages: Optional[CTagPages] = None,
+        tag_index: Optional[CTagIndex] = None,
+        sync: bool = False,
+    ) -> Tuple[Tags, int]:
+        tag_pages = self.tag_pages if tag_pages is None else tag_pages
+        tag_index = self.tag_index if tag_index is None else tag_index
+        tags: List[TagEntry]
+        if tag_index is not None:
+            tags = self._get_indexed_tags(tag_index, tag_pages, sync)[0]
+        elif self.graphql is not None:
+            tags = list(self._list_tags())
+        elif self.tag_order == "listing":
+            # Only the first and the last page, the probes fetch the pages they land on.
+            return (tag_pages, len(tag_pages))
+        else:
+            # Every page but only for the names, the dates are fetched as the probes need them.
+            tags = list(tag_pages)
+        if self.tag_order == "version":
+            tags = sort_by_version(tags)
+        return (tags, len(tags))
+
+    def _load_tags(self) -> Tuple[Tags, int]:
+        # Fetched once per instance, a batch resolves every commit against the same tags.
+        if self.tags is None:
+            with self.stats.phase("tag_listing"):
+                self.swap_tags(self._get_tags())
+        assert self.tags is not None
+        return self.tags
+
+    def fetch_tags(self) -> Tuple[Tags, int]:
+        """
+        The tags as Github has them now, leaving the ones in use alone. With a tag index, only
+        the tags made since its last sync are listed, whatever its age, usually in one request.
 
-    def _get_tags(self) -> Tuple[github.PaginatedList.PaginatedList, int]:  # pragma: no cover
-        tags = self.linux_kernel_repo.get_tags()
-        # totalCount: is a time consuming operation as it is a PaginatedList
-        # and the property involves looping through pages.
-        return (tags, tags.totalCount)
+        Safe to call while lookups go on, the index is synced over a connection of its own.
+        swap_tags puts the tags in use.
+        """
+        tag_pages = CTagPages(self.token, self.repo_name, self.api_url, self.session)
+        with self.stats.phase("tag_listing"):
+            if self.tag_index is None:
+                return self._get_tags(tag_pages)
+            tag_index = CTagIndex(self.tag_index.path, self.tag_index.max_age)
+            try:
+                return self._get_tags(tag_pages, tag_index, sync=True)
+            finally:
+                tag_index.close()
+
+    def swap_tags(self, tags: Tuple[Tags, int]) -> None:
+        """
+        Put the tags fetch_tags returned in use, the timeline is built before the swap.
+        """
+        listing = tags[0]
+        # Not CTagPages, building it would list every page.
+        timeline = CTagTimeline.from_tags(listing) if isinstance(listing, list) else None
+        if isinstance(listing, CTagPages):
+            self.tag_pages = listing
+        self.tags, self.timeline = tags, timeline
+        self.probes.reset()
+
+    def refresh_tags(self) -> None:
+        """
+        Load the tags again, picking up the releases made since, for long running resolvers.
+        """
+        self.swap_tags(self.fetch_tags())
+
+    def update_index(self) -> int:
+        """
+        Add the tags made since the last sync to the tag index, whatever its age, returns how
+        many. The listing stops at the first known tag, a refresh is usually one request.
+        """
+        if self.tag_index is None:
+            raise ValueError("the tag index needs a cache directory")
+        with self.stats.phase("tag_listing"):
+            return self.tag_index.sync(self._list_tags())
+
+    def resize_pool(self, size: int) -> None:
+        """
+        Keep up to size connections to Github alive, for as many requests at once.
+        """
+        adapter = self.session.get_adapter(self.api_url)
+        if isinstance(adapter, CGithubAdapter):
+            adapter.resize_pool(size)
+
+    def fetch_commit(self, commit: str, timeout: int = 15) -> Tuple[str, datetime]:
+        """
+        Full SHA and committer date of the commit, straight from the REST API.
+
+        Unlike PyGithub's requester, safe to call from several threads at once.
+        """
+        response = self.session.get(
+            f"{self.api_url}/repos/{self.repo_name}/commits/{commit}",
+            headers={"Authorization": f"token {self.token}"} if self.token else {},
+            timeout=timeout,
+        )
+        details = github_json(response)
+        return (details["sha"], parse_date(details["commit"]["committer"]["date"]))
 
     def _get_commit(self) -> github.Commit.Commit:  # pragma: no cover
         return self.linux_kernel_repo.get_commit(sha=self.commit)
 
+    def _get_tag_commit_date(self, sha: str) -> datetime:  # pragma: no cover
+        return self.linux_kernel_repo.get_commit(sha=sha).commit.committer.date
+
+    def _get_tag_date(self, tags: Tags, tag_idx: int) -> datetime:
+        tag = tags[tag_idx]
+        if not isinstance(tag, TagEntry):
+            return tag.commit.commit.committer.date
+        if tag.date is not None:
+            return tag.date
+        tag_dt = self._get_tag_commit_date(tag.sha)
+        cast(Union[List[TagEntry], CTagPages], tags)[tag_idx] = tag._replace(date=tag_dt)
+        if self.tag_index is not None:
+            self.tag_index.set_date(tag.name, tag_dt)
+        return tag_dt
+
     def _get_tag(self) -> str:
         """
         Binary search the tags based on tag date and commit date, exclude release candidates (RCs).
         """
-        tags, num_tags = self._get_tags()
+        tags, num_tags = self._load_tags()
         if not tags:
             logger.error("Failed to query tags")
+            self.lookup_failed = True
             return "Unknown"
+        # Set by get_commit_details, which raises rather than leave it unknown.
+        assert self.commit_date is not None
+        commit_ts = to_epoch(self.commit_date)
+        if self.timeline is not None:
+            with self.stats.phase("timeline_lookup"):
+                return self.timeline.lookup(commit_ts)
 
+        search = self.search_tags(tags, num_tags, commit_ts)
+        try:
+            tag_idx = next(search)
+            while True:
+                tag_idx = search.send(self.probes.get(tags, tag_idx))
+        except StopIteration as stop:
+            return stop.value
+
+    def search_tags(
+        self, tags: Tags, num_tags: int, commit_ts: int
+    ) -> Generator[int, ProbeRecord, str]:
+        """
+        The search of _get_tag, yields the index of each tag it probes and is sent back the tag's
+        (date, name), returns the tag found. Lets the probes be fetched synchronously or not.
+        """
         start_tag_idx = 0
         end_tag_idx = num_tags
         tag_idx = (start_tag_idx + end_tag_idx) // 2
-        while tag_idx and end_tag_idx - start_tag_idx != 1:
-            tag = tags[tag_idx]
-            tag_dt = tag.commit.commit.committer.date
-            tag_dts_s = tag_dt.strftime("%y-%d-%mT%H:%M:%SZ")
-            logger.debug(f"Checking {tag_idx}: {tag.name}, {tag.commit.commit.sha}, {tag_dts_s}")
-            if self.commit_date:
-                if tag_dt >= self.commit_date:
+        with self.stats.phase("binary_search"):
+            while tag_idx and end_tag_idx - start_tag_idx != 1:
+                tag_ts, tag_name = yield tag_idx
+                tag_dts_s = from_epoch(tag_ts).strftime("%y-%d-%mT%H:%M:%SZ")
+                logger.debug(f"Checking {tag_idx}: {tag_name}, {tag_dts_s}")
+                if tag_ts >= commit_ts:
                     start_tag_idx = tag_idx
                     tag_idx = (start_tag_idx + end_tag_idx) // 2
                 else:
@@ -55,40 +389,282 @@ class CLinuxKernelRepo:
                     tag_idx = (start_tag_idx + end_tag_idx) // 2
 
         found = False
-        for tag_idx in range(start_tag_idx, end_tag_idx):
-            tag = tags[tag_idx]
-            tag_dt = tag.commit.commit.committer.date
-            if tag_dt >= self.commit_date:
-                found = True
-                break
+        with self.stats.phase("linear_scan"):
+            for tag_idx in range(start_tag_idx, end_tag_idx):
+                tag_ts, tag_name = yield tag_idx
+                if tag_ts >= commit_ts:
+                    found = True
+                    break
 
         # Skip RCs and Fetch the release
-        while "rc" in tags[tag_idx].name:
-            tag_idx -= 1
-            if tag_idx < 0:
-                return "Unknown"
+        with self.stats.phase("rc_walk"):
+            while is_rc(tag_name):
+                tag_idx -= 1
+                if tag_idx < 0:
+                    return "Unknown"
+                tag_name = tags[tag_idx].name
 
-        if not found and tag_idx == start_tag_idx and tag_dt < self.commit_date:
+        if not found and tag_idx == start_tag_idx and tag_ts < commit_ts:
             return "Unmerged"
 
-        return tags[tag_idx].name
+        return tag_name
+
+    def prefetch_commits(self, commits: Iterable[str]) -> None:
+        """
+        Fetch the SHAs and dates of a batch of commits for the lookups to come, COMMITS_PER_QUERY
+        commits a GraphQL query rather than a request each. Needs a token, does nothing without.
+        """
+        if self.commit_graphql is None:
+            return
+        missing = self._missing_commits(commits)
+        commit_cache = self.commit_cache
+        if commit_cache is None:
+            self._prefetch_commits(missing)
+            return
+        for start in range(0, len(missing), COMMITS_PER_QUERY):
+            chunk = missing[start : start + COMMITS_PER_QUERY]
+            # The runs sharing the cache query a commit once, the others find it cached.
+            self.adapter.send_locked(
+                GRAPHQL,
+                lambda: commit_cache.lock_many(chunk),
+                lambda: self._prefetch_commits(self._missing_commits(chunk)),
+            )
+
+    def _missing_commits(self, commits: Iterable[str]) -> List[str]:
+        return [
+            commit
+            for commit in dict.fromkeys(commits)
+            if commit not in self.prefetched
+            and (self.commit_cache is None or self.commit_cache.get(commit) is None)
+        ]
+
+    def _prefetch_commits(self, missing: List[str]) -> None:
+        assert self.commit_graphql is not None
+        if not missing:
+            return
+        with self.stats.phase("commit_fetch"):
+            found = self.commit_graphql.get_commits(self.repo_name, missing)
+        for commit, details in found.items():
+            self.prefetched[commit] = details
+            if details is not None and self.commit_cache is not None:
+                self.commit_cache.put(*details)
+
+    def take_prefetched(self, commit: str) -> Optional[Tuple[str, datetime]]:
+        """
+        SHA and date of the commit if prefetched, each is only taken once. Raises Github's 422
+        for a commit the tree does not have.
+        """
+        if commit not in self.prefetched:
+            return None
+        details = self.prefetched.pop(commit)
+        if details is None:
+            raise GithubException(422, {"message": f"No commit found for SHA: {commit}"}, None)
+        return details
 
     def get_commit_details(self) -> None:
-        commit_details = self._get_commit()
+        prefetched = self.take_prefetched(self.commit)
+        if prefetched is not None:
+            self.commit_sha, self.commit_date = prefetched
+            logger.debug(f"Commit Date is {self.commit_date}, prefetched")
+            return
+        if self.commit_cache is not None:
+            cached = self.commit_cache.get(self.commit)
+            if cached is not None:
+                self.stats.count("commit_cache_hits")
+                self.commit_sha, self.commit_date = cached
+                logger.debug(f"Commit Date is {self.commit_date}, cached")
+                return
+        with self.stats.phase("commit_fetch"):
+            commit_details = self._get_commit()
+        self.commit_sha = commit_details.sha
         self.commit_date = commit_details.commit.committer.date
         logger.debug(f"Commit Date is {self.commit_date}")
         if self.commit_date is None:
-            logger.error("Failed to query commit date, quit")
-            sys.exit(1)
+            raise CResolveError(f"Failed to query the commit date of {self.commit}", self.commit)
+        if self.commit_cache is not None:
+            self.commit_cache.put(commit_details.sha, self.commit_date)
 
     def get_tag(self) -> str:
+        self.stats.count("lookups")
+        self.lookup_failed = False
+        if self.local_repo is not None:
+            tag = self.local_repo.get_tag(self.commit)
+            if tag is not None:
+                return tag
+            logger.debug(f"{self.commit} is not in {self.local_repo.git_dir}, using Github")
+        if self.snapshot is not None:
+            return self._get_snapshot_tag(self.snapshot)
         self.get_commit_details()
         tag = self._get_tag()
+        logger.debug(f"Tag probes: {self.probes.hits} hits, {self.probes.misses} misses")
 
         return tag
 
+    def _get_snapshot_tag(self, snapshot: CSnapshot) -> str:
+        commit_ts = snapshot.commit_epoch(self.commit)
+        if commit_ts is None:
+            logger.error(f"{self.commit} is not in the snapshot {snapshot.path}")
+            self.lookup_failed = True
+            return "Unknown"
+        self.commit_date = from_epoch(commit_ts)
+        with self.stats.phase("timeline_lookup"):
+            return snapshot.timeline.lookup(commit_ts)
+
+    def export_snapshot(self, path: str, commits: Iterable[str] = ()) -> Tuple[int, int]:
+        """
+        Write the tags with their dates and the commit dates known to a snapshot, for offline use.
+
+        The dates of the commits given are fetched first, returns the number of tags and commits
+        written.
+        """
+        # Every tag date is needed offline, with GraphQL they come with the listing.
+        # A list, the dates fetched are written back to it.
+        tags: Sequence[Any] = list(self._load_tags()[0])
+        dated_tags = [(tags[idx].name, self._get_tag_date(tags, idx)) for idx in range(len(tags))]
+        commit_dates = cached_commit_dates(self.http_cache) if self.http_cache else {}
+        if self.commit_cache is not None:
+            commit_dates.update(self.commit_cache.dates())
+        for commit in commits:
+            self.commit = commit
+            commit_details = self._get_commit()
+            commit_dates[commit_details.sha] = commit_details.commit.committer.date
+        write_snapshot(path, dated_tags, commit_dates)
+        return (len(dated_tags), len(commit_dates))
+
+    def get_tags_for_dates(self, commit_dates: Sequence[datetime]) -> List[str]:
+        """
+        Earliest release for each commit date, a batch is resolved in one timeline lookup.
+        """
+        self.lookup_failed = False
+        self._load_tags()
+        if self.timeline is not None:
+            with self.stats.phase("timeline_lookup"):
+                return self.timeline.lookup_many(
+                    [to_epoch(commit_date) for commit_date in commit_dates]
+                )
+        tags = []
+        for commit_date in commit_dates:
+            self.commit_date = commit_date
+            tags.append(self._get_tag())
+        return tags
+
+    def get_stable_tags(
+        self,
+        mainline_tag: str,
+        series: Sequence[str],
+        commit: Optional[str] = None,
+        details: Optional[Tuple[str, datetime]] = None,
+    ) -> Dict[str, str]:
+        """
+        First point release of each stable series (5.10) with the commit, given its mainline
+        release, see CStableRepo.
+
+        The commit is the one last resolved unless given, with its full SHA and date if known.
+        """
+        if details is None:
+            if commit is not None and commit != self.commit:
+                self.commit, self.commit_sha, self.commit_date = commit, None, None
+            if self.commit_sha is None or self.commit_date is None:
+                self.get_commit_details()
+            details = (cast(str, self.commit_sha), cast(datetime, self.commit_date))
+        with self.stats.phase("stable_lookup"):
+            return self.stable.get_stable_tags(*details, mainline_tag, series)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Counters, gauges and phase timings of the lookups so far, see CStats.report().
+        """
+        remaining = [
+            state.remaining for state in self.rate_limiter.states if state.remaining is not None
+        ]
+        if remaining:
+            self.stats.gauge("rate_limit_remaining", sum(remaining))
+        return self.stats.report()
+
+    def get_tags_for_commits(self, commits: Iterable[str]) -> Iterator[Tuple[str, str]]:
+        """
+        Resolve many commits sharing a single tag fetch, yields (commit, tag) per commit.
+
+        With a token, the commits are fetched COMMITS_PER_QUERY at a time as the lookups go.
+        """
+        commits = iter(commits)
+        while True:
+            batch = list(itertools.islice(commits, COMMITS_PER_QUERY))
+            if not batch:
+                break
+            # A local linux.git or a snapshot answers without Github.
+            if self.local_repo is None and self.snapshot is None:
+                self.prefetch_commits(batch)
+            for commit in batch:
+                self.commit = commit
+                self.commit_date = None
+                self.commit_sha = None
+                yield (commit, self.get_tag())
+
+    def resolve_each(
+        self, commits: Sequence[str]
+    ) -> Iterator[Tuple[str, Union[str, CResolveError]]]:
+        """
+        (commit, tag) per commit as get_tags_for_commits, (commit, error) for a commit whose lookup
+        failed, the other commits are still resolved.
+        """
+        if self.local_repo is None and self.snapshot is None:
+            try:
+                self.prefetch_commits(commits)
+            except LOOKUP_ERRORS:
+                # The lookups fetch the commits one by one, each reporting its own failure.
+                pass
+        for commit in commits:
+            try:
+                yield next(self.get_tags_for_commits([commit]))
+            except LOOKUP_ERRORS as e:
+                yield (commit, to_resolve_error(e, commit))
+
+
+def resolve_in_repos(
+    repos: Sequence[CLinuxKernelRepo], commits: Sequence[str]
+) -> List[Tuple[str, Dict[str, str]]]:
+    """
+    Resolve the commits in every tree at once, returns (commit, {repo name: tag}) per commit.
+
+    Each tree is resolved in its own thread, the total is about the time of the slowest tree. A
+    commit Github does not find in a tree has not landed there, it is "Unmerged" in it.
+    """
 
-def main() -> None:  # pragma: no cover
+    def resolve(repo: CLinuxKernelRepo) -> List[str]:
+        repo.prefetch_commits(commits)
+        tags = []
+        for commit in commits:
+            try:
+                tags.append(next(repo.get_tags_for_commits([commit]))[1])
+            except GithubException as e:
+                if e.status != 422:
+                    raise
+                tags.append("Unmerged")
+        return tags
+
+    with ThreadPoolExecutor(max_workers=max(1, len(repos))) as executor:
+        repo_tags = list(executor.map(resolve, repos))
+    return [
+        (commit, {repo.repo_name: tags[idx] for repo, tags in zip(repos, repo_tags)})
+        for idx, commit in enumerate(commits)
+    ]
+
+
+def read_commits(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Commits from a file, one per line, blank lines and # comments are skipped.
+    """
+    for line in lines:
+        commit = line.split("#", 1)[0].strip()
+        if commit:
+            yield commit
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Options and commands of lk-get-tag.
+    """
     parser = argparse.ArgumentParser()
 
     parser.add_argument(
@@ -97,15 +673,187 @@ def main() -> None:  # pragma: no cover
         required=False,
         default=os.environ.get("GITHUB_API_TOKEN"),
         type=str,
-        help="Github API Access token, default: GITHUB_API_TOKEN environment variable",
+        help="Github API Access token, a comma separated list pools the tokens' rate limits, "
+        "default: GITHUB_API_TOKEN environment variable",
     )
 
     parser.add_argument(
         "-c",
         "--commit",
-        required=True,
+        action="append",
+        default=[],
         type=str,
-        help="Commit to find the tag it first appeared in.",
+        help="Commit to find the tag it first appeared in, can be repeated.",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--commits-file",
+        type=argparse.FileType("r"),
+        help="File with one commit per line to find the tags for, - for stdin.",
+    )
+
+    parser.add_argument(
+        "--repo",
+        action="append",
+        default=[],
+        metavar="OWNER/NAME",
+        help=f"Tree to resolve the commits in, repeat it to resolve them in several trees at "
+        f"once, default: {LINUX_REPO}",
+    )
+
+    parser.add_argument(
+        "-b",
+        "--backend",
+        choices=BACKENDS,
+        default="rest",
+        help="Github API used to fetch the tags, graphql gets the tag dates 100 tags a "
+        "request, default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--tag-order",
+        choices=TAG_ORDERS,
+        default="version",
+        help="Order of the tags searched, version parses the tag names (v5.12-rc3) so the "
+        "search does not depend on Github's listing order, default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--api-url",
+        default=API_URL,
+        type=str,
+        help="Github API URL, default: %(default)s",
+    )
+
+    parser.add_argument(
+        "-g",
+        "--git-dir",
+        default=os.environ.get("LINUX_GIT_DIR"),
+        type=str,
+        help="Local linux.git clone or mirror to answer from, Github is only used for the "
+        "commits missing in it, default: LINUX_GIT_DIR environment variable",
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        default=default_cache_dir(),
+        type=str,
+        help="Directory for the persistent tag index, default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not use the persistent tag index, list the tags from Github",
+    )
+
+    parser.add_argument(
+        "--index-max-age",
+        default=DEFAULT_MAX_AGE,
+        type=int,
+        help="Seconds before the tag index is checked for new tags, default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--request-rate",
+        default=DEFAULT_RATE,
+        type=float,
+        help="Github requests a second, bursts above it are paced, default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--max-in-flight",
+        default=0,
+        type=int,
+        metavar="N",
+        help="Resolve the commits together with up to N Github requests in flight, the lookups "
+        "are made in this process, default: one commit at a time",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default=0,
+        type=int,
+        metavar="N",
+        help="Resolve the commits N at a time in a pool of threads, each result is reported as "
+        "soon as it is ready, -f is read as the lookups go",
+    )
+
+    parser.add_argument(
+        "--keep-order",
+        action="store_true",
+        help="With --jobs, report the results in the order of the commits given",
+    )
+
+    parser.add_argument(
+        "--jsonl",
+        action="store_true",
+        help="Write one JSON record a commit to stdout (commit, tag, status, sha, commit_date, or "
+        "error), the lookups are made as with --jobs",
+    )
+
+    parser.add_argument(
+        "--snapshot",
+        nargs="?",
+        const="",
+        type=str,
+        help="Answer offline from a snapshot (see snapshot export/import), default: the snapshot "
+        "installed in --cache-dir",
+    )
+
+    parser.add_argument(
+        "--socket",
+        type=str,
+        help="Unix socket of the resolver daemon, default: daemon.sock in --cache-dir",
+    )
+
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Resolve in this process even if a resolver daemon is serving",
+    )
+
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument(
+        "--record",
+        type=str,
+        metavar="DIR",
+        help="Record the Github requests and responses of the run in DIR, for --replay",
+    )
+    cassette_group.add_argument(
+        "--replay",
+        type=str,
+        metavar="DIR",
+        help="Answer the Github requests from a --record run in DIR, without any network",
+    )
+
+    parser.add_argument(
+        "--replay-latency",
+        action="store_true",
+        help="With --replay, wait as long as each response took when recorded",
+    )
+
+    parser.add_argument(
+        "--stable",
+        type=parse_series,
+        metavar="SERIES",
+        help="Also find the first point release of these stable series (5.10,5.15) carrying the "
+        "commit, backports are matched by their upstream commit trailer",
+    )
+
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print the requests, cache hits and time per phase of the lookups as JSON to stdout, "
+        "the lookups are made in this process",
+    )
+
+    parser.add_argument(
+        "--stats-prometheus",
+        type=str,
+        help="Also write the stats to this file in the Prometheus textfile format",
     )
 
     parser.add_argument(
@@ -115,25 +863,341 @@ def main() -> None:  # pragma: no cover
         help="Enable debug logging",
     )
 
-    args = parser.parse_args()
+    subparsers = parser.add_subparsers(dest="command")
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Keep the tags in memory and answer the lookups of the other runs over --socket",
+    )
+    serve_parser.add_argument(
+        "--refresh-interval",
+        default=DEFAULT_REFRESH_INTERVAL,
+        type=float,
+        help="Seconds between the refreshes of the tags, each lists only the tags made since the "
+        "last one, default: %(default)s",
+    )
+    subparsers.add_parser("status", help="Report the lookup latencies of the resolver daemon")
+    snapshot_parser = subparsers.add_parser(
+        "snapshot", help="Export or import a snapshot of the tags and commit dates"
+    )
+    snapshot_subparsers = snapshot_parser.add_subparsers(dest="snapshot_command", required=True)
+    export_parser = snapshot_subparsers.add_parser(
+        "export",
+        help="Write the tags with their dates, the cached commit dates and the dates of the -c/-f "
+        "commits to a snapshot",
+    )
+    export_parser.add_argument("path", help="Snapshot file to write")
+    import_parser = snapshot_subparsers.add_parser(
+        "import", help="Install a snapshot in --cache-dir, for --snapshot"
+    )
+    import_parser.add_argument("path", help="Snapshot file to install")
+    index_parser = subparsers.add_parser("index", help="Maintain the tag index in --cache-dir")
+    index_subparsers = index_parser.add_subparsers(dest="index_command", required=True)
+    index_subparsers.add_parser(
+        "update",
+        help="Add the tags made since the last sync, whatever --index-max-age, for cron",
+    )
+    return parser
 
-    if args.debug:
-        logger.setLevel(logging.DEBUG)
 
-    if args.api_token is None:
+def run_snapshot_import(path: str, cache_dir: str) -> int:
+    try:
+        installed = import_snapshot(path, cache_dir)
+    except (OSError, ValueError) as e:
+        logger.error(f"Cannot import the snapshot: {e}")
+        return 1
+    logger.info(f"Snapshot installed as {installed}, use it with --snapshot")
+    return 0
+
+
+def run_status(socket_path: str) -> int:
+    stats = CDaemonClient(socket_path).stats()
+    if stats is None:
+        logger.error(f"No resolver daemon is serving at {socket_path}")
+        return 1
+    logger.info(
+        f"Resolver daemon at {socket_path}: {stats['requests']} requests, "
+        f"p50 {stats['p50_ms']}ms, p99 {stats['p99_ms']}ms"
+    )
+    return 0
+
+
+def run_with_daemon(socket_path: str, commits: List[str]) -> Optional[int]:
+    """
+    Resolve the commits with the resolver daemon, None if no daemon is serving. As run_batch, a
+    commit whose lookup failed is reported in place of its tag and fails the run.
+    """
+    try:
+        results = CDaemonClient(socket_path).resolve(commits)
+    except GithubException as e:
+        logger.error(e.status)
+        logger.error(error_message(e))
+        return 2
+    if results is None:
+        return None
+    failed = False
+    for commit, tag in results:
+        if isinstance(tag, CResolveError):
+            failed = True
+            logger.error(tag)
+            continue
+        logger.info(f"Earliest tag which has {commit} is {tag}")
+    return 1 if failed else 0
+
+
+def run_snapshot_export(repo: CLinuxKernelRepo, path: str, commits: List[str]) -> int:
+    num_tags, num_commits = repo.export_snapshot(path, commits)
+    logger.info(f"Snapshot of {num_tags} tags and {num_commits} commits written")
+    return 0
+
+
+def run_index_update(repo: CLinuxKernelRepo) -> int:
+    num_new_tags = repo.update_index()
+    logger.info(f"Tag index updated, {num_new_tags} new tags")
+    return 0
+
+
+def run_serve(repo: CLinuxKernelRepo, socket_path: str, refresh_interval: float) -> int:
+    try:
+        server = CResolverServer(socket_path, repo, refresh_interval)
+    except OSError as e:
+        logger.error(f"Cannot serve at {socket_path}: {e.strerror}")
+        return 1
+    # Shut down cleanly on SIGTERM too, removing the socket.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.start()
+        logger.info(f"Serving at {socket_path}")
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def run_streaming(
+    repo: CLinuxKernelRepo, commits: Iterable[str], jobs: int, keep_order: bool, jsonl: bool
+) -> int:
+    """
+    Resolve the commits jobs at a time, reporting each result as soon as it is ready, as a JSON
+    line if jsonl. Fails if any commit failed.
+    """
+    # Imports this module.
+    from lk_compat_helper.resolver import CResolver, to_record
+
+    failed = False
+    resolver = CResolver(max_workers=jobs, repo=repo)
+    for result in resolver.resolve_iter(commits, jobs, keep_order):
+        failed = failed or isinstance(result, CResolveError)
+        if jsonl:
+            sys.stdout.write(json.dumps(to_record(result)) + "\n")
+            sys.stdout.flush()
+        elif isinstance(result, CResolveError):
+            logger.error(result)
+        else:
+            logger.info(f"Earliest tag which has {result.commit} is {result.answer}")
+    return 1 if failed else 0
+
+
+def run_in_repos(repos: Sequence[CLinuxKernelRepo], commits: Sequence[str]) -> int:
+    for commit, repo_tags in resolve_in_repos(repos, commits):
+        for repo_name, tag in repo_tags.items():
+            logger.info(f"Earliest {repo_name} tag which has {commit} is {tag}")
+    return 0
+
+
+def run_batch(
+    repo: CLinuxKernelRepo,
+    commits: List[str],
+    max_in_flight: int = 0,
+    stable: Optional[Sequence[str]] = None,
+) -> int:
+    """
+    Resolve the commits, max_in_flight Github requests at once if given, along with their first
+    stable releases in the stable series. A commit whose lookup failed is reported in place of its
+    tag, the others are still resolved and the run fails at the end.
+    """
+    resolved: Iterable[Tuple[str, Union[str, CResolveError]]] = repo.resolve_each(commits)
+    details: Dict[str, Tuple[str, datetime]] = {}
+    if max_in_flight:
+        async_resolver = CAsyncResolver(repo, max_in_flight)
+        resolved = async_resolver.resolve_each(commits)
+        # Resolved all at once, the repo is left on none of them in particular.
+        details = async_resolver.details
+    failed = False
+    for commit, tag in resolved:
+        if isinstance(tag, CResolveError):
+            failed = True
+            logger.error(tag)
+            continue
+        logger.info(f"Earliest tag which has {commit} is {tag}")
+        if stable:
+            stable_tags = repo.get_stable_tags(tag, stable, commit, details.get(commit))
+            for series, stable_tag in stable_tags.items():
+                logger.info(f"Earliest {series} stable tag which has {commit} is {stable_tag}")
+    return 1 if failed else 0
+
+
+def report_stats(repo: CLinuxKernelRepo, args: argparse.Namespace) -> None:
+    """
+    Write the stats of the lookups as --stats and --stats-prometheus ask.
+    """
+    if not (args.stats or args.stats_prometheus):
+        return
+    stats = repo.get_stats()
+    if args.stats:
+        # Keep the JSON lines on stdout parseable line by line.
+        print(json.dumps(stats, indent=2), file=sys.stderr if args.jsonl else sys.stdout)
+    if args.stats_prometheus:
+        try:
+            repo.stats.write_prometheus(args.stats_prometheus)
+        except OSError as e:
+            logger.error(f"Cannot write the stats to {args.stats_prometheus}: {e}")
+
+
+def run(parser: argparse.ArgumentParser, args: argparse.Namespace) -> int:
+    """
+    Carry out the command line parsed by the parser, returns the exit status.
+    """
+    socket_path = args.socket or default_socket_path(args.cache_dir)
+    snapshot = args.snapshot
+    if snapshot == "":
+        snapshot = default_snapshot_path(args.cache_dir)
+    if args.command == "snapshot" and args.snapshot_command == "import":
+        return run_snapshot_import(args.path, args.cache_dir)
+    if args.command == "status":
+        return run_status(socket_path)
+
+    repos = list(dict.fromkeys(args.repo)) or [LINUX_REPO]
+    if len(repos) > 1 and (args.command or args.snapshot is not None or args.stable):
+        parser.error(
+            "several --repo only resolve commits, without a command, --snapshot or --stable"
+        )
+
+    if args.max_in_flight < 0:
+        parser.error("--max-in-flight must be at least 1")
+    if args.jobs < 0:
+        parser.error("--jobs must be at least 1")
+    streaming = bool(args.jobs or args.jsonl)
+    if streaming and (len(repos) > 1 or args.command or args.stable or args.max_in_flight):
+        parser.error(
+            "--jobs and --jsonl only resolve commits in one --repo, without a command, --stable "
+            "or --max-in-flight"
+        )
+
+    if args.command == "index" and args.no_cache:
+        parser.error("the tag index is kept in --cache-dir, not with --no-cache")
+
+    commits = list(args.commit)
+    # Streamed, the file is read as the lookups go.
+    if args.commits_file and not streaming:
+        commits.extend(read_commits(args.commits_file))
+    if args.command is None:
+        if not commits and not (streaming and args.commits_file):
+            parser.error("at least one commit is required, use -c or -f")
+        # A snapshot is asked for offline answers, the daemon's may differ.
+        # Recorded, replayed and measured lookups are made in this process.
+        local = args.stats or args.stats_prometheus or args.record or args.replay or args.stable
+        # The daemon resolves in torvalds/linux.
+        local = local or repos != [LINUX_REPO] or args.max_in_flight or streaming
+        local = local or any(
+            getattr(args, name) != parser.get_default(name) for name in RESOLVER_OPTIONS
+        )
+        if not args.no_daemon and snapshot is None and not local:
+            status = run_with_daemon(socket_path, commits)
+            if status is not None:
+                return status
+
+    if snapshot is None and args.replay is None and not parse_tokens(args.api_token):
         logger.error("Please provide a Github API token")
-        sys.exit(1)
+        return 1
 
-    lkHandle = CLinuxKernelRepo(args.api_token, args.commit)
+    cache_dir = None if args.no_cache else args.cache_dir
+    cassette = None
+    try:
+        if args.record or args.replay:
+            cassette = CCassette(
+                args.record or args.replay, args.replay is not None, args.replay_latency
+            )
+    except (OSError, ValueError) as e:
+        logger.error(f"Cannot use the cassette: {e}")
+        return 1
+    loaded_snapshot = None
+    if snapshot is not None:
+        try:
+            loaded_snapshot = load_snapshot(snapshot)
+        except (OSError, ValueError) as e:
+            logger.error(f"Cannot load the snapshot: {e}")
+            return 1
+    lkHandle = CLinuxKernelRepo(
+        args.api_token,
+        commits[0] if commits else "",
+        cache_dir,
+        args.index_max_age,
+        args.backend,
+        args.api_url,
+        # A linux.git clone only answers for torvalds/linux.
+        args.git_dir if repos[0] == LINUX_REPO else None,
+        args.request_rate,
+        args.tag_order,
+        loaded_snapshot,
+        cassette,
+        repos[0],
+    )
+    others = [
+        CLinuxKernelRepo(
+            args.api_token,
+            "",
+            cache_dir,
+            args.index_max_age,
+            args.backend,
+            args.api_url,
+            args.git_dir if repo_name == LINUX_REPO else None,
+            tag_order=args.tag_order,
+            repo_name=repo_name,
+            shared_with=lkHandle,
+        )
+        for repo_name in repos[1:]
+    ]
 
     try:
-        tag = lkHandle.get_tag()
-        logger.info(f"Earliest tag which has {args.commit} is {tag}")
-        sys.exit(0)
+        if args.command == "snapshot":
+            return run_snapshot_export(lkHandle, args.path, commits)
+        if args.command == "index":
+            return run_index_update(lkHandle)
+        if args.command == "serve":
+            return run_serve(lkHandle, socket_path, args.refresh_interval)
+        if streaming:
+            stream = itertools.chain(
+                commits, read_commits(args.commits_file) if args.commits_file else ()
+            )
+            return run_streaming(lkHandle, stream, args.jobs or 1, args.keep_order, args.jsonl)
+        if others:
+            return run_in_repos([lkHandle] + others, commits)
+        return run_batch(lkHandle, commits, args.max_in_flight, args.stable)
     except GithubException as e:
         logger.error(e.status)
-        logger.error(e.data["message"])
-        sys.exit(2)
+        logger.error(error_message(e))
+        return 2
+    except CResolveError as e:
+        logger.error(e)
+        return 1
+    finally:
+        report_stats(lkHandle, args)
+        for repo in [lkHandle] + others:
+            if repo.commit_cache is not None:
+                # When the commits were read, for the evictions.
+                repo.commit_cache.flush()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    # Not on import, embedders configure their own logging.
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s: %(message)s")
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.debug:
+        logger.setLevel(logging.DEBUG)
+    sys.exit(run(parser, args))
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -0,0 +1,245 @@
+import errno
+import json
+import logging
+import math
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Deque, Dict, Iterable, List, Optional, Tuple, Union
+
+from github import GithubException  # type: ignore
+
+from lk_compat_helper.errors import CResolveError, error_message
+
+if TYPE_CHECKING:  # pragma: no cover
+    from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+
+logger = logging.getLogger("__main__")
+
+SOCKET_NAME = "daemon.sock"
+LATENCY_SAMPLES = 10000
+# Answers which can still change as new tags are made, they are not kept.
+PENDING_TAGS = ("Unknown", "Unmerged")
+# A refresh only lists the tags made since the last one, a new -rc shows within minutes.
+DEFAULT_REFRESH_INTERVAL = 300
+# Seconds a client waits on the daemon, past them it resolves in its own process.
+DEFAULT_CLIENT_TIMEOUT = 60
+
+
+def default_socket_path(cache_dir: str) -> str:
+    return os.path.join(cache_dir, SOCKET_NAME)
+
+
+class CLatencyStats:
+    """
+    Latencies of the most recent resolve requests, for the p50/p99 report, and how many were
+    answered. A request resolves a batch of commits.
+    """
+
+    def __init__(self, max_samples: int = LATENCY_SAMPLES):
+        self.samples: Deque[float] = deque(maxlen=max_samples)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self.lock:
+            self.samples.append(seconds)
+            self.count += 1
+
+    def percentile(self, pct: float) -> float:
+        # Nearest rank, in milliseconds.
+        with self.lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return 0.0
+        return samples[max(0, math.ceil(pct / 100 * len(samples)) - 1)] * 1000
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "requests": self.count,
+            "p50_ms": round(self.percentile(50), 3),
+            "p99_ms": round(self.percentile(99), 3),
+        }
+
+
+class CResolverHandler(socketserver.StreamRequestHandler):
+    """
+    One JSON request a line, answered with one JSON line.
+    """
+
+    server: "CResolverServer"
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            start = time.perf_counter()
+            try:
+                request = json.loads(line)
+            except ValueError:
+                request = None
+            response = self.server.dispatch(request)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+            if "results" in response:
+                self.server.latency.record(time.perf_counter() - start)
+
+
+class CResolverServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Resolver daemon answering commit -> tag lookups over a Unix socket.
+
+    The tags are kept in memory and refreshed every refresh_interval seconds, the releases found
+    are kept too, so a repeated lookup does not take the resolver's lock at all.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: str, repo: "CLinuxKernelRepo", refresh_interval: float):
+        if os.path.exists(path):
+            if CDaemonClient(path).stats() is not None:
+                raise OSError(errno.EADDRINUSE, f"{path}: a daemon is already serving")
+            # Left behind by a daemon which did not shut down.
+            os.unlink(path)
+        # Before binding, server_close runs if it fails.
+        self.path = path
+        self.stopped = threading.Event()
+        super().__init__(path, CResolverHandler)
+        os.chmod(path, 0o600)
+        # Imports this module.
+        from lk_compat_helper.resolver import CResolver
+
+        self.repo = repo
+        # The commits of the requests are fetched concurrently, the resolver's lock is only held
+        # to search the tags or to swap them.
+        self.resolver = CResolver(repo=repo)
+        self.refresh_interval = refresh_interval
+        self.lock = self.resolver.lock
+        self.releases: Dict[str, str] = {}
+        self.latency = CLatencyStats()
+        self.refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+
+    def start(self) -> None:
+        # Warm up before the first lookup.
+        with self.lock:
+            self.repo.refresh_tags()
+        self.refresher.start()
+
+    def server_close(self) -> None:
+        self.stopped.set()
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def refresh(self) -> None:
+        try:
+            # The lookups go on with the current tags until the new ones are swapped in.
+            tags = self.repo.fetch_tags()
+        except GithubException as e:
+            logger.warning(f"Failed to refresh the tags: {e.status} {error_message(e)}")
+            return
+        with self.lock:
+            self.repo.swap_tags(tags)
+        stats = self.latency.summary()
+        logger.info(
+            f"Tags refreshed, {stats['requests']} requests, "
+            f"p50 {stats['p50_ms']}ms, p99 {stats['p99_ms']}ms"
+        )
+
+    def _refresh_loop(self) -> None:
+        while not self.stopped.wait(self.refresh_interval):
+            self.refresh()
+
+    def resolve(self, commits: List[str]) -> List[Dict[str, Any]]:
+        """
+        {"commit", "tag"} for each commit, {"commit", "error", "status"} for one whose lookup
+        failed, the others are still answered.
+        """
+        resolved: Dict[str, Dict[str, Any]] = {}
+        missing = list(dict.fromkeys(commit for commit in commits if commit not in self.releases))
+        for result in self.resolver.resolve_iter(missing, self.resolver.max_workers):
+            if isinstance(result, CResolveError):
+                resolved[str(result.commit)] = {
+                    "commit": result.commit,
+                    "error": str(result),
+                    "status": result.status,
+                }
+                continue
+            resolved[result.commit] = {"commit": result.commit, "tag": result.answer}
+            if result.answer not in PENDING_TAGS:
+                self.releases[result.commit] = result.answer
+        return [
+            resolved.get(commit) or {"commit": commit, "tag": self.releases[commit]}
+            for commit in commits
+        ]
+
+    def dispatch(self, request: Any) -> Dict[str, Any]:
+        op = request.get("op") if isinstance(request, dict) else None
+        if op == "resolve":
+            try:
+                return {"results": self.resolve(request["commits"])}
+            except (KeyError, TypeError, ValueError) as e:
+                # Commits missing or not a list of strings, the connection stays up.
+                return {"error": {"status": 400, "message": f"Malformed request: {e!r}"}}
+        if op == "stats":
+            return self.latency.summary()
+        return {"error": {"status": 400, "message": f"Unsupported request: {request}"}}
+
+
+class CDaemonClient:
+    """
+    Client of the resolver daemon, None answers mean no daemon is serving at path, or it did not
+    answer within timeout seconds.
+    """
+
+    def __init__(self, path: str, timeout: float = DEFAULT_CLIENT_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+
+    def request(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+            with sock.makefile("rwb") as stream:
+                stream.write(json.dumps(request).encode() + b"\n")
+                stream.flush()
+                line = stream.readline()
+        except socket.timeout:
+            logger.warning(f"The resolver daemon at {self.path} did not answer in {self.timeout}s")
+            return None
+        except OSError:
+            # Not serving, or went away before answering.
+            return None
+        finally:
+            sock.close()
+        return json.loads(line) if line else None
+
+    def resolve(
+        self, commits: Iterable[str]
+    ) -> Optional[List[Tuple[str, Union[str, CResolveError]]]]:
+        """
+        (commit, tag) for each commit, the CResolveError in place of the tag of a commit whose
+        lookup failed. A request the daemon rejected is raised as a GithubException.
+        """
+        response = self.request({"op": "resolve", "commits": list(commits)})
+        if response is None:
+            return None
+        if "error" in response:
+            error = response["error"]
+            raise GithubException(error["status"], {"message": error["message"]}, {})
+        return [
+            (
+                result["commit"],
+                (
+                    CResolveError(result["error"], result["commit"], result["status"])
+                    if "error" in result
+                    else result["tag"]
+                ),
+            )
+            for result in response["results"]
+        ]
+
+    def stats(self) -> Optional[Dict[str, Any]]:
+        return self.request({"op": "stats"})
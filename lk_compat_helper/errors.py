@@ -0,0 +1,67 @@
+from typing import Any, Optional
+
+import requests
+from github import GithubException  # type: ignore
+
+# Github's answers for a SHA it has no commit for, 422 for the commits API.
+NOT_FOUND_STATUSES = (404, 422)
+
+
+def error_message(e: GithubException) -> str:
+    return str(e.data.get("message", e.data)) if isinstance(e.data, dict) else str(e.data)
+
+
+def github_json(response: requests.Response) -> Any:
+    """
+    Body of a Github answer, raised as the GithubException PyGithub would raise if not a 200.
+    """
+    if response.status_code != 200:
+        try:
+            body = response.json()
+        except ValueError:
+            body = {"message": response.text}
+        raise GithubException(response.status_code, body, dict(response.headers))
+    return response.json()
+
+
+class CResolveError(Exception):
+    """
+    A lookup failed, status is the HTTP status if Github answered with an error.
+    """
+
+    def __init__(self, message: str, commit: Optional[str] = None, status: Optional[int] = None):
+        super().__init__(message)
+        self.commit = commit
+        self.status = status
+
+
+class CCommitNotFoundError(CResolveError):
+    """
+    Github has no commit with this SHA, or not in this tree.
+    """
+
+
+def from_github_exception(e: GithubException, commit: Optional[str] = None) -> CResolveError:
+    message = error_message(e)
+    if commit is not None:
+        message = f"{commit}: {message}"
+    error_class = CCommitNotFoundError if e.status in NOT_FOUND_STATUSES else CResolveError
+    return error_class(message, commit, e.status)
+
+
+# How a lookup fails, anything else is a bug.
+LOOKUP_ERRORS = (CResolveError, GithubException, requests.RequestException)
+
+
+def to_resolve_error(e: Exception, commit: Optional[str] = None) -> CResolveError:
+    """
+    The CResolveError of a failed lookup of the commit, e one of LOOKUP_ERRORS.
+    """
+    if isinstance(e, CResolveError):
+        if e.commit is None:
+            e.commit = commit
+        return e
+    if isinstance(e, GithubException):
+        return from_github_exception(e, commit)
+    # Github could not be reached, or the connection broke.
+    return CResolveError(f"{commit}: {e}" if commit is not None else str(e), commit)
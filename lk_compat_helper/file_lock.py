@@ -0,0 +1,55 @@
+import fcntl
+import hashlib
+import os
+from contextlib import ExitStack, contextmanager
+from typing import ContextManager, Iterable, Iterator, List
+
+# Keys share this many lock files, the few fetched at once by the processes rarely collide.
+LOCK_STRIPES = 256
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Exclusive lock on the file at path, created if missing, between processes and threads alike.
+    """
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # Released as the file is closed.
+        yield
+
+
+@contextmanager
+def _file_locks(paths: List[str]) -> Iterator[None]:
+    with ExitStack() as stack:
+        for path in paths:
+            stack.enter_context(file_lock(path))
+        yield
+
+
+class CKeyLocks:
+    """
+    Locks by key for the processes sharing a cache directory, so that an item missing from the
+    cache is fetched once: the first process takes the lock and fetches it, the others wait for
+    the lock and find it cached.
+
+    The keys hash to LOCK_STRIPES lock files, the directory stays small.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+
+    def _lock_path(self, key: str) -> str:
+        stripe = int(hashlib.sha256(key.encode()).hexdigest()[:8], 16) % LOCK_STRIPES
+        return os.path.join(self.path, f"{stripe}.lock")
+
+    def lock(self, key: str) -> ContextManager[None]:
+        return file_lock(self._lock_path(key))
+
+    def lock_many(self, keys: Iterable[str]) -> ContextManager[None]:
+        """
+        Locks of all the keys, each lock file taken once and in order, so processes locking
+        overlapping keys do not deadlock.
+        """
+        return _file_locks(sorted({self._lock_path(key) for key in keys}))
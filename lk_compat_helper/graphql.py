@@ -0,0 +1,149 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+import requests
+from github import GithubException  # type: ignore
+
+from lk_compat_helper.errors import github_json
+from lk_compat_helper.tag_index import TagEntry
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+# GraphQL connections are capped at 100 nodes per page.
+PAGE_SIZE = 100
+# Aliased lookups a commits query, well within Github's query complexity limits.
+COMMITS_PER_QUERY = 100
+
+TAGS_QUERY = """
+query($owner: String!, $name: String!, $first: Int!, $cursor: String, $query: String) {
+  repository(owner: $owner, name: $name) {
+    refs(refPrefix: "refs/tags/", query: $query, first: $first, after: $cursor,
+         orderBy: {field: TAG_COMMIT_DATE, direction: DESC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        name
+        target {
+          ... on Commit { oid committedDate }
+          ... on Tag { target { ... on Commit { oid committedDate } } }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+def commits_query(num_commits: int) -> str:
+    """
+    Query for the oid and committer date of num_commits commits, aliased c0, c1, ..., each found
+    by its expression variable ($e0, $e1, ...): a full or abbreviated SHA.
+    """
+    variables = "".join(f", $e{idx}: String!" for idx in range(num_commits))
+    objects = "".join(
+        f"    c{idx}: object(expression: $e{idx}) {{ ... on Commit {{ oid committedDate }} }}\n"
+        for idx in range(num_commits)
+    )
+    return (
+        f"query($owner: String!, $name: String!{variables}) {{\n"
+        f"  repository(owner: $owner, name: $name) {{\n{objects}  }}\n}}\n"
+    )
+
+
+def graphql_url(api_url: str) -> str:
+    # Github Enterprise serves REST under /api/v3 and GraphQL under /api/graphql.
+    if api_url.endswith("/v3"):
+        api_url = api_url[: -len("/v3")]
+    return f"{api_url}/graphql"
+
+
+def parse_date(date: str) -> datetime:
+    # Naive UTC, same as the dates PyGithub hands out.
+    dt = datetime.fromisoformat(date.replace("Z", "+00:00"))
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class CGraphQLClient:
+    """
+    Github GraphQL API client, fetches the tag timeline with the commit dates 100 tags a request.
+    """
+
+    def __init__(
+        self,
+        token: Optional[str],
+        url: str = GRAPHQL_URL,
+        session: Optional[requests.Session] = None,
+        timeout: int = 15,
+    ):
+        self.url = url
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.headers = {"Authorization": f"bearer {token}"} if token else {}
+
+    def query(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        response = self.session.post(
+            self.url,
+            json={"query": query, "variables": variables},
+            headers=self.headers,
+            timeout=self.timeout,
+        )
+        body = github_json(response)
+        if body.get("errors"):
+            raise GithubException(
+                response.status_code,
+                {"message": body["errors"][0]["message"], "errors": body["errors"]},
+                dict(response.headers),
+            )
+        return body["data"]
+
+    def iter_tags(self, repo_name: str, query: Optional[str] = None) -> Iterator[TagEntry]:
+        """
+        Tags newest first by commit date, pages are only requested as the iteration needs them.
+
+        With a query, only the tags whose name matches it (v5.10.), as Github filters refs.
+        """
+        owner, name = repo_name.split("/", 1)
+        cursor = None
+        while True:
+            variables = {
+                "owner": owner,
+                "name": name,
+                "first": PAGE_SIZE,
+                "cursor": cursor,
+                "query": query,
+            }
+            data = self.query(TAGS_QUERY, variables)
+            refs = data["repository"]["refs"]
+            for node in refs["nodes"]:
+                target = node["target"]
+                # Annotated tags point to the commit through the tag object.
+                target = target.get("target", target)
+                # Skip tags of trees/blobs (v2.6.11-tree), they are not releases.
+                if "committedDate" not in target:
+                    continue
+                yield TagEntry(node["name"], target["oid"], parse_date(target["committedDate"]))
+            if not refs["pageInfo"]["hasNextPage"]:
+                break
+            cursor = refs["pageInfo"]["endCursor"]
+
+    def get_commits(
+        self, repo_name: str, commits: Sequence[str]
+    ) -> Dict[str, Optional[Tuple[str, datetime]]]:
+        """
+        Full SHA and committer date of each commit, None if the tree has no such commit (or the
+        abbreviation is ambiguous), COMMITS_PER_QUERY commits a request.
+        """
+        owner, name = repo_name.split("/", 1)
+        found: Dict[str, Optional[Tuple[str, datetime]]] = {}
+        for start in range(0, len(commits), COMMITS_PER_QUERY):
+            chunk = commits[start : start + COMMITS_PER_QUERY]
+            variables = {f"e{idx}": commit for idx, commit in enumerate(chunk)}
+            data = self.query(
+                commits_query(len(chunk)), {"owner": owner, "name": name, **variables}
+            )
+            for idx, commit in enumerate(chunk):
+                target = data["repository"][f"c{idx}"]
+                # Null if missing, empty if the expression names a tree or a blob.
+                if target and "committedDate" in target:
+                    found[commit] = (target["oid"], parse_date(target["committedDate"]))
+                else:
+                    found[commit] = None
+        return found
@@ -0,0 +1,107 @@
+import re
+import subprocess
+import threading
+from typing import List, Optional
+
+from lk_compat_helper.commit_graph import CCommitGraphResolver
+
+# Releases only, "v5.12-rc3~12^2~5" is a commit reachable from v5.12-rc3.
+RELEASE_EXCLUDE = "*-rc*"
+DESCRIBE_SUFFIX = re.compile(r"[~^].*$")
+
+
+class CLocalGitRepo:
+    """
+    Answers from a local linux.git clone or mirror with git describe --contains.
+
+    Commits in the repo's commit-graph are answered from it without running git at all, the
+    others go through a persistent git cat-file --batch-check process, so checking whether the
+    mirror has a commit does not cost a git start up.
+    """
+
+    def __init__(self, git_dir: str):
+        self.git_dir = git_dir
+        self.lock = threading.Lock()
+        self.cat_file: Optional[subprocess.Popen] = None
+        self.commit_graph = CCommitGraphResolver.open(git_dir)
+
+    @staticmethod
+    def is_git_dir(git_dir: str) -> bool:
+        try:
+            result = subprocess.run(
+                ["git", "--git-dir", git_dir, "rev-parse", "--git-dir"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError:
+            return False
+        return result.returncode == 0
+
+    def close(self) -> None:
+        if self.commit_graph is not None:
+            self.commit_graph.graph.close()
+            self.commit_graph = None
+        with self.lock:
+            if self.cat_file is not None:
+                self.cat_file.stdin.close()  # type: ignore
+                self.cat_file.wait()
+                self.cat_file.stdout.close()  # type: ignore
+                self.cat_file = None
+
+    def _git(self, *args: str) -> Optional[str]:
+        result = subprocess.run(
+            ["git", "--git-dir", self.git_dir, *args],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            encoding="UTF-8",
+        )
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip()
+
+    def resolve_commit(self, commit: str) -> Optional[str]:
+        """
+        Full SHA of the commit, None if the repo does not have it.
+        """
+        with self.lock:
+            if self.cat_file is None:
+                self.cat_file = subprocess.Popen(
+                    ["git", "--git-dir", self.git_dir, "cat-file", "--batch-check"],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    encoding="UTF-8",
+                )
+            assert self.cat_file.stdin is not None and self.cat_file.stdout is not None
+            # Without the type, a tag name would resolve to the tag object.
+            self.cat_file.stdin.write(f"{commit}^{{commit}}\n")
+            self.cat_file.stdin.flush()
+            fields: List[str] = self.cat_file.stdout.readline().split()
+        # "<sha> commit <size>", "<commit> missing" or "<commit> ambiguous"
+        if len(fields) != 3 or fields[1] != "commit":
+            return None
+        return fields[0]
+
+    def _describe(self, sha: str, *args: str) -> Optional[str]:
+        name = self._git("describe", "--contains", "--match", "v*", *args, sha)
+        if not name:
+            return None
+        return DESCRIBE_SUFFIX.sub("", name)
+
+    def get_tag(self, commit: str) -> Optional[str]:
+        """
+        Earliest release with the commit, None if the repo does not have the commit.
+        """
+        if self.commit_graph is not None:
+            tag = self.commit_graph.get_tag(commit)
+            if tag is not None:
+                return tag
+        sha = self.resolve_commit(commit)
+        if sha is None:
+            return None
+        tag = self._describe(sha, "--exclude", RELEASE_EXCLUDE)
+        if tag:
+            return tag
+        # Only in RCs so far, there is no release yet.
+        if self._describe(sha):
+            return "Unknown"
+        return "Unmerged"
@@ -0,0 +1,187 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import requests
+from github import GithubException  # type: ignore
+
+logger = logging.getLogger("__main__")
+
+# Github's secondary limit for REST reads is 900 points a minute, a GET costs one point.
+DEFAULT_RATE = 15.0
+DEFAULT_BURST = 15
+# Without a Retry-After, Github asks to wait at least a minute after a secondary limit.
+SECONDARY_BACKOFF = 60.0
+# The reset time is in whole seconds, clocks are not exactly in sync.
+RESET_MARGIN = 1.0
+MAX_RETRIES = 5
+# A primary limit resets within the hour.
+MAX_WAIT = 3600.0
+# Github's rate limit resources, each with its own budget per token.
+CORE = "core"
+SEARCH = "search"
+GRAPHQL = "graphql"
+
+
+def parse_tokens(value: Optional[str]) -> List[str]:
+    """
+    API tokens from a comma separated list, as --api-token and GITHUB_API_TOKEN take them.
+    """
+    if not value:
+        return []
+    return [token.strip() for token in value.split(",") if token.strip()]
+
+
+class CTokenBucket:
+    """
+    Paces requests to rate a second, allowing bursts of up to burst requests.
+    """
+
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float]):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.level = float(burst)
+        self.updated = clock()
+
+    def take(self) -> float:
+        """
+        Takes a request from the bucket, returns the seconds to wait before sending it.
+        """
+        now = self.clock()
+        self.level = min(float(self.burst), self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        # Going below zero reserves the slot, concurrent callers queue up behind it.
+        self.level -= 1
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+
+class CTokenState:
+    """
+    Rate limit of one API token for one resource, as reported by the X-RateLimit-* headers of
+    its last response.
+    """
+
+    def __init__(self, token: Optional[str], resource: str = CORE):
+        self.token = token
+        self.resource = resource
+        # Unknown until the first response.
+        self.remaining: Optional[int] = None
+        self.reset = 0.0
+        self.blocked_until = 0.0
+        self.backoff = SECONDARY_BACKOFF
+
+    def available_at(self) -> float:
+        if self.remaining is not None and self.remaining <= 0:
+            return max(self.blocked_until, self.reset + RESET_MARGIN)
+        return self.blocked_until
+
+
+class CRateLimiter:
+    """
+    Schedules the Github requests over a pool of API tokens within their rate limits.
+
+    Each request goes out with the token with the most requests left, a token out of requests or
+    hit by a secondary limit sits out until its reset or Retry-After. The requests are paced
+    with a token bucket so the secondary limit is not hit in the first place.
+
+    The core (REST), search and GraphQL resources are tracked apart, by the resource Github
+    reports in X-RateLimit-Resource, a GraphQL budget running out leaves REST requests alone.
+    """
+
+    def __init__(
+        self,
+        tokens: Sequence[str],
+        rate: float = DEFAULT_RATE,
+        burst: int = DEFAULT_BURST,
+        max_retries: int = MAX_RETRIES,
+        max_wait: float = MAX_WAIT,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        # Anonymous requests have a limit too.
+        self.tokens: List[Optional[str]] = list(tokens) or [None]
+        # By resource, in the order of the tokens, created as the resources get used.
+        self.resources: Dict[str, List[CTokenState]] = {}
+        self.states = self._states(CORE)
+        self.bucket = CTokenBucket(rate, burst, clock)
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.waited = 0.0
+
+    def _states(self, resource: str) -> List[CTokenState]:
+        states = self.resources.get(resource)
+        if states is None:
+            states = self.resources[resource] = [
+                CTokenState(token, resource) for token in self.tokens
+            ]
+        return states
+
+    def acquire(self, resource: str = CORE) -> CTokenState:
+        """
+        Token to send the next request for the resource with, waits for its rate limits to
+        allow it.
+        """
+        with self.lock:
+            now = self.clock()
+            states = self._states(resource)
+            for state in states:
+                if state.remaining is not None and state.remaining <= 0 and state.reset <= now:
+                    state.remaining = None
+            state = min(
+                states,
+                key=lambda state: (
+                    max(state.available_at(), now),
+                    -(state.remaining if state.remaining is not None else float("inf")),
+                ),
+            )
+            wait = max(0.0, state.available_at() - now)
+            if wait > self.max_wait:
+                raise GithubException(
+                    403, {"message": f"API rate limit exceeded, it resets in {wait:.0f}s"}, {}
+                )
+            if state.remaining is not None:
+                # Claimed now, concurrent requests go to other tokens.
+                state.remaining -= 1
+            wait = max(wait, self.bucket.take())
+            self.waited += wait
+        if wait > 0:
+            if wait >= 1:
+                logger.debug(f"Rate limited, waiting {wait:.1f}s")
+            self.sleep(wait)
+        return state
+
+    def update(self, state: CTokenState, response: requests.Response) -> bool:
+        """
+        Records the limits reported by the response, True if it was rate limited and should be
+        sent again.
+        """
+        headers = response.headers
+        with self.lock:
+            resource = headers.get("X-RateLimit-Resource", state.resource)
+            if resource != state.resource:
+                # Sent for another resource than expected, its own budget is the one reported.
+                state = next(s for s in self._states(resource) if s.token == state.token)
+            if "X-RateLimit-Remaining" in headers:
+                state.remaining = int(headers["X-RateLimit-Remaining"])
+                state.reset = float(headers.get("X-RateLimit-Reset", 0))
+            if response.status_code not in (403, 429):
+                state.backoff = SECONDARY_BACKOFF
+                return False
+            if "Retry-After" in headers:
+                retry_after = float(headers["Retry-After"])
+            elif state.remaining == 0:
+                # Primary limit, the token sits out until its reset.
+                return True
+            elif b"rate limit" in response.content.lower():
+                retry_after = state.backoff
+                state.backoff *= 2
+            else:
+                # Forbidden, not rate limited.
+                return False
+            state.blocked_until = self.clock() + retry_after
+            return True
@@ -0,0 +1,254 @@
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+import requests
+from github import GithubException  # type: ignore
+
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+from lk_compat_helper.errors import CResolveError, to_resolve_error
+from lk_compat_helper.tag_version import is_rc
+
+# Status of a Resolution.
+RELEASE = "release"
+RC = "rc"
+UNMERGED = "unmerged"
+UNKNOWN = "unknown"
+# The commits of a batch fetched at once, within Github's concurrency limits.
+DEFAULT_MAX_WORKERS = 16
+
+
+class Resolution(NamedTuple):
+    commit: str
+    # Earliest tag with the commit, None if it is unmerged, only in RCs or unknown.
+    tag: Optional[str]
+    status: str
+    # Known once the commit is fetched or found in a cache.
+    sha: Optional[str] = None
+    commit_date: Optional[datetime] = None
+
+    @classmethod
+    def of(
+        cls,
+        commit: str,
+        tag: str,
+        sha: Optional[str] = None,
+        commit_date: Optional[datetime] = None,
+        lookup_failed: bool = True,
+    ) -> "Resolution":
+        """
+        Resolution from the tag the lookups answer, "Unmerged" and "Unknown" included.
+
+        The lookups also answer "Unknown" for a commit only in RCs so far, it has the rc status
+        unless the lookup failed (see CLinuxKernelRepo.lookup_failed).
+        """
+        if tag == "Unmerged":
+            return cls(commit, None, UNMERGED, sha, commit_date)
+        if tag == "Unknown":
+            return cls(commit, None, UNKNOWN if lookup_failed else RC, sha, commit_date)
+        return cls(commit, tag, RC if is_rc(tag) else RELEASE, sha, commit_date)
+
+    @property
+    def answer(self) -> str:
+        """
+        The tag as the lookups answer it, the reverse of of.
+        """
+        if self.tag is not None:
+            return self.tag
+        return "Unknown" if self.status == RC else self.status.capitalize()
+
+
+# What resolve_iter yields for each commit.
+Result = Union[Resolution, CResolveError]
+
+
+def to_record(result: Result) -> Dict[str, Any]:
+    """
+    JSON Lines record of a resolution or of the error resolving a commit.
+    """
+    if isinstance(result, CResolveError):
+        return {"commit": result.commit, "error": str(result), "status": result.status}
+    record = result._asdict()
+    if result.commit_date is not None:
+        record["commit_date"] = result.commit_date.isoformat() + "Z"
+    return record
+
+
+class CResolver:
+    """
+    Commit to release resolver to embed in a long running process, rather than starting
+    lk-get-tag per commit.
+
+    One instance shares its Github session, tags and caches between the threads using it: the
+    commits are fetched concurrently, the tags are searched one lookup at a time. Failures are
+    raised as CResolveError (CCommitNotFoundError for a commit Github does not have), never exit
+    the process. Takes the options of CLinuxKernelRepo.
+    """
+
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        cache_dir: Optional[str] = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        repo: Optional[CLinuxKernelRepo] = None,
+        **kwargs: Any,
+    ):
+        # An existing repo, as lk-get-tag sets it up, or one made with the options given.
+        self.repo = repo if repo is not None else CLinuxKernelRepo(token, "", cache_dir, **kwargs)
+        self.max_workers = max_workers
+        self.repo.resize_pool(max_workers)
+        # The tags, the tag probes and the caches' connections.
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def _errors(self, commit: Optional[str] = None) -> Iterator[None]:
+        try:
+            yield
+        except (GithubException, requests.RequestException) as e:
+            raise to_resolve_error(e, commit) from e
+
+    def _commit_details(self, commit: str) -> Tuple[str, datetime]:
+        repo = self.repo
+        with self.lock, self._errors(commit):
+            details = repo.take_prefetched(commit)
+            if details is None and repo.commit_cache is not None:
+                details = repo.commit_cache.get(commit)
+                if details is not None:
+                    repo.stats.count("commit_cache_hits")
+        if details is not None:
+            return details
+        with self._errors(commit), repo.stats.phase("commit_fetch"):
+            sha, commit_date = repo.fetch_commit(commit)
+        if repo.commit_cache is not None:
+            with self.lock:
+                repo.commit_cache.put(sha, commit_date)
+        return (sha, commit_date)
+
+    def _resolve_locally(self, commit: str) -> Resolution:
+        # From linux.git or the snapshot, Github only for what they miss.
+        repo = self.repo
+        with self.lock, self._errors(commit):
+            tag = next(repo.get_tags_for_commits([commit]))[1]
+            return Resolution.of(commit, tag, repo.commit_sha, repo.commit_date, repo.lookup_failed)
+
+    def resolve(self, commit: str) -> Resolution:
+        """
+        Earliest release with the commit, a SHA or a unique abbreviation of one.
+        """
+        repo = self.repo
+        if repo.local_repo is not None or repo.snapshot is not None:
+            return self._resolve_locally(commit)
+        sha, commit_date = self._commit_details(commit)
+        repo.stats.count("lookups")
+        with self.lock, self._errors():
+            tag = repo.get_tags_for_dates([commit_date])[0]
+            lookup_failed = repo.lookup_failed
+        return Resolution.of(commit, tag, sha, commit_date, lookup_failed)
+
+    def resolve_many(self, commits: Sequence[str]) -> List[Resolution]:
+        """
+        Resolution of each commit, in the order given, the first failure is raised.
+
+        The commits are fetched 100 a GraphQL query with a token, max_workers at once without,
+        and their dates resolved in one batch.
+        """
+        repo = self.repo
+        if repo.local_repo is not None or repo.snapshot is not None:
+            return [self._resolve_locally(commit) for commit in commits]
+        with self.lock, self._errors():
+            repo.prefetch_commits(commits)
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            details = list(executor.map(self._commit_details, commits))
+        repo.stats.count("lookups", len(commits))
+        with self.lock, self._errors():
+            tags = repo.get_tags_for_dates([commit_date for _, commit_date in details])
+            lookup_failed = repo.lookup_failed
+        return [
+            Resolution.of(commit, tag, sha, commit_date, lookup_failed)
+            for commit, tag, (sha, commit_date) in zip(commits, tags, details)
+        ]
+
+    def _prefetch(self, commits: Iterable[str]) -> None:
+        if self.repo.local_repo is not None or self.repo.snapshot is not None:
+            return
+        try:
+            with self.lock, self._errors():
+                self.repo.prefetch_commits(commits)
+        except CResolveError:
+            # The lookups fetch the commits one by one, each reporting its own failure.
+            pass
+
+    def _try_resolve(self, commit: str) -> Result:
+        try:
+            return self.resolve(commit)
+        except CResolveError as e:
+            # Failed listing the tags, the record is still the commit's.
+            return to_resolve_error(e, commit)
+
+    def resolve_iter(
+        self, commits: Iterable[str], jobs: int = DEFAULT_MAX_WORKERS, ordered: bool = False
+    ) -> Iterator[Result]:
+        """
+        Resolve the commits jobs at a time, yields the Resolution of each, or the CResolveError
+        it failed with, as soon as it is ready, in the order given if ordered.
+
+        The commits are read as the lookups go, 2 * jobs at a time, and at most 2 * jobs are
+        pending at once, so an input of any length takes the same memory. With a token, each
+        window read is fetched in one GraphQL query before its lookups start.
+        """
+        commits = iter(commits)
+        window = 2 * jobs
+        # Read but not submitted yet, already prefetched.
+        ahead: Deque[str] = deque()
+        with ThreadPoolExecutor(jobs) as executor:
+
+            def submit(count: int) -> List["Future[Result]"]:
+                futures: List["Future[Result]"] = []
+                while len(futures) < count:
+                    if not ahead:
+                        ahead.extend(islice(commits, window))
+                        if not ahead:
+                            break
+                        self._prefetch(ahead)
+                    futures.append(executor.submit(self._try_resolve, ahead.popleft()))
+                return futures
+
+            if ordered:
+                queue: Deque["Future[Result]"] = deque(submit(window))
+                while queue:
+                    result = queue.popleft().result()
+                    queue.extend(submit(1))
+                    yield result
+                return
+            pending: Set["Future[Result]"] = set(submit(window))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                pending.update(submit(len(done)))
+                for future in done:
+                    yield future.result()
+
+    def refresh(self) -> None:
+        """
+        Pick up the releases made since the tags were loaded, the lookups go on meanwhile.
+        """
+        with self._errors():
+            tags = self.repo.fetch_tags()
+        with self.lock:
+            self.repo.swap_tags(tags)
@@ -0,0 +1,238 @@
+import base64
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, List, Literal, Optional, Tuple
+from urllib.parse import urlparse
+
+from lk_compat_helper.graphql import parse_date
+from lk_compat_helper.tag_index import to_epoch
+from lk_compat_helper.tag_timeline import CTagTimeline
+from lk_compat_helper.transport import IMMUTABLE_URL, CResponseCache
+
+MAGIC = b"LKTS"
+VERSION = 1
+# magic, version, number of tags, number of commits, size of the tag names, creation time
+HEADER = struct.Struct("<4sIIIIq")
+SNAPSHOT_NAME = "snapshot.lkts"
+SHA_LEN = 20
+ArrayFormat = Literal["B", "I", "b", "i", "q"]
+# Sections start 8 byte aligned, the int64 ones are read in place.
+ALIGN = 8
+
+
+def default_snapshot_path(cache_dir: str) -> str:
+    return os.path.join(cache_dir, SNAPSHOT_NAME)
+
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _layout(num_tags: int, num_commits: int, names_len: int) -> List[Tuple[int, int]]:
+    """
+    (offset, size) of the sections: negated tag epochs, releases, RC flags, name offsets, names,
+    commit SHAs and commit epochs.
+    """
+    sizes = [
+        num_tags * 8,
+        num_tags * 4,
+        num_tags,
+        (num_tags + 1) * 4,
+        names_len,
+        num_commits * SHA_LEN,
+        num_commits * 8,
+    ]
+    sections = []
+    offset = _aligned(HEADER.size)
+    for size in sizes:
+        sections.append((offset, size))
+        offset = _aligned(offset + size)
+    return sections
+
+
+def _check_byteorder() -> None:
+    # The arrays are written and mapped in the host's order, snapshots are little endian.
+    if sys.byteorder != "little":  # pragma: no cover
+        raise ValueError("snapshots are only supported on little endian hosts")
+
+
+def write_snapshot(
+    path: str, tags: Iterable[Tuple[str, datetime]], commit_dates: Dict[str, datetime]
+) -> None:
+    """
+    Write the tag timeline and the commit dates to path, replacing it atomically.
+
+    The tags are ordered by date, newest first, which is the order the timeline searches.
+    """
+    _check_byteorder()
+    dated_tags = sorted(((name, to_epoch(date)) for name, date in tags), key=lambda tag: -tag[1])
+    timeline = CTagTimeline.build(
+        [name for name, _ in dated_tags], [epoch for _, epoch in dated_tags]
+    )
+    encoded = [name.encode() for name in timeline.names]
+    name_offsets = array("I", [0])
+    for name in encoded:
+        name_offsets.append(name_offsets[-1] + len(name))
+    commits = sorted((bytes.fromhex(sha), to_epoch(date)) for sha, date in commit_dates.items())
+    sections = [
+        timeline.neg_epochs.tobytes(),
+        timeline.releases.tobytes(),
+        timeline.rc.tobytes(),
+        name_offsets.tobytes(),
+        b"".join(encoded),
+        b"".join(sha for sha, _ in commits),
+        array("q", [epoch for _, epoch in commits]).tobytes(),
+    ]
+    layout = _layout(len(timeline), len(commits), len(sections[4]))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "wb") as snapshot_file:
+        snapshot_file.write(
+            HEADER.pack(
+                MAGIC, VERSION, len(timeline), len(commits), len(sections[4]), int(time.time())
+            )
+        )
+        for (offset, _), data in zip(layout, sections):
+            snapshot_file.seek(offset)
+            snapshot_file.write(data)
+        snapshot_file.truncate(layout[-1][0] + layout[-1][1])
+    os.replace(tmp_path, path)
+
+
+def cached_commit_dates(cache: CResponseCache) -> Dict[str, datetime]:
+    """
+    Committer dates of the commits in the response cache, by full SHA.
+    """
+    commit_dates = {}
+    for entry in cache.entries():
+        if entry.get("status") != 200 or not IMMUTABLE_URL.search(urlparse(entry["url"]).path):
+            continue
+        body = json.loads(base64.b64decode(entry["body"]))
+        # /commits/<sha> wraps the git commit, /git/commits/<sha> is the git commit.
+        commit = body.get("commit", body)
+        commit_dates[body["sha"]] = parse_date(commit["committer"]["date"])
+    return commit_dates
+
+
+class CSnapshot:
+    """
+    Tag timeline and commit dates mapped from a snapshot file, answering without any network.
+
+    The arrays are read in place from the mapping, only the tag names are decoded on load.
+    """
+
+    def __init__(self, path: str):
+        _check_byteorder()
+        self.path = path
+        self.views: List[memoryview] = []
+        with open(path, "rb") as snapshot_file:
+            try:
+                self.data = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"{path}: not a snapshot, the file is empty")
+        try:
+            self._load()
+        except (ValueError, struct.error) as e:
+            self.close()
+            raise ValueError(f"{path}: not a valid snapshot, {e}")
+
+    def _view(self, offset: int, size: int, fmt: ArrayFormat = "B") -> memoryview:
+        view = memoryview(self.data)[offset : offset + size].cast(fmt)
+        self.views.append(view)
+        return view
+
+    def _load(self) -> None:
+        magic, version, num_tags, num_commits, names_len, created = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError("bad magic")
+        if version != VERSION:
+            raise ValueError(f"unsupported version {version}")
+        layout = _layout(num_tags, num_commits, names_len)
+        if len(self.data) < layout[-1][0] + layout[-1][1]:
+            raise ValueError("truncated")
+        self.created = created
+        (
+            (epochs_at, epochs_size),
+            (releases_at, releases_size),
+            (rc_at, rc_size),
+            (name_offsets_at, name_offsets_size),
+            (names_at, _),
+            (shas_at, shas_size),
+            (commit_epochs_at, commit_epochs_size),
+        ) = layout
+        name_offsets = self._view(name_offsets_at, name_offsets_size, "I")
+        names = [
+            sys.intern(
+                self.data[names_at + name_offsets[idx] : names_at + name_offsets[idx + 1]].decode()
+            )
+            for idx in range(num_tags)
+        ]
+        self.timeline = CTagTimeline(
+            names,
+            self._view(epochs_at, epochs_size, "q"),
+            self._view(rc_at, rc_size, "b"),
+            self._view(releases_at, releases_size, "i"),
+        )
+        self.num_commits = num_commits
+        self.shas = self._view(shas_at, shas_size)
+        self.commit_epochs = self._view(commit_epochs_at, commit_epochs_size, "q")
+
+    def close(self) -> None:
+        # The mapping can only be closed once nothing points into it.
+        self.timeline = None  # type: ignore
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+        self.data.close()
+
+    def _sha(self, pos: int) -> bytes:
+        return bytes(self.shas[pos * SHA_LEN : (pos + 1) * SHA_LEN])
+
+    def commit_epoch(self, commit: str) -> Optional[int]:
+        """
+        Committer date of the commit in epoch seconds, abbreviated SHAs are accepted if unique.
+        """
+        if len(commit) < 4 or len(commit) > SHA_LEN * 2:
+            return None
+        try:
+            prefix = bytes.fromhex(commit if len(commit) % 2 == 0 else commit + "0")
+        except ValueError:
+            return None
+        low, high = 0, self.num_commits
+        while low < high:
+            mid = (low + high) // 2
+            if self._sha(mid) < prefix:
+                low = mid + 1
+            else:
+                high = mid
+        matches = [
+            pos
+            for pos in range(low, min(low + 2, self.num_commits))
+            if self._sha(pos).hex().startswith(commit.lower())
+        ]
+        if len(matches) != 1:
+            return None
+        return self.commit_epochs[matches[0]]
+
+
+def import_snapshot(path: str, cache_dir: str) -> str:
+    """
+    Check the snapshot and install it in the cache directory, returns where it was installed.
+    """
+    CSnapshot(path).close()
+    os.makedirs(cache_dir, exist_ok=True)
+    dest = default_snapshot_path(cache_dir)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as dest_file, open(path, "rb") as snapshot_file:
+        shutil.copyfileobj(snapshot_file, dest_file)
+    os.replace(tmp_path, dest)
+    return dest
@@ -0,0 +1,206 @@
+import bisect
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+
+from lk_compat_helper.errors import github_json
+from lk_compat_helper.graphql import CGraphQLClient, parse_date
+from lk_compat_helper.tag_index import DEFAULT_MAX_AGE, CTagIndex, TagEntry, to_epoch
+from lk_compat_helper.tag_pages import API_URL
+from lk_compat_helper.tag_version import parse_version, sort_by_version
+
+logger = logging.getLogger("__main__")
+
+STABLE_REPO = "gregkh/linux"
+SERIES = re.compile(r"(\d+)\.(\d+)")
+# "commit <sha> upstream." as Greg's scripts write it, "[ Upstream commit <sha> ]" as others do.
+UPSTREAM_TRAILER = re.compile(r"^\s*\[?\s*(?:upstream commit|commit) ([0-9a-f]{40})", re.I | re.M)
+# The commit listing is capped at 100 commits a page.
+COMMITS_PER_PAGE = 100
+# A backport is committed after the mainline commit, usually within weeks. The branch is listed a
+# window at a time from there, up to the first window with a backport.
+BACKPORT_WINDOW = timedelta(days=30)
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+NOT_BACKPORTED = "Unmerged"
+
+# (stable commit SHA, committer date)
+Backport = Tuple[str, datetime]
+
+
+def parse_series(value: str) -> List[str]:
+    """
+    Stable series from a comma separated list (5.10,5.15), as --stable takes them.
+    """
+    series = [item.strip().lstrip("v") for item in value.split(",") if item.strip()]
+    for item in series:
+        if not SERIES.fullmatch(item):
+            raise ValueError(f"{item} is not a stable series, expected major.minor (5.10)")
+    return series
+
+
+def upstream_commits(message: str) -> List[str]:
+    """
+    Mainline commits a stable commit says it backports.
+    """
+    return [sha.lower() for sha in UPSTREAM_TRAILER.findall(message)]
+
+
+class CStableRepo:
+    """
+    First point release of each stable series (v5.10.23) carrying the backport of a mainline fix.
+
+    The tags of each series are listed with their dates through GraphQL and kept in a tag index
+    per series, synced incrementally. The backports are found by their upstream trailer in the
+    commits of the series' branch (linux-5.10.y) made after the mainline commit, the commit search
+    only covers the default branch. The release after a backport's date is then checked to contain
+    it with a compare, so a lookup costs a page of the branch per 100 commits listed and about one
+    compare per series.
+    """
+
+    def __init__(
+        self,
+        graphql: CGraphQLClient,
+        token: Optional[str],
+        api_url: str = API_URL,
+        session: Optional[requests.Session] = None,
+        cache_dir: Optional[str] = None,
+        index_max_age: int = DEFAULT_MAX_AGE,
+        repo_name: str = STABLE_REPO,
+        timeout: int = 15,
+    ):
+        self.graphql = graphql
+        self.api_url = api_url
+        self.session = session or requests.Session()
+        self.headers = {"Authorization": f"token {token}"} if token else {}
+        self.cache_dir = cache_dir
+        self.index_max_age = index_max_age
+        self.repo_name = repo_name
+        self.timeout = timeout
+        self.series_tags: Dict[str, List[TagEntry]] = {}
+
+    def _get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        response = self.session.get(
+            f"{self.api_url}{path}", params=params, headers=self.headers, timeout=self.timeout
+        )
+        return github_json(response)
+
+    def _list_series(self, series: str) -> List[TagEntry]:
+        listing = self.graphql.iter_tags(self.repo_name, query=f"v{series}.")
+        if self.cache_dir is None:
+            return list(listing)
+        path = os.path.join(self.cache_dir, "stable", f"v{series}.sqlite")
+        tag_index = CTagIndex(path, self.index_max_age)
+        try:
+            if not tag_index.is_fresh():
+                num_new_tags = tag_index.sync(listing, force=False)
+                logger.debug(f"v{series} index synced, {num_new_tags} new tags")
+            return tag_index.get_tags()
+        finally:
+            tag_index.close()
+
+    def get_series_tags(self, series: str) -> List[TagEntry]:
+        """
+        Point releases of the series, newest version first.
+        """
+        tags = self.series_tags.get(series)
+        if tags is None:
+            # The query matches v5.10.1 but also v5.100.1 or v5.10.1-rc1 should they exist.
+            pattern = re.compile(rf"v{re.escape(series)}\.\d+")
+            tags = sort_by_version(
+                tag for tag in self._list_series(series) if pattern.fullmatch(tag.name)
+            )
+            self.series_tags[series] = tags
+        return tags
+
+    def _list_branch(self, series: str, since: datetime, until: datetime) -> Iterator[Any]:
+        params = {
+            "sha": f"linux-{series}.y",
+            "since": since.strftime(DATE_FORMAT),
+            "until": until.strftime(DATE_FORMAT),
+            "per_page": COMMITS_PER_PAGE,
+        }
+        page = 1
+        while True:
+            items = self._get(f"/repos/{self.repo_name}/commits", {**params, "page": page})
+            yield from items
+            if len(items) < COMMITS_PER_PAGE:
+                return
+            page += 1
+
+    def find_backports(self, sha: str, commit_date: datetime, series: str) -> List[Backport]:
+        """
+        Commits of the series' branch carrying the upstream trailer of the mainline commit, oldest
+        first.
+
+        The branch is listed BACKPORT_WINDOW at a time from the mainline commit's date, until a
+        window has a backport or the last release of the series is passed.
+        """
+        dates = [tag.date for tag in self.get_series_tags(series) if tag.date is not None]
+        since = commit_date
+        while dates and since <= max(dates):
+            until = since + BACKPORT_WINDOW
+            # Both bounds are inclusive, a commit on one is listed twice.
+            backports = {
+                item["sha"]: parse_date(item["commit"]["committer"]["date"])
+                for item in self._list_branch(series, since, until)
+                if sha in upstream_commits(item["commit"]["message"])
+            }
+            if backports:
+                return sorted(backports.items(), key=lambda backport: backport[1])
+            since = until
+        return []
+
+    def _contains(self, tag: str, sha: str) -> bool:
+        comparison = self._get(f"/repos/{self.repo_name}/compare/{sha}...{tag}")
+        return comparison["status"] in ("ahead", "identical")
+
+    def _first_release(self, tags: List[TagEntry], backport: Backport) -> Optional[str]:
+        # Oldest first, a release made before the backport was committed cannot contain it.
+        dated = [(to_epoch(tag.date), tag.name) for tag in reversed(tags) if tag.date is not None]
+        low = bisect.bisect_left(dated, (to_epoch(backport[1]), ""))
+        if low == len(dated):
+            return None
+        # Usually the first release after it, the backport of another series is in neither.
+        if self._contains(dated[low][1], backport[0]):
+            return dated[low][1]
+        high = len(dated) - 1
+        if low == high or not self._contains(dated[high][1], backport[0]):
+            return None
+        # Committed well before it was queued, the first release containing it is further on.
+        low += 1
+        while low < high:
+            mid = (low + high) // 2
+            if self._contains(dated[mid][1], backport[0]):
+                high = mid
+            else:
+                low = mid + 1
+        return dated[high][1]
+
+    def get_stable_tags(
+        self, sha: str, commit_date: datetime, mainline_tag: str, series: Sequence[str]
+    ) -> Dict[str, str]:
+        """
+        First release of each series with the mainline commit, by series.
+
+        A series branched after the mainline release has it from the start (v5.10), a series
+        without the backport gets "Unmerged".
+        """
+        mainline = parse_version(mainline_tag)
+        stable_tags = {}
+        for name in series:
+            series_version = parse_version(f"v{name}")
+            if mainline is not None and series_version is not None and mainline <= series_version:
+                stable_tags[name] = f"v{name}"
+                continue
+            tags = self.get_series_tags(name)
+            stable_tags[name] = NOT_BACKPORTED
+            for backport in self.find_backports(sha, commit_date, name):
+                tag = self._first_release(tags, backport)
+                if tag is not None:
+                    stable_tags[name] = tag
+                    break
+        return stable_tags
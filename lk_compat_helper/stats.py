@@ -0,0 +1,88 @@
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List
+
+# Prefix of the metrics written for the Prometheus node exporter's textfile collector.
+METRIC_PREFIX = "lk_get_tag"
+
+
+class CStats:
+    """
+    Counters, gauges and per phase timers of a resolver, shared by its threads.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, float] = {}
+        # Phase name: [calls, seconds]
+        self.phases: Dict[str, List[float]] = {}
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name: str, value: float) -> None:
+        with self.lock:
+            self.gauges[name] = value
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Times the block as the named phase, nested phases are counted in both.
+        """
+        start = self.clock()
+        try:
+            yield
+        finally:
+            elapsed = self.clock() - start
+            with self.lock:
+                calls_seconds = self.phases.setdefault(name, [0, 0.0])
+                calls_seconds[0] += 1
+                calls_seconds[1] += elapsed
+
+    def report(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "counters": dict(sorted(self.counters.items())),
+                "gauges": dict(sorted(self.gauges.items())),
+                "phases": {
+                    name: {"calls": int(calls), "seconds": round(seconds, 6)}
+                    for name, (calls, seconds) in sorted(self.phases.items())
+                },
+            }
+
+    def to_prometheus(self) -> str:
+        report = self.report()
+        lines = []
+        for name, value in report["counters"].items():
+            metric = f"{METRIC_PREFIX}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, value in report["gauges"].items():
+            metric = f"{METRIC_PREFIX}_{name}"
+            lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        if report["phases"]:
+            for suffix, key in (("calls_total", "calls"), ("seconds_total", "seconds")):
+                metric = f"{METRIC_PREFIX}_phase_{suffix}"
+                lines.append(f"# TYPE {metric} counter")
+                lines += [
+                    f'{metric}{{phase="{name}"}} {phase[key]}'
+                    for name, phase in report["phases"].items()
+                ]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Write the metrics as a Prometheus textfile, replacing it atomically so the collector never
+        reads a partial file.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as prom_file:
+            prom_file.write(self.to_prometheus())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
@@ -0,0 +1,133 @@
+import calendar
+from datetime import datetime, timezone
+import os
+import sqlite3
+import time
+from typing import Iterable, List, NamedTuple, Optional
+
+from lk_compat_helper.file_lock import file_lock
+
+# Tags only get added at the head of torvalds/linux, re-list at most once an hour.
+DEFAULT_MAX_AGE = 3600
+# Seconds to wait for a sync in another connection or process to commit.
+BUSY_TIMEOUT = 30
+
+
+class TagEntry(NamedTuple):
+    name: str
+    sha: str
+    date: Optional[datetime]
+
+
+def to_epoch(dt: datetime) -> int:
+    return calendar.timegm(dt.utctimetuple())
+
+
+def from_epoch(epoch: int) -> datetime:
+    # PyGithub hands out naive UTC datetimes, keep the index comparable with them.
+    return datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None)
+
+
+def default_cache_dir() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "lk-compat-helper")
+
+
+class CTagIndex:
+    """
+    Persistent index of tag name, tag commit SHA and committer date.
+
+    Tags are stored newest first (highest seq), committer dates are filled in lazily
+    as the tags get probed.
+    """
+
+    def __init__(self, path: str, max_age: int = DEFAULT_MAX_AGE):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_age = max_age
+        # Not thread safe, a CResolver's threads probe it under its lock, a refresh (fetch_tags)
+        # syncs through a connection of its own.
+        self.db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        # Readers keep the tags of the last sync while another connection adds the new ones.
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS tags (
+                seq INTEGER NOT NULL,
+                name TEXT PRIMARY KEY,
+                sha TEXT NOT NULL,
+                date INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS tags_seq ON tags (seq);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def last_sync(self) -> Optional[float]:
+        value = self._get_meta("last_sync")
+        return float(value) if value is not None else None
+
+    def is_fresh(self) -> bool:
+        last_sync = self.last_sync
+        return last_sync is not None and time.time() - last_sync < self.max_age
+
+    def sync(self, tags: Iterable[TagEntry], force: bool = True) -> int:
+        """
+        Add the tags newer than the newest known one, tags are expected newest first.
+
+        Iteration stops at the first known tag, so only the new tags get listed. They are added
+        in one transaction, the other connections see all of them or none.
+
+        One process syncs at a time, the others wait for it. Unless force, they then find the
+        index fresh and list nothing.
+        """
+        with file_lock(self.path + ".lock"):
+            if not force and self.is_fresh():
+                return 0
+            known = {row[0] for row in self.db.execute("SELECT name FROM tags")}
+            new_tags: List[TagEntry] = []
+            for tag in tags:
+                if tag.name in known:
+                    break
+                new_tags.append(tag)
+
+            (max_seq,) = self.db.execute("SELECT COALESCE(MAX(seq), 0) FROM tags").fetchone()
+            with self.db:
+                self.db.executemany(
+                    "INSERT INTO tags (seq, name, sha, date) VALUES (?, ?, ?, ?)",
+                    [
+                        (
+                            max_seq + len(new_tags) - idx,
+                            tag.name,
+                            tag.sha,
+                            to_epoch(tag.date) if tag.date else None,
+                        )
+                        for idx, tag in enumerate(new_tags)
+                    ],
+                )
+                self._set_meta("last_sync", str(time.time()))
+            return len(new_tags)
+
+    def get_tags(self) -> List[TagEntry]:
+        return [
+            TagEntry(name, sha, from_epoch(date) if date is not None else None)
+            for name, sha, date in self.db.execute(
+                "SELECT name, sha, date FROM tags ORDER BY seq DESC"
+            )
+        ]
+
+    def set_date(self, name: str, date: datetime) -> None:
+        with self.db:
+            self.db.execute("UPDATE tags SET date = ? WHERE name = ?", (to_epoch(date), name))
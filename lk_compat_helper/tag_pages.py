@@ -0,0 +1,103 @@
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from lk_compat_helper.errors import github_json
+from lk_compat_helper.tag_index import TagEntry
+
+API_URL = "https://api.github.com"
+# Largest page the REST API serves.
+PER_PAGE = 100
+MAX_CACHED_PAGES = 16
+
+
+class CTagPages:
+    """
+    Random access to the REST tag listing, fetching only the pages the indices land on.
+
+    The number of pages is learnt from the Link: rel="last" header of the first page, so unlike
+    PaginatedList indexing (and totalCount) a binary search touches O(log n) pages.
+    """
+
+    def __init__(
+        self,
+        token: Optional[str],
+        repo_name: str,
+        api_url: str = API_URL,
+        session: Optional[requests.Session] = None,
+        per_page: int = PER_PAGE,
+        max_cached_pages: int = MAX_CACHED_PAGES,
+        timeout: int = 15,
+    ):
+        self.url = f"{api_url}/repos/{repo_name}/tags"
+        self.session = session or requests.Session()
+        self.headers = {"Authorization": f"token {token}"} if token else {}
+        self.per_page = per_page
+        self.max_cached_pages = max_cached_pages
+        self.timeout = timeout
+        self.pages: "OrderedDict[int, List[TagEntry]]" = OrderedDict()
+        self.num_pages: Optional[int] = None
+        self.num_tags: Optional[int] = None
+
+    def _request_page(self, page: int) -> List[TagEntry]:
+        response = self.session.get(
+            self.url,
+            params={"per_page": self.per_page, "page": page},
+            headers=self.headers,
+            timeout=self.timeout,
+        )
+        tags = github_json(response)
+        if self.num_pages is None:
+            self.num_pages = self._parse_last_page(response.links) or page
+        return [TagEntry(tag["name"], tag["commit"]["sha"], None) for tag in tags]
+
+    @staticmethod
+    def _parse_last_page(links: Dict[str, Dict[str, str]]) -> Optional[int]:
+        last = links.get("last")
+        if last is None:
+            return None
+        return int(parse_qs(urlparse(last["url"]).query)["page"][0])
+
+    def get_page(self, page: int) -> List[TagEntry]:
+        """
+        Page (1 based) of tags, the most recently used pages are kept.
+        """
+        tags = self.pages.get(page)
+        if tags is not None:
+            self.pages.move_to_end(page)
+            return tags
+        tags = self._request_page(page)
+        self.pages[page] = tags
+        if len(self.pages) > self.max_cached_pages:
+            self.pages.popitem(last=False)
+        return tags
+
+    def __len__(self) -> int:
+        if self.num_tags is None:
+            self.get_page(1)
+            assert self.num_pages is not None
+            last_page = self.get_page(self.num_pages)
+            self.num_tags = (self.num_pages - 1) * self.per_page + len(last_page)
+        return self.num_tags
+
+    def __getitem__(self, tag_idx: int) -> TagEntry:
+        if not 0 <= tag_idx < len(self):
+            raise IndexError(tag_idx)
+        return self.get_page(tag_idx // self.per_page + 1)[tag_idx % self.per_page]
+
+    def __setitem__(self, tag_idx: int, tag: TagEntry) -> None:
+        # Keep the dates probed so far, only while the page is cached.
+        tags = self.pages.get(tag_idx // self.per_page + 1)
+        if tags is not None:
+            tags[tag_idx % self.per_page] = tag
+
+    def __iter__(self) -> Iterator[TagEntry]:
+        page = 1
+        while True:
+            tags = self.get_page(page)
+            yield from tags
+            if len(tags) < self.per_page or (self.num_pages is not None and page >= self.num_pages):
+                break
+            page += 1
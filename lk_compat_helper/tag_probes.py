@@ -0,0 +1,42 @@
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from lk_compat_helper.stats import CStats
+from lk_compat_helper.tag_index import to_epoch
+
+# (committer date in epoch seconds, tag name)
+ProbeRecord = Tuple[int, str]
+
+
+class CTagProbes:
+    """
+    Tag dates probed by the binary search, each tag's date is fetched once per resolver.
+    """
+
+    def __init__(self, fetch_date: Callable[[Any, int], datetime], stats: Optional[CStats] = None):
+        self.fetch_date = fetch_date
+        self.stats = stats
+        self.records: Dict[int, ProbeRecord] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def reset(self) -> None:
+        # The indices only hold for the tags they were probed in.
+        self.records.clear()
+
+    def count(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        if self.stats is not None:
+            self.stats.count("tag_probe_hits" if hit else "tag_probe_misses")
+
+    def get(self, tags: Any, tag_idx: int) -> ProbeRecord:
+        record = self.records.get(tag_idx)
+        self.count(record is not None)
+        if record is not None:
+            return record
+        record = (to_epoch(self.fetch_date(tags, tag_idx)), tags[tag_idx].name)
+        self.records[tag_idx] = record
+        return record
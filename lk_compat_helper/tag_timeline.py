@@ -0,0 +1,109 @@
+import sys
+from array import array
+from bisect import bisect_right
+from typing import Any, List, Optional, Sequence
+
+from lk_compat_helper.tag_index import TagEntry, to_epoch
+from lk_compat_helper.tag_version import is_rc
+
+try:
+    import numpy  # type: ignore
+except ImportError:  # pragma: no cover
+    numpy = None  # type: ignore[assignment]
+
+
+class CTagTimeline:
+    """
+    Tag timeline as compact parallel arrays, newest first: epoch seconds, interned names and the
+    nearest release at or after each position (-1 if there is none yet).
+
+    A lookup is a searchsorted on the negated epochs, with NumPy (if installed) a batch of
+    commit dates is resolved in one vectorized search, otherwise with bisect. The answers are the
+    ones of CLinuxKernelRepo's binary search, including "Unknown" for a commit newer than an RC
+    at the head.
+    """
+
+    def __init__(self, names: Sequence[str], neg_epochs: Any, rc: Any, releases: Any):
+        # The arrays are int64, int8 and int32 buffers, array.array or memoryview (snapshots).
+        self.names = names
+        self.neg_epochs = neg_epochs
+        self.rc = rc
+        self.releases = releases
+        self.np_neg_epochs: Any = None
+        self.np_releases: Any = None
+        if numpy is not None:
+            self.np_neg_epochs = numpy.frombuffer(self.neg_epochs, dtype=numpy.int64)
+            self.np_releases = numpy.frombuffer(self.releases, dtype=numpy.int32)
+
+    @classmethod
+    def build(cls, names: Sequence[str], epochs: Sequence[int]) -> "CTagTimeline":
+        """
+        Timeline of tags newest first with their dates in epoch seconds.
+        """
+        names = [sys.intern(name) for name in names]
+        # Negated so the newest first order is ascending, as bisect/searchsorted want.
+        neg_epochs = array("q", (-epoch for epoch in epochs))
+        rc = array("b", (is_rc(name) for name in names))
+        releases = array("i")
+        release = -1
+        for idx in range(len(names)):
+            if not rc[idx]:
+                release = idx
+            releases.append(release)
+        return cls(names, neg_epochs, rc, releases)
+
+    @classmethod
+    def from_tags(cls, tags: Sequence[Any]) -> Optional["CTagTimeline"]:
+        """
+        Timeline of the tags, None unless every tag date is known and they are newest first.
+        """
+        names: List[str] = []
+        epochs: List[int] = []
+        for tag in tags:
+            if not isinstance(tag, TagEntry) or tag.date is None:
+                return None
+            epoch = to_epoch(tag.date)
+            # The binary search only agrees with a sorted timeline.
+            if epochs and epoch > epochs[-1]:
+                return None
+            names.append(tag.name)
+            epochs.append(epoch)
+        if not names:
+            return None
+        return cls.build(names, epochs)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _tag(self, num_newer: int) -> str:
+        # num_newer tags are at or after the commit date, the last of them is the earliest.
+        if num_newer == 0:
+            return "Unknown" if self.rc[0] else "Unmerged"
+        release = self.releases[num_newer - 1]
+        return self.names[release] if release >= 0 else "Unknown"
+
+    def lookup(self, epoch: int) -> str:
+        """
+        Earliest release with a commit made at epoch.
+        """
+        return self._tag(bisect_right(self.neg_epochs, -epoch))
+
+    def lookup_many(self, epochs: Sequence[int]) -> List[str]:
+        """
+        Earliest releases for a batch of commit dates, in one searchsorted with NumPy.
+        """
+        if self.np_neg_epochs is not None:
+            return self._lookup_many_numpy(epochs)
+        return [self.lookup(epoch) for epoch in epochs]
+
+    def _lookup_many_numpy(self, epochs: Sequence[int]) -> List[str]:
+        num_newer = numpy.searchsorted(
+            self.np_neg_epochs, -numpy.asarray(epochs, dtype=numpy.int64), side="right"
+        )
+        # Nearest release for all of them at once, the commits newer than all tags aside.
+        releases = self.np_releases[numpy.maximum(num_newer - 1, 0)]
+        head = self._tag(0)
+        return [
+            (self.names[release] if release >= 0 else "Unknown") if newer else head
+            for newer, release in zip(num_newer.tolist(), releases.tolist())
+        ]
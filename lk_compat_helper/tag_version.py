@@ -0,0 +1,42 @@
+import re
+from typing import Any, Iterable, List, Optional, Tuple
+
+# v2.6.39, v3.0, v5.12-rc3, the 2.6 era had a fourth number only in the stable tree.
+VERSION_TAG = re.compile(r"v(\d+)\.(\d+)(?:\.(\d+))?(?:-rc(\d+))?")
+
+# (major, minor, patch, 0 and the RC number for an RC or 1 and 0 for the release)
+TagVersion = Tuple[int, int, int, int, int]
+
+
+def parse_version(name: str) -> Optional[TagVersion]:
+    """
+    Sortable version of a release or RC tag name, None for the other tags (v2.6.11-tree).
+    """
+    match = VERSION_TAG.fullmatch(name)
+    if match is None:
+        return None
+    major, minor, patch, rc = match.groups()
+    if rc is not None:
+        return (int(major), int(minor), int(patch or 0), 0, int(rc))
+    return (int(major), int(minor), int(patch or 0), 1, 0)
+
+
+def is_rc(name: str) -> bool:
+    version = parse_version(name)
+    if version is None:
+        # Not a version, the listing order's test.
+        return "rc" in name
+    return version[3] == 0
+
+
+def sort_by_version(tags: Iterable[Any]) -> List[Any]:
+    """
+    Release and RC tags newest version first, the other tags are left out.
+    """
+    versioned: List[Tuple[TagVersion, Any]] = []
+    for tag in tags:
+        version = parse_version(tag.name)
+        if version is not None:
+            versioned.append((version, tag))
+    versioned.sort(key=lambda item: item[0], reverse=True)
+    return [tag for _, tag in versioned]
@@ -0,0 +1,393 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Type, TypeVar
+
+import requests
+from github import Github, GithubException  # type: ignore
+from github.Requester import (  # type: ignore
+    HTTPRequestsConnectionClass,
+    HTTPSRequestsConnectionClass,
+)
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from lk_compat_helper.file_lock import CKeyLocks
+from lk_compat_helper.rate_limit import CORE, GRAPHQL, SEARCH, CRateLimiter
+from lk_compat_helper.stats import CStats
+
+# Commits looked up by their full SHA never change.
+IMMUTABLE_URL = re.compile(r"/repos/[^/]+/[^/]+/(git/)?commits/[0-9a-f]{40}$")
+# The cached body is stored decoded, these do not describe it anymore.
+DROPPED_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+CASSETTE_NAME = "cassette.jsonl"
+
+T = TypeVar("T")
+
+
+def _entry(response: requests.Response) -> Dict[str, Any]:
+    return {
+        "status": response.status_code,
+        "reason": response.reason,
+        "headers": {
+            name: value
+            for name, value in response.headers.items()
+            if name.lower() not in DROPPED_HEADERS
+        },
+        "body": base64.b64encode(response.content).decode(),
+    }
+
+
+class CResponseCache:
+    """
+    On disk cache of GET responses, one JSON file per URL with the body, headers and ETag.
+
+    With a lock directory, the processes sharing the cache send a request missing from it once,
+    the others wait for its response.
+    """
+
+    def __init__(self, path: str, lock_dir: Optional[str] = None):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.locks = CKeyLocks(lock_dir) if lock_dir else None
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+    @staticmethod
+    def _load(entry_path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(entry_path) as entry_file:
+                return json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._load(self._entry_path(key))
+
+    def lock(self, key: str) -> ContextManager[None]:
+        return self.locks.lock(key) if self.locks is not None else nullcontext()
+
+    def entries(self) -> Iterator[Dict[str, Any]]:
+        for name in sorted(os.listdir(self.path)):
+            if name.endswith(".json"):
+                entry = self._load(os.path.join(self.path, name))
+                if entry is not None:
+                    yield entry
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        # Written aside and renamed, readers never see a partial entry.
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "w") as entry_file:
+            json.dump(entry, entry_file)
+        os.replace(tmp_path, self._entry_path(key))
+
+
+class CCassette:
+    """
+    Github requests and responses recorded in a directory, then served back from it.
+
+    A request seen several times is answered with its recorded responses in order, the last one
+    again once they run out. Replaying can wait the time each response took when recorded.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        replay: bool = False,
+        latency: bool = False,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.path = path
+        self.replaying = replay
+        self.latency = latency
+        self.sleep = sleep
+        self.file_path = os.path.join(path, CASSETTE_NAME)
+        self.lock = threading.Lock()
+        self.interactions: Dict[str, List[Dict[str, Any]]] = {}
+        self.served: Dict[str, int] = {}
+        if replay:
+            with open(self.file_path) as cassette_file:
+                for line in cassette_file:
+                    interaction = json.loads(line)
+                    self.interactions.setdefault(interaction["key"], []).append(interaction)
+        else:
+            os.makedirs(path, exist_ok=True)
+            # A new recording, the requests of an earlier one are not replayed with it.
+            open(self.file_path, "w").close()
+
+    def record(self, key: str, response: requests.Response) -> None:
+        # The request is kept without its headers, they hold the API token.
+        interaction = {
+            "key": key,
+            "elapsed": response.elapsed.total_seconds(),
+            **_entry(response),
+        }
+        with self.lock, open(self.file_path, "a") as cassette_file:
+            cassette_file.write(json.dumps(interaction) + "\n")
+
+    def replay(self, key: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            interactions = self.interactions.get(key)
+            if not interactions:
+                return None
+            served = self.served.get(key, 0)
+            self.served[key] = served + 1
+            interaction = interactions[min(served, len(interactions) - 1)]
+        if self.latency:
+            self.sleep(interaction["elapsed"])
+        return interaction
+
+
+class CRateLimited(Exception):
+    """
+    A request sent holding a lock was rate limited, it is sent again once the lock is released.
+    """
+
+
+class CGithubAdapter(HTTPAdapter):
+    """
+    Transport for all the Github traffic of a session.
+
+    With a response cache, commits by full SHA are served from it without a request and the
+    other GET requests are revalidated with If-None-Match, a 304 does not count against the rate
+    limit. A response another process got while this one waited for the cache's lock is used as
+    is. The lock is only held for the round trip, the rate limits are waited for without it.
+
+    With a rate limiter, the requests reaching Github are sent with the token it picks and sent
+    again when rate limited. Requests with a token outside the pool are sent as they are.
+
+    With stats, the requests sent, the cache hits and the retries are counted.
+
+    With a cassette, the responses are recorded in it as the callers get them, from Github or
+    from the cache, or answered from it when replaying, without the cache or the rate limiter.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[CResponseCache] = None,
+        rate_limiter: Optional[CRateLimiter] = None,
+        stats: Optional[CStats] = None,
+        cassette: Optional[CCassette] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.stats = stats
+        self.cassette = cassette
+        # By thread, the token a request sent holding a lock waited for beforehand.
+        self.paced = threading.local()
+
+    def resize_pool(self, size: int) -> None:
+        """
+        Keep up to size connections to each host alive, for as many requests in flight.
+        """
+        if size > self._pool_maxsize:
+            self.poolmanager.clear()
+            self.init_poolmanager(size, size, block=self._pool_block)
+
+    def _count(self, name: str) -> None:
+        if self.stats is not None:
+            self.stats.count(name)
+
+    @staticmethod
+    def _header(request: requests.PreparedRequest, name: str, default: str = "") -> str:
+        value = request.headers.get(name, default)
+        return value.decode() if isinstance(value, bytes) else value
+
+    def _cache_key(self, request: requests.PreparedRequest) -> str:
+        return f"{request.url} {self._header(request, 'Accept')}"
+
+    @staticmethod
+    def _cached_response(
+        request: requests.PreparedRequest, entry: Dict[str, Any]
+    ) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry.get("reason", "OK")
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = base64.b64decode(entry["body"])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url or ""
+        response.request = request
+        return response
+
+    def _cassette_key(self, request: requests.PreparedRequest) -> str:
+        # GraphQL posts every query to the same URL.
+        body = request.body.encode() if isinstance(request.body, str) else request.body
+        digest = hashlib.sha256(body if isinstance(body, bytes) else b"").hexdigest()
+        return f"{request.method} {self._cache_key(request)} {digest}"
+
+    def _transmit(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        self._count("http_requests")
+        return super().send(request, **kwargs)
+
+    @staticmethod
+    def _resource(request: requests.PreparedRequest) -> str:
+        path = request.path_url.split("?", 1)[0]
+        if path.endswith("/graphql"):
+            return GRAPHQL
+        return SEARCH if "/search/" in path else CORE
+
+    def send_locked(
+        self, resource: str, lock: Callable[[], ContextManager[None]], send: Callable[[], T]
+    ) -> T:
+        """
+        send() holding lock(), for the request send() makes to go out once among the processes
+        sharing a cache.
+
+        The rate limits for the resource are waited for before taking the lock, and a rate limited
+        request is sent again after releasing it, a process waiting for its limits does not hold
+        the others up.
+        """
+        if self.rate_limiter is None:
+            with lock():
+                return send()
+        retries = 0
+        while True:
+            self.paced.state = self.rate_limiter.acquire(resource)
+            # The last attempt gets the rate limited response as is.
+            self.paced.retry = retries < self.rate_limiter.max_retries
+            try:
+                with lock():
+                    return send()
+            except CRateLimited:
+                self._count("rate_limited_retries")
+                retries += 1
+            finally:
+                self.paced.state = None
+
+    def _pooled(self, request: requests.PreparedRequest) -> bool:
+        # Sent anonymously or with a token of the pool, not with credentials of its own.
+        assert self.rate_limiter is not None
+        credential = self._header(request, "Authorization").partition(" ")[2]
+        return not credential or credential in self.rate_limiter.tokens
+
+    def _send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        paced = getattr(self.paced, "state", None)
+        self.paced.state = None
+        if self.rate_limiter is None or not self._pooled(request):
+            return self._transmit(request, **kwargs)
+        retries = 0
+        while True:
+            state = paced or self.rate_limiter.acquire(self._resource(request))
+            if state.token is not None:
+                # Keep the scheme, REST takes "token" and GraphQL "bearer".
+                scheme = self._header(request, "Authorization", "token").split(" ", 1)[0]
+                request.headers["Authorization"] = f"{scheme} {state.token}"
+            response = self._transmit(request, **kwargs)
+            limited = self.rate_limiter.update(state, response)
+            if limited and paced is not None and self.paced.retry:
+                response.close()
+                raise CRateLimited()
+            if not limited or paced is not None or retries == self.rate_limiter.max_retries:
+                return response
+            self._count("rate_limited_retries")
+            response.close()
+            retries += 1
+
+    def send(  # type: ignore[override]
+        self, request: requests.PreparedRequest, **kwargs: Any
+    ) -> requests.Response:
+        if self.cassette is None:
+            return self._send_cached(request, **kwargs)
+        # Ahead of the cache, a recording holds the answers the run got wherever they came from.
+        key = self._cassette_key(request)
+        if self.cassette.replaying:
+            # Neither cached nor paced, replays do not touch the caches or the rate limits.
+            self._count("http_requests")
+            interaction = self.cassette.replay(key)
+            if interaction is None:
+                raise GithubException(
+                    404,
+                    {"message": f"{request.method} {request.url} is not in {self.cassette.path}"},
+                    None,
+                )
+            return self._cached_response(request, interaction)
+        response = self._send_cached(request, **kwargs)
+        self.cassette.record(key, response)
+        return response
+
+    def _send_cached(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        if self.cache is None or request.method != "GET":
+            return self._send(request, **kwargs)
+
+        key = self._cache_key(request)
+        entry = self.cache.get(key)
+        immutable = IMMUTABLE_URL.search(request.path_url.split("?", 1)[0]) is not None
+        if entry is not None and immutable:
+            self._count("cache_hits")
+            return self._cached_response(request, entry)
+
+        cache = self.cache
+        return self.send_locked(
+            self._resource(request),
+            lambda: cache.lock(key),
+            lambda: self._fetch(request, key, entry, immutable, **kwargs),
+        )
+
+    def _fetch(
+        self,
+        request: requests.PreparedRequest,
+        key: str,
+        entry: Optional[Dict[str, Any]],
+        immutable: bool,
+        **kwargs: Any,
+    ) -> requests.Response:
+        assert self.cache is not None
+        # Fetched by another process while this one waited, as fresh as a request would get.
+        fetched = self.cache.get(key)
+        if fetched is not None and fetched != entry:
+            self._count("cache_hits")
+            return self._cached_response(request, fetched)
+        if entry is not None and entry.get("etag"):
+            request.headers["If-None-Match"] = entry["etag"]
+        response = self._send(request, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            self._count("cache_not_modified")
+            return self._cached_response(request, entry)
+        if response.status_code == 200 and (immutable or "ETag" in response.headers):
+            self.cache.put(
+                key,
+                {"url": request.url, "etag": response.headers.get("ETag"), **_entry(response)},
+            )
+        return response
+
+
+def new_session(adapter: CGithubAdapter) -> requests.Session:
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _connection_class(base: Type[Any], session: requests.Session) -> Type[Any]:
+    class CSessionConnectionClass(base):  # type: ignore
+        def __init__(self, *args: Any, **kwargs: Any):
+            super().__init__(*args, **kwargs)
+            self.session = session
+
+    return CSessionConnectionClass
+
+
+def route_pygithub(handle: Github, session: requests.Session) -> None:
+    """
+    Send the requests of a PyGithub handle through the session, with the rest of the Github
+    traffic. The other PyGithub clients of the process keep their own connections.
+    """
+    # PyGithub's hook, Requester.injectConnectionClasses, is process wide. The connection class
+    # is picked per requester, for its URL scheme, on creation.
+    requester: Any = getattr(handle, "_Github__requester")
+    base: Type[Any] = HTTPRequestsConnectionClass
+    if requester._Requester__scheme == "https":
+        base = HTTPSRequestsConnectionClass
+    requester._Requester__connectionClass = _connection_class(base, session)
+    # A connection a request, as injected connection classes get.
+    requester._Requester__persist = False
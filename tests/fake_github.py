@@ -0,0 +1,435 @@
+import hashlib
+import io
+import json
+import math
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+# (name, sha, committer date), newest first like the Github listing
+FakeTag = Tuple[str, Optional[str], str]
+
+RCS_PER_RELEASE = 7
+STABLE_REPO = "gregkh/linux"
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+DEFAULT_BRANCH = "master"
+
+
+def make_tags(num_tags: int, start: datetime = datetime(2005, 6, 17)) -> List[FakeTag]:
+    """
+    Synthetic kernel like tag history, a release every 8 weeks preceded by weekly RCs.
+    """
+    names: List[str] = []
+    major, minor = 2, 0
+    while len(names) < num_tags:
+        names.extend(f"v{major}.{minor}-rc{rc}" for rc in range(1, RCS_PER_RELEASE + 1))
+        names.append(f"v{major}.{minor}")
+        minor += 1
+        if minor == 20:
+            major, minor = major + 1, 0
+    tags: List[FakeTag] = [
+        (
+            name,
+            hashlib.sha1(name.encode()).hexdigest(),
+            (start + timedelta(weeks=idx)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        )
+        for idx, name in enumerate(names[:num_tags])
+    ]
+    return list(reversed(tags))
+
+
+class CSyntheticCommits:
+    """
+    Commits 0 .. num_commits - 1 evenly spread between two dates, derived rather than stored.
+
+    The first 8 hex digits of a SHA are the commit's number, so a million commits cost no memory
+    and any abbreviation of 8 or more digits is unique.
+    """
+
+    def __init__(self, num_commits: int, start: datetime, end: datetime):
+        self.num_commits = num_commits
+        self.start = start
+        self.step = (end - start) / max(1, num_commits)
+
+    def sha(self, idx: int) -> str:
+        return f"{idx:08x}" + hashlib.sha1(str(idx).encode()).hexdigest()[:32]
+
+    def date(self, idx: int) -> str:
+        return (self.start + self.step * idx).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def lookup(self, commit: str) -> Optional[Tuple[str, str]]:
+        if len(commit) < 8 or not re.fullmatch(r"[0-9a-f]+", commit):
+            return None
+        idx = int(commit[:8], 16)
+        if idx >= self.num_commits or not self.sha(idx).startswith(commit):
+            return None
+        return (self.sha(idx), self.date(idx))
+
+
+class CCountingWriter(io.BufferedIOBase):
+    def __init__(self, raw: Any, fake: "CFakeGithub"):
+        self.raw = raw
+        self.fake = fake
+
+    def write(self, data: Any) -> int:
+        with self.fake.lock:
+            self.fake.bytes_sent += len(data)
+        return self.raw.write(data)
+
+    def flush(self) -> None:
+        self.raw.flush()
+
+
+class CFakeGithubHandler(BaseHTTPRequestHandler):
+    server: "CFakeGithubServer"
+    rate_headers: Dict[str, str] = {}
+
+    def setup(self) -> None:
+        super().setup()
+        self.wfile = CCountingWriter(self.wfile, self.server.fake)
+
+    def _begin(self) -> None:
+        fake = self.server.fake
+        fake.requests.append(f"{self.command} {self.path}")
+        if fake.latency:
+            time.sleep(fake.latency)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _rate_limited(self) -> bool:
+        fake = self.server.fake
+        authorization = self.headers.get("Authorization")
+        fake.authorizations.append(authorization)
+        self.rate_headers = {}
+        if fake.secondary_limited:
+            fake.secondary_limited -= 1
+            self._send_json(
+                403, {"message": "You have exceeded a secondary rate limit."}, {"Retry-After": "2"}
+            )
+            return True
+        if fake.rate_limit is None:
+            return False
+        token = authorization.split()[-1] if authorization else ""
+        path = urlparse(self.path).path
+        resource = "graphql" if path == "/graphql" else "search" if "/search/" in path else "core"
+        # Each resource has its own budget per token.
+        used = fake.used.get((token, resource), 0)
+        limited = used >= fake.rate_limit
+        if not limited:
+            used = fake.used[(token, resource)] = used + 1
+        self.rate_headers = {
+            "X-RateLimit-Resource": resource,
+            "X-RateLimit-Limit": str(fake.rate_limit),
+            "X-RateLimit-Remaining": str(fake.rate_limit - used),
+            "X-RateLimit-Reset": str(fake.reset),
+        }
+        if limited:
+            self._send_json(403, {"message": "API rate limit exceeded"})
+        return limited
+
+    def _send_json(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        headers = {**self.rate_headers, **(headers or {})}
+        data = json.dumps(body).encode()
+        etag = f'"{hashlib.sha1(data).hexdigest()}"'
+        if status == 200 and self.command == "GET" and self.headers.get("If-None-Match") == etag:
+            self.server.fake.not_modified += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if status == 200:
+            self.send_header("ETag", etag)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        self._begin()
+        if self._rate_limited():
+            return
+        url = urlparse(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        if url.path == "/search/commits":
+            self._send_json(200, self.server.fake.search_commits(query["q"]))
+            return
+        if url.path == f"/repos/{STABLE_REPO}/commits":
+            commits = self.server.fake.list_commits(query)
+            if commits is None:
+                self._send_json(404, {"message": "Not Found"})
+            else:
+                self._send_json(200, commits)
+            return
+        compare = re.fullmatch(rf"/repos/{STABLE_REPO}/compare/([\w.]+)\.\.\.([\w.]+)", url.path)
+        if compare is not None:
+            status = self.server.fake.compare(*compare.groups())
+            if status is None:
+                self._send_json(404, {"message": "Not Found"})
+            else:
+                self._send_json(200, {"status": status})
+            return
+        match = re.fullmatch(r"/repos/([^/]+/[^/]+)/(tags|commits/(\w+))", url.path)
+        if match is None:
+            self.send_error(404)
+        elif self.server.fake.tree(match.group(1)) is None:
+            self._send_json(404, {"message": "Not Found"})
+        elif match.group(2) == "tags":
+            self._send_json(200, *self.server.fake.rest_tags(url.path, query, match.group(1)))
+        else:
+            commit = self.server.fake.rest_commit(match.group(3), match.group(1))
+            if commit is None:
+                self._send_json(422, {"message": f"No commit found for SHA: {match.group(3)}"})
+            else:
+                self._send_json(200, commit)
+
+    def do_POST(self) -> None:
+        self._begin()
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length))
+        if self._rate_limited():
+            return
+        if self.path != "/graphql":
+            self.send_error(404)
+            return
+        self._send_json(200, self.server.fake.graphql(request["query"], request["variables"]))
+
+
+class CFakeGithubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Concurrent clients open many connections at once.
+    request_queue_size = 128
+
+    def __init__(self, fake: "CFakeGithub"):
+        super().__init__(("127.0.0.1", 0), CFakeGithubHandler)
+        self.fake = fake
+
+
+class CFakeGithub:
+    """
+    Local stand-in for the Github API serving a synthetic tag history.
+    """
+
+    def __init__(self, tags: List[FakeTag]):
+        self.tags = tags
+        # Commits by full SHA, the tags' commits and any added by the tests.
+        self.commits: Dict[str, str] = {sha: date for _, sha, date in tags if sha}
+        self.requests: List[str] = []
+        self.pages: List[int] = []
+        self.not_modified = 0
+        # Requests a token may make until reset, unlimited if None.
+        self.rate_limit: Optional[int] = None
+        self.reset = 0
+        self.used: Dict[Tuple[str, str], int] = {}
+        # Requests answered with a secondary rate limit before serving again.
+        self.secondary_limited = 0
+        self.authorizations: List[Optional[str]] = []
+        # Seconds each request takes, as the round trip to api.github.com would.
+        self.latency = 0.0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.synthetic: Optional[CSyntheticCommits] = None
+        # linux-stable, every series a line of history: ref -> (series, position in it).
+        self.stable_tags: List[FakeTag] = []
+        self.stable_history: Dict[str, Tuple[str, int]] = {}
+        # Commits by branch, newest first: (sha, committer date, message). The stable branches
+        # (linux-5.10.y) only, nothing the commit search covers.
+        self.branches: Dict[str, List[Tuple[str, str, str]]] = {}
+        # Trees besides torvalds/linux, by repo name: (tags, commits by full SHA).
+        self.trees: Dict[str, Tuple[List[FakeTag], Dict[str, str]]] = {}
+        self.server = CFakeGithubServer(self)
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self) -> "CFakeGithub":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_stable_series(self, series: str, start: datetime, num_releases: int) -> None:
+        """
+        Point releases v<series>.1 .. v<series>.<num_releases>, a week apart from start.
+        """
+        for release in range(1, num_releases + 1):
+            name = f"v{series}.{release}"
+            sha = hashlib.sha1(name.encode()).hexdigest()
+            date = (start + timedelta(weeks=release)).strftime(DATE_FORMAT)
+            self.stable_tags.append((name, sha, date))
+            self.stable_history[name] = self.stable_history[sha] = (series, 2 * release)
+            self._add_to_branch(series, (sha, date, f"Linux {name[1:]}"))
+        self.stable_tags.sort(key=lambda tag: tag[2], reverse=True)
+
+    def _add_to_branch(self, series: str, commit: Tuple[str, str, str]) -> None:
+        branch = self.branches.setdefault(f"linux-{series}.y", [])
+        branch.append(commit)
+        branch.sort(key=lambda item: item[1], reverse=True)
+
+    def add_backport(
+        self, series: str, upstream: str, release: int, date: Optional[datetime] = None
+    ) -> str:
+        """
+        Backport of the upstream commit first released in v<series>.<release>, committed a day
+        before it unless date is given.
+        """
+        if date is None:
+            tag_date = next(tag[2] for tag in self.stable_tags if tag[0] == f"v{series}.{release}")
+            date = datetime.strptime(tag_date, DATE_FORMAT) - timedelta(days=1)
+        sha = hashlib.sha1(f"{series} {upstream}".encode()).hexdigest()
+        message = f"Fix it\n\ncommit {upstream} upstream.\n\nSigned-off-by: tkc"
+        self._add_to_branch(series, (sha, date.strftime(DATE_FORMAT), message))
+        self.stable_history[sha] = (series, 2 * release - 1)
+        return sha
+
+    def search_commits(self, query: str) -> Dict[str, Any]:
+        # Github only indexes the default branch.
+        terms = [term for term in query.split() if ":" not in term]
+        items = [
+            {"sha": sha, "commit": {"message": message, "committer": {"date": date}}}
+            for sha, date, message in self.branches.get(DEFAULT_BRANCH, [])
+            if all(term in message for term in terms)
+        ]
+        return {"total_count": len(items), "incomplete_results": False, "items": items}
+
+    def list_commits(self, query: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Commits of a branch between the since and until dates, a page of them.
+        """
+        if query["sha"] not in self.branches:
+            return None
+        commits = [
+            {"sha": sha, "commit": {"message": message, "committer": {"date": date}}}
+            for sha, date, message in self.branches[query["sha"]]
+            if query["since"] <= date <= query["until"]
+        ]
+        per_page = int(query["per_page"])
+        start = (int(query["page"]) - 1) * per_page
+        return commits[start : start + per_page]
+
+    def compare(self, base: str, head: str) -> Optional[str]:
+        if base not in self.stable_history or head not in self.stable_history:
+            return None
+        (base_series, base_pos), (head_series, head_pos) = (
+            self.stable_history[base],
+            self.stable_history[head],
+        )
+        if base_series != head_series:
+            return "diverged"
+        if base_pos == head_pos:
+            return "identical"
+        return "ahead" if head_pos > base_pos else "behind"
+
+    def tree(self, repo_name: str) -> Optional[Tuple[List[FakeTag], Dict[str, str]]]:
+        if repo_name == "torvalds/linux":
+            return (self.tags, self.commits)
+        return self.trees.get(repo_name)
+
+    def add_tree(self, repo_name: str, tags: List[FakeTag]) -> Dict[str, str]:
+        """
+        Another tree with its own tags, returns its commits for the tests to add to.
+        """
+        self.trees[repo_name] = (tags, {sha: date for _, sha, date in tags if sha})
+        return self.trees[repo_name][1]
+
+    def rest_tags(
+        self, path: str, query: Dict[str, str], repo_name: str = "torvalds/linux"
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+        all_tags = self.trees[repo_name][0] if repo_name in self.trees else self.tags
+        per_page = int(query.get("per_page", 30))
+        page = int(query.get("page", 1))
+        num_pages = max(1, math.ceil(len(all_tags) / per_page))
+        self.pages.append(page)
+        tags = all_tags[(page - 1) * per_page : page * per_page]
+        body = [
+            {"name": name, "commit": {"sha": sha, "url": f"{self.url}/commits/{sha}"}}
+            for name, sha, _ in tags
+        ]
+        links = {"first": 1, "prev": page - 1, "next": page + 1, "last": num_pages}
+        link = ", ".join(
+            f'<{self.url}{path}?per_page={per_page}&page={link_page}>; rel="{rel}"'
+            for rel, link_page in links.items()
+            if 1 <= link_page <= num_pages and num_pages > 1
+        )
+        return (body, {"Link": link} if link else {})
+
+    def _find_commit(self, commit: str, commits: Dict[str, str]) -> Optional[Tuple[str, str]]:
+        if commit in commits:
+            return (commit, commits[commit])
+        matches = [sha for sha in commits if sha.startswith(commit)]
+        if len(matches) == 1:
+            return (matches[0], commits[matches[0]])
+        if not matches and commits is self.commits and self.synthetic is not None:
+            return self.synthetic.lookup(commit)
+        return None
+
+    def rest_commit(
+        self, commit: str, repo_name: str = "torvalds/linux"
+    ) -> Optional[Dict[str, Any]]:
+        commits = self.trees[repo_name][1] if repo_name in self.trees else self.commits
+        found = self._find_commit(commit, commits)
+        if found is None:
+            return None
+        sha, date = found
+        committer = {"name": "tkc", "email": "tkc@example.com", "date": date}
+        return {
+            "sha": sha,
+            "url": f"{self.url}/repos/{repo_name}/commits/{sha}",
+            "commit": {"committer": committer, "author": committer, "message": sha},
+        }
+
+    def graphql_commits(self, repo_name: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        commits = self.trees[repo_name][1] if repo_name in self.trees else self.commits
+        objects: Dict[str, Any] = {}
+        for name, commit in variables.items():
+            if not re.fullmatch(r"e\d+", name):
+                continue
+            found = self._find_commit(commit, commits)
+            objects[f"c{name[1:]}"] = (
+                {"oid": found[0], "committedDate": found[1]} if found is not None else None
+            )
+        return {"data": {"repository": objects}}
+
+    def graphql(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        repo_name = f"{variables.get('owner')}/{variables.get('name')}"
+        if "object(expression:" in query:
+            return self.graphql_commits(repo_name, variables)
+        if "refs(" not in query:
+            return {"errors": [{"message": "Unsupported query"}]}
+        tags = self.trees[repo_name][0] if repo_name in self.trees else self.tags
+        if repo_name == STABLE_REPO:
+            tags = [tag for tag in self.stable_tags if tag[0].startswith(variables["query"])]
+        offset = int(variables.get("cursor") or 0)
+        page = tags[offset : offset + variables["first"]]
+        end = offset + len(page)
+        nodes = [
+            {
+                "name": name,
+                # Annotated tag, tags without a commit point to a tree.
+                "target": {"target": {"oid": sha, "committedDate": date} if sha else {}},
+            }
+            for name, sha, date in page
+        ]
+        return {
+            "data": {
+                "repository": {
+                    "refs": {
+                        "pageInfo": {"hasNextPage": end < len(tags), "endCursor": str(end)},
+                        "nodes": nodes,
+                    }
+                }
+            }
+        }
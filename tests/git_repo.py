@@ -0,0 +1,98 @@
+import os
+import subprocess
+from typing import Dict, List
+
+
+class CGitRepo:
+    """
+    Synthetic git repository for the local backends, commits are dated a day apart.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.git_dir = os.path.join(path, ".git")
+        self.num_commits = 0
+        os.makedirs(path, exist_ok=True)
+        self.git("init", "-q", "-b", "master")
+
+    def _env(self) -> Dict[str, str]:
+        date = f"{1600000000 + self.num_commits * 86400} +0000"
+        return dict(
+            os.environ,
+            GIT_AUTHOR_NAME="tkc",
+            GIT_AUTHOR_EMAIL="tkc@example.com",
+            GIT_COMMITTER_NAME="tkc",
+            GIT_COMMITTER_EMAIL="tkc@example.com",
+            GIT_AUTHOR_DATE=date,
+            GIT_COMMITTER_DATE=date,
+            GIT_CONFIG_GLOBAL=os.devnull,
+            GIT_CONFIG_NOSYSTEM="1",
+        )
+
+    def git(self, *args: str) -> str:
+        return subprocess.run(
+            ["git", "-C", self.path, *args],
+            env=self._env(),
+            check=True,
+            stdout=subprocess.PIPE,
+            encoding="UTF-8",
+        ).stdout.strip()
+
+    def commit(self, message: str) -> str:
+        self.num_commits += 1
+        self.git("commit", "-q", "--allow-empty", "-m", message)
+        return self.git("rev-parse", "HEAD")
+
+    def merge(self, message: str, *branches: str) -> str:
+        self.num_commits += 1
+        self.git("merge", "-q", "--no-ff", "-m", message, *branches)
+        return self.git("rev-parse", "HEAD")
+
+    def tag(self, name: str) -> None:
+        self.git("tag", "-a", "-m", name, name)
+
+    def write_commit_graph(self) -> None:
+        self.git("commit-graph", "write", "--reachable")
+
+
+def make_history(
+    path: str, num_commits: int, tag_every: int = 50, rcs_per_release: int = 3, merge_every: int = 7
+) -> CGitRepo:
+    """
+    Kernel like history written with git fast-import: topic branches merged every merge_every
+    commits and a tag every tag_every commits, rcs_per_release RCs before each release.
+    """
+    repo = CGitRepo(path)
+    stream: List[str] = []
+    minor, rc = 0, 1
+    for idx in range(1, num_commits + 1):
+        date = f"{1600000000 + idx * 3600} +0000"
+        parent = f"from :{idx - 1}\n" if idx > 1 else ""
+        if idx % merge_every == 0:
+            # Topic commit forked from the master commit before, merged by this one.
+            stream.append(
+                f"commit refs/heads/topic\nmark :{num_commits + idx}\n"
+                f"committer tkc <tkc@example.com> {date}\ndata 6\ntopic\n{parent}\n"
+            )
+            parent += f"merge :{num_commits + idx}\n"
+        stream.append(
+            f"commit refs/heads/master\nmark :{idx}\ncommitter tkc <tkc@example.com> {date}\n"
+            f"data {len(str(idx))}\n{idx}\n{parent}\n"
+        )
+        if idx % tag_every == 0:
+            name = f"v1.{minor}-rc{rc}" if rc <= rcs_per_release else f"v1.{minor}"
+            stream.append(
+                f"tag {name}\nfrom :{idx}\ntagger tkc <tkc@example.com> {date}\n"
+                f"data {len(name)}\n{name}\n"
+            )
+            rc += 1
+            if rc > rcs_per_release + 1:
+                minor, rc = minor + 1, 1
+    subprocess.run(
+        ["git", "-C", path, "fast-import", "--quiet"],
+        input="".join(stream),
+        check=True,
+        encoding="UTF-8",
+    )
+    repo.num_commits = num_commits
+    return repo
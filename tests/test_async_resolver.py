@@ -0,0 +1,140 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+from github import GithubException
+
+from lk_compat_helper.async_resolver import CAsyncResolver
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+from lk_compat_helper.graphql import parse_date
+from lk_compat_helper.snapshot import write_snapshot
+from tests.fake_github import CFakeGithub, CSyntheticCommits, make_tags
+
+NUM_COMMITS = 100000
+
+
+class CAsyncResolverUnitTest(unittest.TestCase):
+    def setUp(self):
+        # Three pages of REST listing.
+        self.tags = make_tags(250)
+        start = parse_date(self.tags[-1][2]) - timedelta(weeks=2)
+        end = parse_date(self.tags[0][2]) + timedelta(weeks=2)
+        self.synthetic = CSyntheticCommits(NUM_COMMITS, start, end)
+        self.commits = [self.synthetic.sha(idx) for idx in range(0, NUM_COMMITS, 1999)]
+
+    def _fake(self):
+        fake = CFakeGithub(self.tags)
+        fake.synthetic = self.synthetic
+        return fake
+
+    @staticmethod
+    def _repo(fake, cache_dir=None, **kwargs):
+        # Not paced, the fake has no secondary rate limit.
+        return CLinuxKernelRepo(None, "", cache_dir, api_url=fake.url, request_rate=10000, **kwargs)
+
+    def _expected(self, fake, **kwargs):
+        lk_repo = self._repo(fake, **kwargs)
+        return list(lk_repo.get_tags_for_commits(self.commits))
+
+    def test_same_answers(self):
+        for kwargs in ({}, {"tag_order": "version"}, {"backend": "graphql"}):
+            with self._fake() as fake:
+                expected = self._expected(fake, **kwargs)
+                num_requests = len(fake.requests)
+                lk_repo = self._repo(fake, **kwargs)
+                resolver = CAsyncResolver(lk_repo, 8)
+                self.assertEqual(resolver.resolve_many(self.commits), expected, kwargs)
+                # The tags are listed once, a tag date probed by several commits is fetched once.
+                fetched = [r for r in fake.requests[num_requests:] if "/commits/" in r]
+                self.assertEqual(len(fetched), len(set(fetched)), kwargs)
+                stats = lk_repo.get_stats()["counters"]
+                self.assertEqual(stats["lookups"], len(self.commits))
+                self.assertEqual(stats["http_requests"], len(fake.requests) - num_requests)
+                num_requests = len(fake.requests)
+                self.assertEqual(resolver.get_tag(self.commits[3]), expected[3][1])
+                self.assertEqual(len(fake.requests), num_requests + 1)
+
+    def test_cached(self):
+        with self._fake() as fake, tempfile.TemporaryDirectory() as cache_dir:
+            expected = self._expected(fake)
+            commits = self.commits[: len(self.commits) // 2]
+            CAsyncResolver(self._repo(fake, cache_dir)).resolve_many(commits)
+            # Some of the tags are dated in the index now, the commits already fetched cached.
+            num_requests = len(fake.requests)
+            lk_repo = self._repo(fake, cache_dir)
+            self.assertEqual(CAsyncResolver(lk_repo).resolve_many(self.commits), expected)
+            self.assertEqual(lk_repo.get_stats()["counters"]["commit_cache_hits"], len(commits))
+            fetched = " ".join(fake.requests[num_requests:])
+            self.assertFalse([commit for commit in commits if commit in fetched])
+
+    def test_concurrent(self):
+        commits = [self.synthetic.sha(idx) for idx in range(0, NUM_COMMITS, 1601)]
+        with self._fake() as fake:
+            fake.latency = 0.1
+            start = time.perf_counter()
+            tags = CAsyncResolver(self._repo(fake), 64).resolve_many(commits)
+            elapsed = time.perf_counter() - start
+            self.assertEqual(len(tags), len(commits))
+            # About the round trips of the listing and of one search, the commit fetches alone
+            # would take 6s one after the other.
+            self.assertLess(elapsed, len(commits) * fake.latency / 2)
+
+    def test_prefetched(self):
+        with self._fake() as fake:
+            expected = self._expected(fake)
+            num_requests = len(fake.requests)
+            # Paced at the default rate, the commits are not a request each.
+            lk_repo = CLinuxKernelRepo("token", "", api_url=fake.url, backend="graphql")
+            self.assertEqual(CAsyncResolver(lk_repo).resolve_many(self.commits), expected)
+            # The three pages of the tag listing and one commits query.
+            self.assertEqual(fake.requests[num_requests:], ["POST /graphql"] * 4)
+            self.assertEqual(lk_repo.get_stats()["counters"]["lookups"], len(self.commits))
+
+    def test_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "linux.lkts")
+            commit_dates = {commit: self.synthetic.date(0) for commit in self.commits[:1]}
+            dated_tags = [(name, parse_date(date)) for name, _, date in self.tags]
+            write_snapshot(path, dated_tags, {c: parse_date(d) for c, d in commit_dates.items()})
+            lk_repo = CLinuxKernelRepo(None, "", snapshot=path)
+            self.assertEqual(
+                CAsyncResolver(lk_repo).resolve_many(self.commits[:1]),
+                [(self.commits[0], "v2.0")],
+            )
+            self.assertEqual(
+                CAsyncResolver(lk_repo).resolve_each(self.commits[:1]),
+                [(self.commits[0], "v2.0")],
+            )
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            CAsyncResolver(CLinuxKernelRepo(None, ""), 0)
+        with self._fake() as fake:
+            resolver = CAsyncResolver(self._repo(fake))
+            self.assertEqual(resolver.resolve_many([]), [])
+            for commit, status in (("f" * 40, 422), ("v5.12-rc3", 404)):
+                with self.assertRaises(GithubException) as context:
+                    resolver.resolve_many([self.commits[0], commit])
+                self.assertEqual(context.exception.status, status)
+            # Each failure in place of its commit's tag, the others resolved.
+            self.assertEqual(resolver.resolve_each([]), [])
+            results = resolver.resolve_each([self.commits[0], "f" * 40, "v5.12-rc3"])
+            self.assertEqual(results[0], resolver.resolve_many(self.commits[:1])[0])
+            self.assertEqual(
+                [(commit, error.commit, error.status) for commit, error in results[1:]],
+                [("f" * 40, "f" * 40, 422), ("v5.12-rc3", "v5.12-rc3", 404)],
+            )
+            # Not a lookup failure, a bug.
+            with mock.patch.object(resolver.repo, "fetch_commit", side_effect=ValueError):
+                with self.assertRaises(ValueError):
+                    resolver.resolve_each(self.commits[:1])
+
+    def test_empty_tags(self):
+        with CFakeGithub([]) as fake:
+            fake.synthetic = self.synthetic
+            lk_repo = self._repo(fake, backend="graphql")
+            with self.assertLogs("__main__", "ERROR"):
+                self.assertEqual(CAsyncResolver(lk_repo).get_tag(self.commits[0]), "Unknown")
@@ -0,0 +1,277 @@
+import contextlib
+import glob
+import io
+import json
+import logging
+import os
+import signal
+import sqlite3
+import tempfile
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+from github import GithubException
+
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo, main
+from lk_compat_helper.daemon import CDaemonClient, CResolverServer
+from lk_compat_helper.errors import CResolveError
+from lk_compat_helper.graphql import parse_date
+from tests.fake_github import CFakeGithub, make_tags
+
+COMMITS = ["5a3f0c9e2b7d41c6a8f9e0d1b2c3a4f5e6d7c8b9", "0d02ec6b3136c73c09e7859f0d0e4e2c4c07b49b"]
+MISSING = "f" * 40
+
+
+class CMainUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.tags = make_tags(40)
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        self.cache_dir = os.path.join(self.tmp_dir, "cache")
+        self.fake = CFakeGithub(self.tags)
+        date = (parse_date(self.tags[20][2]) - timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.fake.commits.update({commit: date for commit in COMMITS})
+        self.fake.__enter__()
+        self.addCleanup(self.fake.__exit__)
+        self.logger = logging.getLogger("__main__")
+        self.addCleanup(self.logger.setLevel, self.logger.level)
+        self.addCleanup(setattr, self.logger, "propagate", self.logger.propagate)
+
+    def _options(self, *args):
+        return ["--api-url", self.fake.url, "--cache-dir", self.cache_dir, "-a", "token"] + [
+            "--request-rate",
+            "10000",
+            "--no-daemon",
+            *args,
+        ]
+
+    def _main(self, argv):
+        """
+        Exit status, log messages and output of lk-get-tag run with argv.
+        """
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.addHandler(handler)
+        stdout = io.StringIO()
+        try:
+            with mock.patch("logging.basicConfig"), contextlib.redirect_stdout(stdout):
+                with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit) as e:
+                    main(argv)
+        finally:
+            self.logger.removeHandler(handler)
+        return e.exception.code, [record.getMessage() for record in records], stdout.getvalue()
+
+    def test_resolve(self):
+        prometheus = os.path.join(self.tmp_dir, "lk.prom")
+        status, messages, stdout = self._main(
+            self._options("-c", COMMITS[0], "-c", COMMITS[1], "--stats")
+            + ["--stats-prometheus", prometheus]
+        )
+        self.assertEqual(status, 0)
+        self.assertEqual(
+            messages, [f"Earliest tag which has {commit} is v2.2" for commit in COMMITS]
+        )
+        self.assertEqual(json.loads(stdout)["counters"]["lookups"], 2)
+        self.assertTrue(os.path.exists(prometheus))
+
+        prometheus = os.path.join(self.tmp_dir, "missing", "lk.prom")
+        commits_file = os.path.join(self.tmp_dir, "commits")
+        with open(commits_file, "w") as f:
+            f.write(f"# Fixes\n{COMMITS[1]}\n")
+        status, messages, _ = self._main(
+            self._options("-f", commits_file, "--max-in-flight", "4", "--debug")
+            + ["--stats-prometheus", prometheus]
+        )
+        self.assertEqual(status, 0)
+        self.assertIn(f"Earliest tag which has {COMMITS[1]} is v2.2", messages)
+        self.assertTrue([m for m in messages if m.startswith("Cannot write the stats")])
+        self.assertEqual(self.logger.level, logging.DEBUG)
+
+    def test_commit_cache_uses(self):
+        self.assertEqual(self._main(self._options("-c", COMMITS[0]))[0], 0)
+        (path,) = glob.glob(os.path.join(self.cache_dir, "*commits*.sqlite"))
+        with contextlib.closing(sqlite3.connect(path)) as db:
+            (put,) = db.execute("SELECT used FROM commits").fetchone()
+        # Read from the cache, when is written by the end of the run.
+        self.assertEqual(self._main(self._options("-c", COMMITS[0][:12]))[0], 0)
+        with contextlib.closing(sqlite3.connect(path)) as db:
+            self.assertGreater(db.execute("SELECT used FROM commits").fetchone()[0], put)
+
+    def test_failed_commit(self):
+        # Reported on its line, the other commits are still resolved.
+        argv = self._options("-c", COMMITS[0], "-c", MISSING, "-c", COMMITS[1])
+        for args in ([], ["--max-in-flight", "4"]):
+            with self.subTest(args=args):
+                status, messages, _ = self._main(argv + args)
+                self.assertEqual(status, 1)
+                self.assertEqual(
+                    messages,
+                    [
+                        f"Earliest tag which has {COMMITS[0]} is v2.2",
+                        f"{MISSING}: No commit found for SHA: {MISSING}",
+                        f"Earliest tag which has {COMMITS[1]} is v2.2",
+                    ],
+                )
+
+    def test_stable(self):
+        status, messages, _ = self._main(self._options("-c", COMMITS[0], "--stable", "2.0,2.5"))
+        self.assertEqual(status, 0)
+        self.assertEqual(
+            messages,
+            [
+                f"Earliest tag which has {COMMITS[0]} is v2.2",
+                f"Earliest 2.0 stable tag which has {COMMITS[0]} is Unmerged",
+                f"Earliest 2.5 stable tag which has {COMMITS[0]} is v2.5",
+            ],
+        )
+
+    def test_streaming(self):
+        commits_file = os.path.join(self.tmp_dir, "commits")
+        with open(commits_file, "w") as f:
+            f.write(f"{COMMITS[1]}\n{MISSING}\n")
+        status, messages, stdout = self._main(
+            self._options(
+                "-c", COMMITS[0], "-f", commits_file, "--jsonl", "--stats", "--keep-order"
+            )
+        )
+        self.assertEqual(status, 1)
+        records = [json.loads(line) for line in stdout.splitlines()]
+        self.assertEqual([record["commit"] for record in records], COMMITS + [MISSING])
+        self.assertEqual(records[0]["tag"], "v2.2")
+        self.assertEqual(records[2]["status"], 422)
+
+        status, messages, stdout = self._main(
+            self._options("-c", COMMITS[0], "-c", MISSING, "--jobs", "2", "--keep-order")
+        )
+        self.assertEqual(status, 1)
+        self.assertEqual(messages[0], f"Earliest tag which has {COMMITS[0]} is v2.2")
+        self.assertTrue(messages[1].startswith(f"{MISSING}: "))
+        self.assertEqual(stdout, "")
+
+    def test_in_repos(self):
+        self.fake.add_tree("netdev/net-next", self.tags)
+        status, messages, _ = self._main(
+            self._options("-c", COMMITS[0], "--repo", "torvalds/linux", "--repo", "netdev/net-next")
+        )
+        self.assertEqual(status, 0)
+        self.assertEqual(
+            messages,
+            [
+                f"Earliest torvalds/linux tag which has {COMMITS[0]} is v2.2",
+                f"Earliest netdev/net-next tag which has {COMMITS[0]} is Unmerged",
+            ],
+        )
+
+    def test_errors(self):
+        status, messages, _ = self._main(self._options("-c", COMMITS[0], "--repo", "netdev/gone"))
+        self.assertEqual((status, messages), (1, [f"{COMMITS[0]}: Not Found"]))
+        trees = ["--repo", "torvalds/linux", "--repo", "netdev/gone"]
+        status, messages, _ = self._main(self._options("-c", COMMITS[0], *trees))
+        self.assertEqual((status, messages), (2, ["404", "Not Found"]))
+        failure = CResolveError("Failed to query the commit date", COMMITS[0])
+        with mock.patch.object(CLinuxKernelRepo, "get_tags_for_commits", side_effect=failure):
+            for args in ([], trees):
+                status, messages, _ = self._main(self._options("-c", COMMITS[0], *args))
+                self.assertEqual((status, messages), (1, ["Failed to query the commit date"]))
+        with mock.patch.dict(os.environ, {"GITHUB_API_TOKEN": ""}):
+            status, messages, _ = self._main(["--no-daemon", "-c", COMMITS[0]])
+        self.assertEqual((status, messages), (1, ["Please provide a Github API token"]))
+        status, messages, _ = self._main(
+            self._options("-c", COMMITS[0], "--replay", os.path.join(self.tmp_dir, "none"))
+        )
+        self.assertEqual(status, 1)
+        self.assertTrue(messages[0].startswith("Cannot use the cassette"))
+
+    def test_usage_errors(self):
+        for args in (
+            ["-c", COMMITS[0], "--repo", "a/b", "--repo", "c/d", "--stable", "5.10"],
+            ["-c", COMMITS[0], "--max-in-flight", "-1"],
+            ["-c", COMMITS[0], "--jobs", "-1"],
+            ["-c", COMMITS[0], "--jsonl", "--stable", "5.10"],
+            ["--no-cache", "index", "update"],
+            [],
+        ):
+            with self.subTest(args=args):
+                self.assertEqual(self._main(self._options(*args))[0], 2)
+
+    def test_record_replay(self):
+        cassette = os.path.join(self.tmp_dir, "cassette")
+        expected = self._main(self._options("-c", COMMITS[0], "--record", cassette))
+        num_requests = len(self.fake.requests)
+        replayed = self._main(self._options("-c", COMMITS[0], "--replay", cassette))
+        self.assertEqual(replayed, expected)
+        self.assertEqual(len(self.fake.requests), num_requests)
+
+    def test_snapshot(self):
+        path = os.path.join(self.tmp_dir, "linux.lkts")
+        status, messages, _ = self._main(
+            self._options("-c", COMMITS[0], "snapshot", "export", path)
+        )
+        self.assertEqual((status, messages), (0, ["Snapshot of 40 tags and 41 commits written"]))
+        status, messages, _ = self._main(self._options("snapshot", "import", path))
+        self.assertEqual(status, 0)
+        self.assertTrue(messages[0].startswith("Snapshot installed as "))
+        num_requests = len(self.fake.requests)
+        status, messages, _ = self._main(self._options("-c", COMMITS[0], "--snapshot"))
+        self.assertEqual((status, messages), (0, [f"Earliest tag which has {COMMITS[0]} is v2.2"]))
+        self.assertEqual(len(self.fake.requests), num_requests)
+
+        missing = os.path.join(self.tmp_dir, "missing.lkts")
+        for args, message in (
+            (["snapshot", "import", self.tmp_dir], "Cannot import the snapshot: "),
+            (["-c", COMMITS[0], "--snapshot", missing], "Cannot load the snapshot: "),
+        ):
+            status, messages, _ = self._main(self._options(*args))
+            self.assertEqual(status, 1)
+            self.assertTrue(messages[0].startswith(message), messages)
+
+    def test_index_update(self):
+        status, messages, _ = self._main(self._options("index", "update"))
+        self.assertEqual((status, messages), (0, ["Tag index updated, 40 new tags"]))
+
+    def test_serve(self):
+        self.addCleanup(signal.signal, signal.SIGTERM, signal.getsignal(signal.SIGTERM))
+        socket_path = os.path.join(self.tmp_dir, "daemon.sock")
+        with mock.patch.object(CResolverServer, "serve_forever", side_effect=KeyboardInterrupt):
+            status, messages, _ = self._main(self._options("--socket", socket_path, "serve"))
+        self.assertEqual((status, messages), (0, [f"Serving at {socket_path}"]))
+        self.assertFalse(os.path.exists(socket_path))
+        socket_path = os.path.join(self.tmp_dir, "missing", "daemon.sock")
+        status, messages, _ = self._main(self._options("--socket", socket_path, "serve"))
+        self.assertEqual(status, 1)
+        self.assertTrue(messages[0].startswith(f"Cannot serve at {socket_path}"))
+
+    @mock.patch.dict(os.environ, {"GITHUB_API_TOKEN": "token"})
+    def test_daemon(self):
+        # The daemon's options, it answers.
+        argv = ["--cache-dir", self.cache_dir, "-c", COMMITS[0]]
+        with mock.patch.object(CDaemonClient, "resolve", return_value=[(COMMITS[0], "v2.2")]):
+            status, messages, _ = self._main(argv)
+        self.assertEqual((status, messages), (0, [f"Earliest tag which has {COMMITS[0]} is v2.2"]))
+        failure = GithubException(502, "Bad Gateway", None)
+        with mock.patch.object(CDaemonClient, "resolve", side_effect=failure):
+            self.assertEqual(self._main(argv)[:2], (2, ["502", "Bad Gateway"]))
+        failed = [(COMMITS[0], CResolveError(f"{COMMITS[0]}: Not Found", COMMITS[0], 404))]
+        with mock.patch.object(CDaemonClient, "resolve", return_value=failed):
+            self.assertEqual(self._main(argv)[:2], (1, [f"{COMMITS[0]}: Not Found"]))
+        # Not serving, resolved in the process.
+        with mock.patch.object(CDaemonClient, "resolve", return_value=None) as resolve:
+            with mock.patch.object(CLinuxKernelRepo, "resolve_each", return_value=[]):
+                self.assertEqual(self._main(argv)[:2], (0, []))
+        resolve.assert_called_once_with([COMMITS[0]])
+
+    def test_status(self):
+        argv = ["--cache-dir", self.cache_dir, "status"]
+        status, messages, _ = self._main(argv)
+        self.assertEqual(status, 1)
+        self.assertTrue(messages[0].startswith("No resolver daemon is serving at "))
+        stats = {"requests": 3, "p50_ms": 1.5, "p99_ms": 4.0}
+        with mock.patch.object(CDaemonClient, "stats", return_value=stats):
+            status, messages, _ = self._main(argv)
+        self.assertEqual(status, 0)
+        self.assertTrue(messages[0].endswith(": 3 requests, p50 1.5ms, p99 4.0ms"), messages)
@@ -0,0 +1,125 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from lk_compat_helper.commit_cache import USE_BATCH, CCommitCache
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+from lk_compat_helper.graphql import parse_date
+from tests.fake_github import CFakeGithub, make_tags
+
+SHAS = [
+    "1e28eed17697c1a5e13c6df0e41702d2b2c77c8a",
+    "1e28eed17697c1a5e13c6df0e41702d2b2c77c8b",
+    "a5e13c6df0e41702d2b2c77c8ad41677ebb065b3",
+    "0d02ec6b3136c73c09e7859f0d0e4e2c4c07b49b",
+]
+DATE = datetime(2021, 3, 20, 8, 33, 34)
+
+
+class CCommitCacheUnitTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, "cache", "commits.sqlite")
+        self.now = 0.0
+
+    def _open(self, **kwargs):
+        commit_cache = CCommitCache(self.path, clock=self._tick, **kwargs)
+        self.addCleanup(commit_cache.close)
+        return commit_cache
+
+    def _tick(self):
+        self.now += 1
+        return self.now
+
+    def test_prefixes(self):
+        commit_cache = self._open()
+        for idx, sha in enumerate(SHAS):
+            commit_cache.put(sha, DATE + timedelta(days=idx))
+        self.assertEqual(commit_cache.get(SHAS[2]), (SHAS[2], DATE + timedelta(days=2)))
+        self.assertEqual(commit_cache.get("A5E13C6"), (SHAS[2], DATE + timedelta(days=2)))
+        self.assertEqual(commit_cache.get(SHAS[0][:-1] + "a"), (SHAS[0], DATE))
+        # Ambiguous, too short, too long, not a SHA and missing.
+        for commit in ("1e28eed17697", "a5e13c", SHAS[2] + "0", "v5.12-rc3", "ffffffffffff"):
+            self.assertIsNone(commit_cache.get(commit), commit)
+
+    def test_persistent(self):
+        commit_cache = self._open()
+        commit_cache.put(SHAS[2], DATE)
+        commit_cache.close()
+        commit_cache = self._open()
+        self.assertEqual(commit_cache.get(SHAS[2][:12]), (SHAS[2], DATE))
+        self.assertEqual(commit_cache.dates(), {SHAS[2]: DATE})
+
+    def test_least_recently_used_evicted(self):
+        commit_cache = self._open(max_entries=2)
+        commit_cache.put(SHAS[0], DATE)
+        commit_cache.put(SHAS[2], DATE)
+        # Used again, the first one is now the most recent.
+        commit_cache.get(SHAS[0])
+        commit_cache.put(SHAS[3], DATE)
+        self.assertEqual(len(commit_cache), 2)
+        self.assertIsNone(commit_cache.get(SHAS[2]))
+        self.assertIsNotNone(commit_cache.get(SHAS[0]))
+        self.assertIsNotNone(commit_cache.get(SHAS[3]))
+
+    def test_batched_writes(self):
+        num_entries = USE_BATCH + 10
+        commit_cache = self._open(max_entries=num_entries)
+        statements = []
+        commit_cache.db.set_trace_callback(statements.append)
+        for idx in range(num_entries):
+            commit_cache.put(f"{idx:040x}", DATE)
+        # Not counted again until full.
+        self.assertFalse([s for s in statements if "COUNT" in s])
+        statements.clear()
+        for idx in range(USE_BATCH - 1):
+            self.assertIsNotNone(commit_cache.get(f"{idx:040x}"))
+        # The reads are not writes until a batch of them.
+        self.assertFalse([s for s in statements if "UPDATE" in s])
+        commit_cache.get(f"{USE_BATCH - 1:040x}")
+        self.assertTrue([s for s in statements if "UPDATE" in s])
+        # Past max_entries, trimmed by a tenth in one go, the least recently used first.
+        commit_cache.put(SHAS[2], DATE)
+        self.assertEqual(len(commit_cache), num_entries - num_entries // 10)
+        self.assertEqual(
+            [idx for idx in range(num_entries) if commit_cache.get(f"{idx:040x}") is None],
+            [0, 1] + list(range(USE_BATCH, num_entries)),
+        )
+        statements.clear()
+        commit_cache.put(SHAS[3], DATE)
+        self.assertFalse([s for s in statements if "COUNT" in s or "DELETE" in s])
+
+    def test_uses_written_on_close(self):
+        commit_cache = self._open(max_entries=2)
+        commit_cache.put(SHAS[0], DATE)
+        commit_cache.put(SHAS[2], DATE)
+        commit_cache.get(SHAS[0])
+        commit_cache.close()
+        # The first one was used last, the other is evicted.
+        commit_cache = self._open(max_entries=2)
+        commit_cache.put(SHAS[3], DATE)
+        self.assertIsNone(commit_cache.get(SHAS[2]))
+        self.assertIsNotNone(commit_cache.get(SHAS[0]))
+        # Cached again, a new date replaces the old one.
+        commit_cache.put(SHAS[3], DATE + timedelta(days=1))
+        self.assertEqual(commit_cache.get(SHAS[3]), (SHAS[3], DATE + timedelta(days=1)))
+
+
+class CLinuxKernelRepoCommitCacheUnitTest(unittest.TestCase):
+    def test_repeat_lookup_without_requests(self):
+        tags = make_tags(40)
+        commit = SHAS[2]
+        commit_date = parse_date(tags[12][2]) - timedelta(hours=1)
+        with CFakeGithub(tags) as fake, tempfile.TemporaryDirectory() as cache_dir:
+            fake.commits[commit] = commit_date.strftime("%Y-%m-%dT%H:%M:%SZ")
+            lk_repo = CLinuxKernelRepo(None, commit[:12], cache_dir, api_url=fake.url)
+            tag = lk_repo.get_tag()
+            num_requests = len(fake.requests)
+
+            lk_repo = CLinuxKernelRepo(None, commit[:12], cache_dir, api_url=fake.url)
+            self.assertEqual(lk_repo.get_tag(), tag)
+            self.assertEqual(lk_repo.commit_date, commit_date)
+            self.assertEqual(len(fake.requests), num_requests)
+            self.assertEqual(lk_repo.get_stats()["counters"]["commit_cache_hits"], 1)
@@ -0,0 +1,172 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from lk_compat_helper.commit_graph import CCommitGraph, CCommitGraphResolver
+from lk_compat_helper.local_git import CLocalGitRepo
+from tests.git_repo import CGitRepo, make_history
+
+
+@unittest.skipUnless(shutil.which("git"), "git is not installed")
+class CCommitGraphUnitTest(unittest.TestCase):
+    def setUp(self):
+        """
+        v1.0-rc1 - v1.0 - merge(topic) - v1.1-rc1 - octopus(a, b) - v1.1 - v1.2-rc1 - unmerged
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.repo = repo = CGitRepo(self.tmp_dir.name)
+        self.commits = {}
+        self.commits["rc1"] = repo.commit("rc1")
+        repo.tag("v1.0-rc1")
+        self.commits["v1.0"] = repo.commit("v1.0")
+        repo.tag("v1.0")
+        repo.git("checkout", "-q", "-b", "topic")
+        self.commits["topic"] = repo.commit("topic")
+        repo.git("checkout", "-q", "master")
+        self.commits["master"] = repo.commit("master")
+        self.commits["merge"] = repo.merge("merge topic", "topic")
+        repo.tag("v1.1-rc1")
+        for branch in ("a", "b"):
+            repo.git("checkout", "-q", "-b", branch, "v1.1-rc1")
+            self.commits[branch] = repo.commit(branch)
+        repo.git("checkout", "-q", "master")
+        self.commits["octopus"] = repo.merge("octopus", "a", "b")
+        repo.tag("v1.1")
+        self.commits["v1.2-rc1"] = repo.commit("v1.2-rc1")
+        repo.tag("v1.2-rc1")
+        self.commits["unmerged"] = repo.commit("unmerged")
+        repo.write_commit_graph()
+        self.graph_path = os.path.join(repo.git_dir, "objects", "info", "commit-graph")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_lookup(self):
+        graph = CCommitGraph(self.graph_path)
+        self.assertEqual(graph.num_commits, len(self.commits))
+        for sha in self.commits.values():
+            pos = graph.lookup(sha)
+            self.assertIsNotNone(pos)
+            self.assertEqual(graph.oid(pos), sha)
+            self.assertEqual(graph.lookup(sha[:12].upper()), pos)
+        self.assertIsNone(graph.lookup("1e28eed17697"))
+        self.assertIsNone(graph.lookup("xyz"))
+        self.assertIsNone(graph.lookup("1"))
+        graph.close()
+
+    def test_parents_and_generation(self):
+        graph = CCommitGraph(self.graph_path)
+        octopus = graph.lookup(self.commits["octopus"])
+        parents = {graph.oid(pos) for pos in graph.parents(octopus)}
+        self.assertEqual(parents, {self.commits["merge"], self.commits["a"], self.commits["b"]})
+        merge = graph.lookup(self.commits["merge"])
+        self.assertEqual(len(graph.parents(merge)), 2)
+        self.assertEqual(graph.parents(graph.lookup(self.commits["rc1"])), [])
+        self.assertEqual(graph.generation(octopus), graph.generation(merge) + 2)
+        self.assertEqual(
+            graph.commit_time(merge),
+            int(self.repo.git("log", "-1", "--format=%ct", self.commits["merge"])),
+        )
+        graph.close()
+
+    def test_get_tag_matches_describe(self):
+        resolver = CCommitGraphResolver.open(self.repo.git_dir)
+        self.assertIsNotNone(resolver)
+        local_repo = CLocalGitRepo(self.repo.git_dir)
+        self.addCleanup(local_repo.close)
+        local_repo.commit_graph = None
+        for sha in self.commits.values():
+            self.assertEqual(resolver.get_tag(sha), local_repo.get_tag(sha), sha)
+        self.assertEqual(resolver.get_tag(self.commits["topic"]), "v1.1")
+        self.assertEqual(resolver.get_tag(self.commits["v1.2-rc1"]), "Unknown")
+        self.assertEqual(resolver.get_tag(self.commits["unmerged"]), "Unmerged")
+        self.assertIsNone(resolver.get_tag("1e28eed17697"))
+
+    def test_commits_newer_than_graph(self):
+        newer = self.repo.commit("newer")
+        self.repo.tag("v1.2")
+        local_repo = CLocalGitRepo(self.repo.git_dir)
+        self.addCleanup(local_repo.close)
+        assert local_repo.commit_graph is not None
+        # v1.2 is not in the graph, it cannot tell whether v1.2 is the first release
+        self.assertIsNone(local_repo.commit_graph.get_tag(self.commits["v1.2-rc1"]))
+        self.assertIsNone(local_repo.commit_graph.get_tag(newer))
+        self.assertEqual(local_repo.get_tag(self.commits["v1.2-rc1"]), "v1.2")
+        self.assertEqual(local_repo.get_tag(self.commits["v1.0"]), "v1.0")
+        local_repo.close()
+        self.assertIsNone(local_repo.commit_graph)
+
+    def test_get_tag_long_lived_branch(self):
+        """
+        The topic commit is older than the merge tagged v1.1-rc1 but only gets merged for v1.1.
+        """
+        repo = CGitRepo(os.path.join(self.tmp_dir.name, "long-lived"))
+        repo.commit("base")
+        repo.tag("v1.0")
+        repo.git("checkout", "-q", "-b", "topic")
+        topic = repo.commit("topic")
+        repo.git("checkout", "-q", "master")
+        repo.commit("m0")
+        repo.git("checkout", "-q", "-b", "side")
+        repo.commit("s1")
+        repo.git("checkout", "-q", "master")
+        repo.commit("m1")
+        repo.merge("merge side", "side")
+        repo.tag("v1.1-rc1")
+        repo.merge("merge topic", "topic")
+        repo.tag("v1.1")
+        repo.write_commit_graph()
+        resolver = CCommitGraphResolver.open(repo.git_dir)
+        assert resolver is not None
+        self.assertEqual(resolver.get_tag(topic), "v1.1")
+
+    def test_unsupported(self):
+        os.remove(self.graph_path)
+        self.assertIsNone(CCommitGraphResolver.open(self.repo.git_dir))
+        with open(self.graph_path, "wb") as graph_file:
+            graph_file.write(b"CGPH\x02\x01\x03\x00" + bytes(64))
+        self.assertIsNone(CCommitGraphResolver.open(self.repo.git_dir))
+        with open(self.graph_path, "wb") as graph_file:
+            graph_file.write(b"CGPH\x01\x01\x03\x01" + bytes(64))
+        with self.assertRaises(ValueError):
+            CCommitGraph(self.graph_path)
+        with open(self.graph_path, "wb") as graph_file:
+            graph_file.write(b"CGPH\x01\x01\x01\x00" + b"OIDF" + bytes(64))
+        with self.assertRaises(ValueError):
+            CCommitGraph(self.graph_path)
+
+
+@unittest.skipUnless(shutil.which("git"), "git is not installed")
+class CCommitGraphHistoryUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.repo = make_history(self.tmp_dir.name, 400)
+        self.repo.write_commit_graph()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_tag_matches_describe(self):
+        resolver = CCommitGraphResolver.open(self.repo.git_dir)
+        assert resolver is not None
+        local_repo = CLocalGitRepo(self.repo.git_dir)
+        self.addCleanup(local_repo.close)
+        local_repo.commit_graph = None
+        shas = self.repo.git("rev-list", "--all").split()
+        self.assertEqual(resolver.graph.num_commits, len(shas))
+        for idx, sha in enumerate(shas):
+            tag = resolver.get_tag(sha)
+            self.assertIsNotNone(tag)
+            # Spot check, describe takes a git start up per commit
+            if idx % 9 == 0:
+                self.assertEqual(tag, local_repo.get_tag(sha), sha)
+                self.assertEqual(resolver.graph.oid(resolver.graph.lookup(sha[:7])), sha)
+        self.assertIsNone(resolver.graph.lookup("0" * 40))
+
+    def test_generation_number_zero(self):
+        resolver = CCommitGraphResolver.open(self.repo.git_dir)
+        assert resolver is not None
+        with patch.object(resolver.graph, "generation", return_value=0):
+            self.assertIsNone(resolver.get_tag(self.repo.git("rev-parse", "HEAD~100")))
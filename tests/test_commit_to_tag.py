@@ -1,6 +1,9 @@
+import tempfile
 import unittest
 from unittest.mock import patch, Mock
-from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo, read_commits
+from lk_compat_helper.errors import CResolveError
+from lk_compat_helper.tag_index import TagEntry
 import github
 
 
@@ -16,10 +19,11 @@ class CLinuxKernelRepoUnitTest(unittest.TestCase):
             requester=None,
             headers={},
             attributes={
+                "sha": sha,
                 "commit": {
                     "sha": sha,
                     "committer": {"name": "tkc", "date": date},
-                }
+                },
             },
             completed=True,
         )
@@ -54,17 +58,29 @@ class CLinuxKernelRepoUnitTest(unittest.TestCase):
         lk_repo = CLinuxKernelRepo(None, commit)
         self.assertEqual(lk_repo.get_tag(), exp_tag)
 
-    @patch("sys.exit", Mock())
     @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_tags")
     @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_commit")
     def test_empty_commit_date(self, mock_get_commit, mock_get_tags):
         commit = "1e28eed17697"
-        exp_tag = "Unknown"
         commit_date = None
         mock_get_commit.return_value = self._get_commit_obj(commit, commit_date)
         mock_get_tags.return_value = ([], 0)
         lk_repo = CLinuxKernelRepo(None, commit)
-        self.assertEqual(lk_repo.get_tag(), exp_tag)
+        with self.assertRaises(CResolveError) as context:
+            lk_repo.get_tag()
+        self.assertEqual(context.exception.commit, commit)
+
+    @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_tags")
+    @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_commit")
+    def test_empty_commit_date_with_tags(self, mock_get_commit, mock_get_tags):
+        commit = "1e28eed17697"
+        tags = [("v5.12", "a5e13c6df0e41702d2b2c77c8ad41677ebb065b3", "2021-03-28T22:48:16Z")]
+        mock_get_commit.return_value = self._get_commit_obj(commit, None)
+        mock_get_tags.return_value = (self._get_tag_objs(tags), len(tags))
+        lk_repo = CLinuxKernelRepo(None, commit)
+        with self.assertRaises(CResolveError):
+            lk_repo.get_tag()
+        mock_get_tags.assert_not_called()
 
     @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_tags")
     @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_commit")
@@ -84,6 +100,86 @@ class CLinuxKernelRepoUnitTest(unittest.TestCase):
         lk_repo = CLinuxKernelRepo(None, commit)
         self.assertEqual(lk_repo.get_tag(), exp_tag)
 
+    @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_tag_commit_date")
+    @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._list_tags")
+    @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_commit")
+    def test_get_tag_indexed(self, mock_get_commit, mock_list_tags, mock_get_tag_commit_date):
+        commit = "1e28eed17697"
+        tags = [
+            ("v5.12", "a5e13c6df0e41702d2b2c77c8ad41677ebb065b3", "2021-03-28T22:48:16Z"),
+            ("v5.11", "0d02ec6b3136c73c09e7859f0d0e4e2c4c07b49b", "2021-03-21T22:48:16Z"),
+            ("v5.10", "1e28eed17697bcf343c6743f0028cc3b5dd88bf0", "2021-03-14T22:48:16Z"),
+        ]
+        tag_dates = {
+            sha: tag_obj.commit.commit.committer.date
+            for (_, sha, _), tag_obj in zip(tags, self._get_tag_objs(tags))
+        }
+        mock_get_commit.return_value = self._get_commit_obj(commit, "2021-03-20T08:33:34Z")
+        mock_list_tags.return_value = iter([TagEntry(tag, sha, None) for tag, sha, _ in tags])
+        mock_get_tag_commit_date.side_effect = tag_dates.get
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            lk_repo = CLinuxKernelRepo(None, commit, cache_dir)
+            self.assertEqual(lk_repo.get_tag(), "v5.11")
+            self.assertEqual(mock_list_tags.call_count, 1)
+            num_date_fetches = mock_get_tag_commit_date.call_count
+
+            # Warm lookup, answered from the index and the commit cache
+            lk_repo = CLinuxKernelRepo(None, commit, cache_dir)
+            self.assertEqual(lk_repo.get_tag(), "v5.11")
+            self.assertEqual(mock_list_tags.call_count, 1)
+            self.assertEqual(mock_get_tag_commit_date.call_count, num_date_fetches)
+            self.assertEqual(mock_get_commit.call_count, 1)
+
+    @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_tags")
+    @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_commit")
+    def test_get_tags_for_commits(self, mock_get_commit, mock_get_tags):
+        tags = [
+            ("v5.12", "a5e13c6df0e41702d2b2c77c8ad41677ebb065b3", "2021-03-28T22:48:16Z"),
+            ("v5.11", "0d02ec6b3136c73c09e7859f0d0e4e2c4c07b49b", "2021-03-21T22:48:16Z"),
+            ("v5.10", "1e28eed17697bcf343c6743f0028cc3b5dd88bf0", "2021-03-14T22:48:16Z"),
+        ]
+        commits = [
+            ("1e28eed17697", "2021-03-20T08:33:34Z", "v5.11"),
+            ("12345789abc", "2021-03-13T08:33:34Z", "v5.10"),
+            ("a5e13c6df0e4", "2021-03-29T08:33:34Z", "Unmerged"),
+        ]
+        mock_get_commit.side_effect = [
+            self._get_commit_obj(commit, date) for commit, date, _ in commits
+        ]
+        mock_get_tags.return_value = (self._get_tag_objs(tags), len(tags))
+        lk_repo = CLinuxKernelRepo(None, commits[0][0])
+        self.assertEqual(
+            list(lk_repo.get_tags_for_commits(commit for commit, _, _ in commits)),
+            [(commit, exp_tag) for commit, _, exp_tag in commits],
+        )
+        self.assertEqual(mock_get_tags.call_count, 1)
+
+    @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_tags")
+    @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_commit")
+    def test_tag_dates_fetched_once(self, mock_get_commit, mock_get_tags):
+        tags = [
+            (f"v5.{minor}", f"{minor:040x}", f"2021-03-{minor:02}T22:48:16Z")
+            for minor in range(20, 0, -1)
+        ]
+        commit_dates = ["2021-03-10T08:33:34Z", "2021-03-11T08:33:34Z", "2021-03-10T08:33:34Z"]
+        mock_get_commit.side_effect = [
+            self._get_commit_obj("1e28eed17697", date) for date in commit_dates
+        ]
+        mock_get_tags.return_value = (self._get_tag_objs(tags), len(tags))
+        lk_repo = CLinuxKernelRepo(None, "1e28eed17697")
+        with patch.object(lk_repo.probes, "fetch_date", wraps=lk_repo.probes.fetch_date) as fetch:
+            results = list(lk_repo.get_tags_for_commits(["1e28eed17697"] * 3))
+            self.assertEqual([tag for _, tag in results], ["v5.10", "v5.11", "v5.10"])
+            fetched = [call.args[1] for call in fetch.call_args_list]
+            self.assertEqual(len(fetched), len(set(fetched)))
+            self.assertEqual(lk_repo.probes.misses, len(fetched))
+            self.assertGreater(lk_repo.probes.hits, 0)
+
+    def test_read_commits(self):
+        lines = ["1e28eed17697\n", "\n", "# fixes\n", "  a5e13c6df0e4  # v5.12 fix\n"]
+        self.assertEqual(list(read_commits(lines)), ["1e28eed17697", "a5e13c6df0e4"])
+
     def test_get_tag(self):
         commit = "1e28eed17697"
         exp_tag = "v5.11"
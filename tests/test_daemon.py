@@ -0,0 +1,292 @@
+import errno
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from datetime import timedelta
+from unittest import mock
+from unittest.mock import Mock
+
+from github import GithubException
+
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+from lk_compat_helper.daemon import (
+    CDaemonClient,
+    CLatencyStats,
+    SOCKET_NAME,
+    CResolverServer,
+    default_socket_path,
+)
+from lk_compat_helper.errors import CCommitNotFoundError, error_message
+from lk_compat_helper.graphql import parse_date
+from tests.fake_github import CFakeGithub, make_tags
+
+TAGS = {"1e28eed17697": "v5.12", "a5e13c6df0e4": "Unmerged"}
+
+
+def fake_repo():
+    # Answers as from a snapshot, without Github.
+    repo = Mock(local_repo=None, lookup_failed=False)
+    repo.get_tags_for_commits.side_effect = lambda commits: iter(
+        [(commit, TAGS[commit]) for commit in commits]
+    )
+    return repo
+
+
+class CLatencyStatsUnitTest(unittest.TestCase):
+    def test_percentiles(self):
+        stats = CLatencyStats(max_samples=100)
+        self.assertEqual(stats.summary(), {"requests": 0, "p50_ms": 0.0, "p99_ms": 0.0})
+        for ms in range(1, 201):
+            stats.record(ms / 1000)
+        # Only the latest samples are kept.
+        self.assertEqual(stats.summary(), {"requests": 200, "p50_ms": 150.0, "p99_ms": 199.0})
+
+
+class CResolverServerUnitTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        # Cleaned up last, after the servers are stopped.
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = default_socket_path(tmp_dir.name)
+        self.repo = fake_repo()
+
+    def _serve(self, refresh_interval=3600):
+        server = CResolverServer(self.path, self.repo, refresh_interval)
+        server.start()
+        thread = threading.Thread(
+            target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+            self.assertFalse(os.path.exists(self.path))
+
+        self.addCleanup(stop)
+        return server
+
+    def test_resolve(self):
+        server = self._serve()
+        client = CDaemonClient(self.path)
+        commits = ["1e28eed17697", "a5e13c6df0e4", "1e28eed17697"]
+        expected = [(commit, TAGS[commit]) for commit in commits]
+        self.assertEqual(client.resolve(commits), expected)
+        self.assertEqual(self.repo.get_tags_for_commits.call_count, 2)
+        # Releases are kept, the pending ones are resolved again.
+        self.assertEqual(client.resolve(commits), expected)
+        self.repo.get_tags_for_commits.assert_called_with(["a5e13c6df0e4"])
+        self.assertEqual(client.resolve(commits[:1]), expected[:1])
+        self.assertEqual(self.repo.get_tags_for_commits.call_count, 3)
+
+        stats = client.stats()
+        # Requests, not commits.
+        self.assertEqual(stats["requests"], 3)
+        self.assertLessEqual(stats["p50_ms"], stats["p99_ms"])
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+        self.repo.refresh_tags.assert_called_once_with()
+        self.assertIs(server.repo, self.repo)
+
+    def test_errors(self):
+        self._serve()
+        answer = fake_repo().get_tags_for_commits.side_effect
+
+        def get_tags_for_commits(commits):
+            if commits == ["f00"]:
+                raise CCommitNotFoundError("f00: No commit found", "f00", 422)
+            if commits == ["c0ffee"]:
+                raise GithubException(403, {"message": "API rate limit exceeded"}, {})
+            return answer(commits)
+
+        self.repo.get_tags_for_commits.side_effect = get_tags_for_commits
+        client = CDaemonClient(self.path)
+        # Each failure in its commit's answer, the other commits are still resolved.
+        results = client.resolve(["1e28eed17697", "f00", "c0ffee", "a5e13c6df0e4"])
+        self.assertEqual(
+            [results[0], results[3]], [("1e28eed17697", "v5.12"), ("a5e13c6df0e4", "Unmerged")]
+        )
+        self.assertEqual(
+            [(commit, error.commit, error.status, str(error)) for commit, error in results[1:3]],
+            [
+                ("f00", "f00", 422, "f00: No commit found"),
+                ("c0ffee", "c0ffee", 403, "c0ffee: API rate limit exceeded"),
+            ],
+        )
+
+        rejected = {"error": {"status": 400, "message": "Malformed request"}}
+        with mock.patch.object(client, "request", return_value=rejected):
+            with self.assertRaises(GithubException) as context:
+                client.resolve(["1e28eed17697"])
+        self.assertEqual(context.exception.status, 400)
+        self.assertEqual(error_message(context.exception), "Malformed request")
+
+        self.assertEqual(client.request({"op": "frobnicate"})["error"]["status"], 400)
+        # Answered on the same connection, which stays up for the next request.
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.path)
+            stream = sock.makefile("rwb")
+            for request in (b'{"op": "resolve"}', b'{"op": "resolve", "commits": [[1]]}'):
+                stream.write(request + b"\n")
+                stream.flush()
+                self.assertIn(b'"status": 400', stream.readline())
+            stream.write(b'{"op": "resolve", "commits": ["1e28eed17697"]}\n')
+            stream.flush()
+            self.assertIn(b'"v5.12"', stream.readline())
+            stream.close()
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.path)
+            sock.sendall(b"not json\n")
+            self.assertIn(b'"status": 400', sock.makefile("rb").readline())
+
+    def test_concurrent_lookups(self):
+        tags = make_tags(40)
+        date = parse_date(tags[20][2]) - timedelta(hours=1)
+        slow, fast = "5a3f0c9e2b7d", "0d02ec6b3136"
+        fetching = threading.Event()
+        release = threading.Event()
+        with CFakeGithub(tags) as fake:
+            fake.commits.update(
+                {commit: date.strftime("%Y-%m-%dT%H:%M:%SZ") for commit in (slow, fast)}
+            )
+            self.repo = CLinuxKernelRepo(None, "", api_url=fake.url, request_rate=10000)
+            fetch_commit = self.repo.fetch_commit
+
+            def fetch_slowly(commit, *args, **kwargs):
+                if commit == slow:
+                    fetching.set()
+                    self.assertTrue(release.wait(5))
+                return fetch_commit(commit, *args, **kwargs)
+
+            self.repo.fetch_commit = fetch_slowly
+            self._serve()
+            results = []
+            thread = threading.Thread(
+                target=lambda: results.append(CDaemonClient(self.path).resolve([slow]))
+            )
+            thread.start()
+            self.assertTrue(fetching.wait(5))
+            # Still fetching the first commit, the other requests are not held up.
+            self.assertEqual(CDaemonClient(self.path, timeout=5).resolve([fast]), [(fast, "v2.2")])
+            release.set()
+            thread.join()
+        self.assertEqual(results, [[(slow, "v2.2")]])
+
+    def test_no_daemon(self):
+        client = CDaemonClient(self.path)
+        self.assertIsNone(client.resolve(["1e28eed17697"]))
+        self.assertIsNone(client.stats())
+
+    def test_socket_in_use(self):
+        # Left behind by a daemon which was killed.
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.bind(self.path)
+        self._serve()
+        with self.assertRaises(OSError) as context:
+            CResolverServer(self.path, fake_repo(), 3600)
+        self.assertEqual(context.exception.errno, errno.EADDRINUSE)
+        path = os.path.join(os.path.dirname(self.path), "missing", SOCKET_NAME)
+        with self.assertRaises(FileNotFoundError):
+            CResolverServer(path, fake_repo(), 3600)
+
+    def test_dropped_connection(self):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.bind(self.path)
+            sock.listen()
+            result = []
+            thread = threading.Thread(
+                target=lambda: result.append(CDaemonClient(self.path).stats())
+            )
+            thread.start()
+            sock.accept()[0].close()
+            thread.join()
+        self.assertEqual(result, [None])
+
+    def test_timeout(self):
+        # Stuck, the client gives up and resolves in its own process.
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.bind(self.path)
+            sock.listen()
+            with self.assertLogs("__main__", "WARNING") as logs:
+                self.assertIsNone(CDaemonClient(self.path, timeout=0.05).resolve(["1e28eed17697"]))
+        self.assertIn("did not answer in 0.05s", logs.output[0])
+
+    def test_refresh(self):
+        refreshed = threading.Event()
+        self.repo.swap_tags.side_effect = lambda tags: refreshed.set()
+        server = self._serve(refresh_interval=0.01)
+        self.assertTrue(refreshed.wait(5))
+        self.repo.swap_tags.assert_called_with(self.repo.fetch_tags.return_value)
+
+        self.repo.fetch_tags.side_effect = GithubException(502, "Bad Gateway", {})
+        with self.assertLogs("__main__", "WARNING") as logs:
+            server.refresh()
+        self.assertIn("502 Bad Gateway", logs.output[0])
+
+    def test_lookups_during_refresh(self):
+        fetching = threading.Event()
+        release = threading.Event()
+
+        def fetch_tags():
+            fetching.set()
+            self.assertTrue(release.wait(5))
+
+        self.repo.fetch_tags.side_effect = fetch_tags
+        server = self._serve()
+        refresher = threading.Thread(target=server.refresh)
+        refresher.start()
+        self.assertTrue(fetching.wait(5))
+        # Still listing the new tags, the lookups are answered with the current ones.
+        self.assertEqual(
+            CDaemonClient(self.path).resolve(["a5e13c6df0e4"]), [("a5e13c6df0e4", "Unmerged")]
+        )
+        release.set()
+        refresher.join()
+        self.repo.swap_tags.assert_called_once_with(None)
+
+
+class CLinuxKernelRepoRefreshUnitTest(unittest.TestCase):
+    def test_refresh_tags(self):
+        tags = make_tags(250)
+        with CFakeGithub(tags[1:]) as fake:
+            lk_repo = CLinuxKernelRepo(None, "1e28eed17697", api_url=fake.url)
+            lk_repo.refresh_tags()
+            self.assertEqual(lk_repo.tags[1], 249)
+            self.assertEqual(lk_repo.tags[0][0].name, tags[1][0])
+            fake.tags = tags
+            lk_repo.refresh_tags()
+            self.assertEqual(lk_repo.tags[1], 250)
+            self.assertEqual(lk_repo.tags[0][0].name, tags[0][0])
+
+    def test_refresh_indexed(self):
+        tags = make_tags(250)
+        for backend in ("rest", "graphql"):
+            with CFakeGithub(tags[2:]) as fake, tempfile.TemporaryDirectory() as cache_dir:
+                lk_repo = CLinuxKernelRepo(
+                    None, "", cache_dir, api_url=fake.url, backend=backend, request_rate=10000
+                )
+                lk_repo.refresh_tags()
+                timeline = lk_repo.timeline
+                num_requests = len(fake.requests)
+                # The new -rc is listed though the index is fresh, one request.
+                fake.tags = tags[1:]
+                new_tags = lk_repo.fetch_tags()
+                self.assertEqual(len(fake.requests), num_requests + 1, backend)
+                self.assertEqual(new_tags[1], 249)
+                self.assertEqual(new_tags[0][0].name, tags[1][0])
+                # Not in use until swapped in.
+                self.assertEqual(lk_repo.tags[1], 248)
+                self.assertIs(lk_repo.timeline, timeline)
+                lk_repo.swap_tags(new_tags)
+                self.assertIs(lk_repo.tags, new_tags)
+                if backend == "graphql":
+                    # Dated along with the listing, the timeline is built from the new tags.
+                    self.assertIsNot(lk_repo.timeline, timeline)
+
+                fake.tags = tags
+                self.assertEqual(lk_repo.update_index(), 1)
+                self.assertEqual(len(fake.requests), num_requests + 2, backend)
+                self.assertEqual(lk_repo.update_index(), 0)
+                with self.assertRaises(ValueError):
+                    CLinuxKernelRepo(None, "", api_url=fake.url).update_index()
@@ -0,0 +1,142 @@
+import fcntl
+import os
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+from lk_compat_helper.file_lock import LOCK_STRIPES, CKeyLocks, file_lock
+from lk_compat_helper.graphql import parse_date
+from lk_compat_helper.resolver import CResolver
+from lk_compat_helper.tag_index import CTagIndex, TagEntry
+from tests.fake_github import CFakeGithub, CSyntheticCommits, make_tags
+
+NUM_COMMITS = 100000
+NUM_JOBS = 16
+
+
+class CFileLockUnitTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+
+    def test_exclusive(self):
+        path = os.path.join(self.tmp_dir, "tags.sqlite.lock")
+        acquired = threading.Event()
+
+        def waiter():
+            with file_lock(path):
+                acquired.set()
+
+        with file_lock(path):
+            thread = threading.Thread(target=waiter)
+            thread.start()
+            self.assertFalse(acquired.wait(0.1))
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+
+    def test_key_locks(self):
+        locks = CKeyLocks(os.path.join(self.tmp_dir, "locks"))
+        for idx in range(LOCK_STRIPES * 4):
+            with locks.lock(f"key {idx}"):
+                pass
+        self.assertLessEqual(len(os.listdir(locks.path)), LOCK_STRIPES)
+
+    def test_lock_many(self):
+        locks = CKeyLocks(os.path.join(self.tmp_dir, "locks"))
+        # Keys sharing lock files, locked in sets overlapping in opposite orders.
+        keys = [f"key {idx}" for idx in range(LOCK_STRIPES * 2)]
+
+        def lock_all(keys):
+            for _ in range(20):
+                with locks.lock_many(keys):
+                    pass
+
+        with ThreadPoolExecutor(2) as executor:
+            list(executor.map(lock_all, [keys, keys[::-1]]))
+        self.assertLessEqual(len(os.listdir(locks.path)), LOCK_STRIPES)
+
+    def test_concurrent_syncs(self):
+        path = os.path.join(self.tmp_dir, "tags.sqlite")
+        tags = [TagEntry(f"v5.{idx}", f"{idx:040x}", None) for idx in reversed(range(20))]
+        listed = []
+
+        def sync():
+            tag_index = CTagIndex(path)
+            try:
+                return tag_index.sync(iter(listed.append(tag) or tag for tag in tags), False)
+            finally:
+                tag_index.close()
+
+        with ThreadPoolExecutor(8) as executor:
+            self.assertEqual(sorted(executor.map(lambda _: sync(), range(8))), [0] * 7 + [20])
+        # Listed once, the other syncs found the index fresh.
+        self.assertEqual(listed, tags)
+
+
+class CSharedCacheUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.tags = make_tags(250)
+        start = parse_date(self.tags[-1][2]) - timedelta(weeks=2)
+        end = parse_date(self.tags[0][2]) + timedelta(weeks=2)
+        self.synthetic = CSyntheticCommits(NUM_COMMITS, start, end)
+        self.commits = [self.synthetic.sha(idx) for idx in range(0, NUM_COMMITS, 4999)]
+
+    def _fake(self):
+        fake = CFakeGithub(self.tags)
+        fake.synthetic = self.synthetic
+        fake.latency = 0.01
+        return fake
+
+    def _resolve(self, fake, cache_dir, backend):
+        resolver = CResolver(None, cache_dir, api_url=fake.url, request_rate=10000, backend=backend)
+        return resolver.resolve_many(self.commits)
+
+    def test_fan_out(self):
+        for backend in ("rest", "graphql"):
+            with tempfile.TemporaryDirectory() as cache_dir, self._fake() as fake:
+                expected = self._resolve(fake, cache_dir, backend)
+                one_job = len(fake.requests)
+            with tempfile.TemporaryDirectory() as cache_dir, self._fake() as fake:
+                # Cold, each job with its own caches' connections, as separate runs would be.
+                with ThreadPoolExecutor(NUM_JOBS) as executor:
+                    results = list(
+                        executor.map(
+                            lambda _: self._resolve(fake, cache_dir, backend), range(NUM_JOBS)
+                        )
+                    )
+                self.assertEqual(results, [expected] * NUM_JOBS)
+                self.assertEqual(len(fake.requests), one_job, backend)
+
+    def test_rate_limited_unlocked(self):
+        with tempfile.TemporaryDirectory() as cache_dir, self._fake() as fake:
+            lock_dir = os.path.join(cache_dir, "locks")
+            lk_repo = CLinuxKernelRepo("token", "", cache_dir, api_url=fake.url, request_rate=10000)
+            sleeps = []
+
+            def sleep(seconds):
+                # Waiting for the rate limits holds none of the locks up.
+                for name in os.listdir(lock_dir):
+                    with open(os.path.join(lock_dir, name)) as lock_file:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                sleeps.append(seconds)
+
+            lk_repo.rate_limiter.sleep = sleep
+            fake.secondary_limited = 1
+            lk_repo.prefetch_commits(self.commits)
+            self.assertIsNotNone(lk_repo.take_prefetched(self.commits[0]))
+            fake.secondary_limited = 1
+            url = f"{fake.url}/repos/torvalds/linux/tags"
+            self.assertEqual(lk_repo.session.get(url).status_code, 200)
+            self.assertEqual(len(sleeps), 2)
+            self.assertEqual(lk_repo.stats.counters["rate_limited_retries"], 2)
+
+            # The last attempt's answer is the caller's.
+            fake.secondary_limited = 10
+            lk_repo.rate_limiter.max_retries = 1
+            num_requests = len(fake.requests)
+            self.assertEqual(lk_repo.session.get(url + "?page=2").status_code, 403)
+            self.assertEqual(len(fake.requests) - num_requests, 2)
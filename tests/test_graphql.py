@@ -0,0 +1,187 @@
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch, Mock
+
+from github import GithubException  # type: ignore
+
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo, resolve_in_repos
+from lk_compat_helper.graphql import CGraphQLClient, graphql_url, parse_date
+from lk_compat_helper.tag_index import TagEntry
+from tests.fake_github import CFakeGithub, CSyntheticCommits, make_tags
+
+NUM_COMMITS = 100000
+
+
+class CGraphQLClientUnitTest(unittest.TestCase):
+    def test_iter_tags_paged(self):
+        tags = make_tags(250)
+        with CFakeGithub(tags) as fake:
+            client = CGraphQLClient("token", f"{fake.url}/graphql")
+            self.assertEqual(
+                list(client.iter_tags("torvalds/linux")),
+                [TagEntry(name, sha, parse_date(date)) for name, sha, date in tags],
+            )
+            self.assertEqual(fake.requests, ["POST /graphql"] * 3)
+
+    def test_iter_tags_lazy(self):
+        with CFakeGithub(make_tags(250)) as fake:
+            client = CGraphQLClient(None, f"{fake.url}/graphql")
+            next(client.iter_tags("torvalds/linux"))
+            self.assertEqual(len(fake.requests), 1)
+
+    def test_iter_tags_skips_tree_tags(self):
+        tags = [
+            ("v2.6.12-rc2", "9e734775f7c22d2f89943ad6c745571f1930105f", "2005-04-16T22:20:36Z"),
+            ("v2.6.11-tree", None, "2005-03-02T07:38:00Z"),
+        ]
+        with CFakeGithub(tags) as fake:
+            client = CGraphQLClient(None, f"{fake.url}/graphql")
+            self.assertEqual(
+                [tag.name for tag in client.iter_tags("torvalds/linux")], ["v2.6.12-rc2"]
+            )
+
+    def test_errors(self):
+        with CFakeGithub([]) as fake:
+            client = CGraphQLClient(None, f"{fake.url}/graphql")
+            with self.assertRaises(GithubException) as ctx:
+                client.query("{ viewer { login } }", {})
+            self.assertEqual(ctx.exception.data["message"], "Unsupported query")
+
+            client = CGraphQLClient(None, f"{fake.url}/unknown")
+            with self.assertRaises(GithubException) as ctx:
+                client.query("{ viewer { login } }", {})
+            self.assertEqual(ctx.exception.status, 404)
+
+    def test_get_commits(self):
+        tags = make_tags(40)
+        start = parse_date(tags[-1][2])
+        synthetic = CSyntheticCommits(NUM_COMMITS, start, start + timedelta(weeks=40))
+        commits = [synthetic.sha(idx) for idx in range(0, NUM_COMMITS, 400)]
+        # Abbreviated, missing and a tree rather than a commit.
+        commits += [commits[1][:12], "f" * 40, "v2.6.11-tree"]
+        with CFakeGithub(tags) as fake:
+            fake.synthetic = synthetic
+            client = CGraphQLClient("token", f"{fake.url}/graphql")
+            found = client.get_commits("torvalds/linux", commits)
+            self.assertEqual(fake.requests, ["POST /graphql"] * 3)
+        self.assertEqual(len(found), 253)
+        self.assertEqual(found[commits[3]], (commits[3], parse_date(synthetic.date(1200))))
+        self.assertEqual(found[commits[1][:12]], found[commits[1]])
+        self.assertIsNone(found["f" * 40])
+        self.assertIsNone(found["v2.6.11-tree"])
+
+    def test_graphql_url(self):
+        self.assertEqual(graphql_url("https://api.github.com"), "https://api.github.com/graphql")
+        self.assertEqual(
+            graphql_url("https://github.example.com/api/v3"),
+            "https://github.example.com/api/graphql",
+        )
+
+    def test_parse_date(self):
+        self.assertEqual(parse_date("2021-03-28T22:48:16Z"), datetime(2021, 3, 28, 22, 48, 16))
+        self.assertEqual(parse_date("2021-03-29T00:48:16+02:00"), datetime(2021, 3, 28, 22, 48, 16))
+
+
+@patch("github.Github", Mock())
+@patch("github.Github.get_repo", Mock())
+class CLinuxKernelRepoGraphQLUnitTest(unittest.TestCase):
+    @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_commit")
+    def test_get_tag(self, mock_get_commit):
+        tags = make_tags(1000)
+        commit_date = datetime(2021, 1, 1)
+        mock_get_commit.return_value.commit.committer.date = commit_date
+        exp_tag = "v7.1"
+        with CFakeGithub(tags) as fake:
+            lk_repo = CLinuxKernelRepo(None, "1e28eed17697", backend="graphql", api_url=fake.url)
+            self.assertEqual(lk_repo.get_tag(), exp_tag)
+            self.assertEqual(len(fake.requests), 10)
+
+
+class CLinuxKernelRepoPrefetchUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.tags = make_tags(40)
+        start = parse_date(self.tags[-1][2])
+        self.synthetic = CSyntheticCommits(NUM_COMMITS, start, start + timedelta(weeks=40))
+        self.commits = [self.synthetic.sha(idx) for idx in range(0, NUM_COMMITS, 400)]
+
+    def _fake(self):
+        fake = CFakeGithub(self.tags)
+        fake.synthetic = self.synthetic
+        return fake
+
+    @staticmethod
+    def _repo(fake, token="token", cache_dir=None):
+        return CLinuxKernelRepo(
+            token, "", cache_dir, backend="graphql", api_url=fake.url, request_rate=10000
+        )
+
+    def test_batch(self):
+        with self._fake() as fake:
+            expected = list(self._repo(fake, None).get_tags_for_commits(self.commits))
+            num_requests = len(fake.requests)
+            lk_repo = self._repo(fake)
+            self.assertEqual(list(lk_repo.get_tags_for_commits(self.commits)), expected)
+            # The tag listing and 3 commit queries, no commit fetched on its own.
+            self.assertEqual(fake.requests[num_requests:], ["POST /graphql"] * 4)
+            self.assertEqual(lk_repo.prefetched, {})
+            self.assertEqual(lk_repo.commit_sha, self.commits[-1])
+
+    def test_missing(self):
+        with self._fake() as fake:
+            lk_repo = self._repo(fake)
+            results = lk_repo.get_tags_for_commits([self.commits[0], "f" * 40])
+            next(results)
+            with self.assertRaises(GithubException) as context:
+                next(results)
+            self.assertEqual(context.exception.status, 422)
+            self.assertEqual(len([r for r in fake.requests if "/commits/" in r]), 0)
+
+    def test_resolve_each(self):
+        commits = [self.commits[0], "f" * 40, self.commits[1]]
+        with self._fake() as fake:
+            expected = list(self._repo(fake, None).get_tags_for_commits(self.commits[:2]))
+            lk_repo = self._repo(fake)
+            results = list(lk_repo.resolve_each(commits))
+            # A failed commit query, the commits are then fetched one by one.
+            lk_repo = self._repo(fake)
+            failure = GithubException(502, "Bad Gateway", None)
+            with patch.object(lk_repo, "prefetch_commits", side_effect=[failure, None, None, None]):
+                refetched = list(lk_repo.resolve_each(commits))
+        self.assertEqual(
+            [(c, str(tag)) for c, tag in refetched], [(c, str(tag)) for c, tag in results]
+        )
+        self.assertEqual([results[0], results[2]], expected)
+        commit, error = results[1]
+        self.assertEqual((commit, error.commit, error.status), ("f" * 40, "f" * 40, 422))
+
+    def test_cached(self):
+        with self._fake() as fake, tempfile.TemporaryDirectory() as cache_dir:
+            lk_repo = self._repo(fake, cache_dir=cache_dir)
+            lk_repo.prefetch_commits(self.commits[:10])
+            self.assertEqual(len(lk_repo.commit_cache), 10)
+            num_requests = len(fake.requests)
+            lk_repo = self._repo(fake, cache_dir=cache_dir)
+            lk_repo.prefetch_commits(self.commits[:10])
+            self.assertEqual(len(fake.requests), num_requests)
+            lk_repo.prefetch_commits(self.commits[5:15])
+            self.assertEqual(list(lk_repo.prefetched), self.commits[10:15])
+
+    def test_trees(self):
+        with self._fake() as fake:
+            date = self.synthetic.date(400)
+            next_tags = [(name.replace("v", "next-"), sha, date) for name, sha, date in self.tags]
+            fake.add_tree("netdev/net-next", next_tags)[self.commits[1]] = date
+            mainline = self._repo(fake)
+            net_next = CLinuxKernelRepo(
+                "token",
+                "",
+                backend="graphql",
+                api_url=fake.url,
+                repo_name="netdev/net-next",
+                shared_with=mainline,
+            )
+            results = resolve_in_repos([mainline, net_next], self.commits[:3])
+            self.assertEqual([tags["netdev/net-next"] for _, tags in results][0], "Unmerged")
+            self.assertNotEqual([tags["netdev/net-next"] for _, tags in results][1], "Unmerged")
+            self.assertEqual(len([r for r in fake.requests if "/commits/" in r]), 0)
@@ -0,0 +1,88 @@
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, Mock
+
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+from lk_compat_helper.local_git import CLocalGitRepo
+from tests.git_repo import CGitRepo
+
+
+@unittest.skipUnless(shutil.which("git"), "git is not installed")
+class CLocalGitRepoUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        repo = CGitRepo(self.tmp_dir.name)
+        self.commits = {}
+        self.commits["v1.0-rc1"] = repo.commit("first")
+        repo.tag("v1.0-rc1")
+        self.commits["v1.0"] = repo.commit("second")
+        repo.tag("v1.0")
+        self.commits["v1.1-rc1"] = repo.commit("third")
+        repo.tag("v1.1-rc1")
+        self.commits["unmerged"] = repo.commit("fourth")
+        self.git_dir = repo.git_dir
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_is_git_dir(self):
+        self.assertTrue(CLocalGitRepo.is_git_dir(self.git_dir))
+        self.assertFalse(CLocalGitRepo.is_git_dir(self.tmp_dir.name + "/missing"))
+        with patch("subprocess.run", Mock(side_effect=FileNotFoundError)):
+            self.assertFalse(CLocalGitRepo.is_git_dir(self.git_dir))
+
+    def test_resolve_commit(self):
+        local_repo = CLocalGitRepo(self.git_dir)
+        self.addCleanup(local_repo.close)
+        sha = self.commits["v1.0"]
+        self.assertEqual(local_repo.resolve_commit(sha[:12]), sha)
+        self.assertEqual(local_repo.resolve_commit(sha), sha)
+        self.assertIsNone(local_repo.resolve_commit("1e28eed17697"))
+        # Tags do not count as commits
+        self.assertEqual(local_repo.resolve_commit("v1.0"), sha)
+        local_repo.close()
+        local_repo.close()
+
+    def test_get_tag(self):
+        local_repo = CLocalGitRepo(self.git_dir)
+        self.addCleanup(local_repo.close)
+        self.assertEqual(local_repo.get_tag(self.commits["v1.0-rc1"]), "v1.0")
+        self.assertEqual(local_repo.get_tag(self.commits["v1.0"][:12]), "v1.0")
+        self.assertEqual(local_repo.get_tag(self.commits["v1.1-rc1"]), "Unknown")
+        self.assertEqual(local_repo.get_tag(self.commits["unmerged"]), "Unmerged")
+        self.assertIsNone(local_repo.get_tag("1e28eed17697"))
+
+
+@unittest.skipUnless(shutil.which("git"), "git is not installed")
+@patch("github.Github.get_repo", Mock())
+class CLinuxKernelRepoLocalGitUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        repo = CGitRepo(self.tmp_dir.name)
+        self.commit = repo.commit("first")
+        repo.tag("v1.0")
+        self.git_dir = repo.git_dir
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_commit")
+    def test_get_tag_local(self, mock_get_commit):
+        lk_repo = CLinuxKernelRepo(None, self.commit, git_dir=self.git_dir)
+        self.addCleanup(lk_repo.local_repo.close)
+        self.assertEqual(lk_repo.get_tag(), "v1.0")
+        mock_get_commit.assert_not_called()
+
+    @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_tags")
+    @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_commit")
+    def test_get_tag_fallback(self, mock_get_commit, mock_get_tags):
+        mock_get_tags.return_value = ([], 0)
+        lk_repo = CLinuxKernelRepo(None, "1e28eed17697", git_dir=self.git_dir)
+        self.addCleanup(lk_repo.local_repo.close)
+        self.assertEqual(lk_repo.get_tag(), "Unknown")
+        mock_get_commit.assert_called_once()
+
+    def test_not_a_git_dir(self):
+        lk_repo = CLinuxKernelRepo(None, self.commit, git_dir=self.tmp_dir.name + "/missing")
+        self.assertIsNone(lk_repo.local_repo)
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+
+from github import GithubException
+
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo, resolve_in_repos
+from lk_compat_helper.graphql import parse_date
+from tests.fake_github import CFakeGithub, make_tags
+
+COMMITS = ["5a3f0c9e2b7d41c6a8f9e0d1b2c3a4f5e6d7c8b9", "0d02ec6b3136c73c09e7859f0d0e4e2c4c07b49b"]
+
+
+class CResolveInReposUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.tags = make_tags(40)
+        # net-next is tagged at its own pace, a day after each mainline tag.
+        self.next_tags = [
+            (name.replace("v", "next-"), sha, (parse_date(date) + timedelta(days=1)).isoformat())
+            for name, sha, date in self.tags
+        ]
+        self.commit_date = parse_date(self.tags[20][2]) - timedelta(hours=1)
+
+    def _fake(self):
+        fake = CFakeGithub(self.tags)
+        date = self.commit_date.strftime("%Y-%m-%dT%H:%M:%SZ")
+        fake.commits.update({commit: date for commit in COMMITS})
+        # Only the first commit is in net-next.
+        fake.add_tree("netdev/net-next", self.next_tags)[COMMITS[0]] = date
+        return fake
+
+    def _repos(self, fake, cache_dir=None):
+        mainline = CLinuxKernelRepo(None, "", cache_dir, api_url=fake.url, backend="graphql")
+        net_next = CLinuxKernelRepo(
+            None,
+            "",
+            cache_dir,
+            api_url=fake.url,
+            backend="graphql",
+            repo_name="netdev/net-next",
+            shared_with=mainline,
+        )
+        return [mainline, net_next]
+
+    def test_merged_report(self):
+        with self._fake() as fake:
+            repos = self._repos(fake)
+            self.assertEqual(
+                resolve_in_repos(repos, COMMITS),
+                [
+                    (COMMITS[0], {"torvalds/linux": "v2.2", "netdev/net-next": "next-2.2"}),
+                    (COMMITS[1], {"torvalds/linux": "v2.2", "netdev/net-next": "Unmerged"}),
+                ],
+            )
+            # One session, its stats count the requests of both trees.
+            self.assertIs(repos[1].session, repos[0].session)
+            self.assertEqual(repos[0].get_stats()["counters"]["http_requests"], len(fake.requests))
+
+    def test_caches_per_tree(self):
+        with self._fake() as fake, tempfile.TemporaryDirectory() as cache_dir:
+            resolve_in_repos(self._repos(fake, cache_dir), COMMITS[:1])
+            num_requests = len(fake.requests)
+            resolve_in_repos(self._repos(fake, cache_dir), COMMITS[:1])
+            self.assertEqual(len(fake.requests), num_requests)
+            for name in ("tags.sqlite", "tags-netdev-net-next.sqlite", "commits.sqlite"):
+                self.assertTrue(os.path.exists(os.path.join(cache_dir, name)), name)
+
+    def test_errors(self):
+        with self._fake() as fake:
+            repos = self._repos(fake)
+            repos[1].linux_kernel_repo = repos[1].handle.get_repo("netdev/missing", lazy=True)
+            with self.assertRaises(GithubException) as context:
+                resolve_in_repos(repos, COMMITS)
+            self.assertEqual(context.exception.status, 404)
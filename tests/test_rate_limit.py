@@ -0,0 +1,243 @@
+import unittest
+from unittest.mock import Mock
+
+import requests
+from github import GithubException
+
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+from lk_compat_helper.rate_limit import (
+    CORE,
+    GRAPHQL,
+    RESET_MARGIN,
+    SECONDARY_BACKOFF,
+    CRateLimiter,
+    CTokenBucket,
+    parse_tokens,
+)
+from lk_compat_helper.transport import CGithubAdapter, new_session
+from tests.fake_github import CFakeGithub, make_tags
+
+
+class CFakeClock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+        self.sleeps = []
+        self.on_sleep = Mock()
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        self.on_sleep()
+
+
+def make_response(status, headers=None, body=b""):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = body
+    return response
+
+
+class CTokenBucketUnitTest(unittest.TestCase):
+    def test_burst_then_paced(self):
+        clock = CFakeClock()
+        bucket = CTokenBucket(rate=2.0, burst=3, clock=clock)
+        self.assertEqual([bucket.take() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertEqual(bucket.take(), 0.5)
+        # The next caller queues behind the reserved slot.
+        self.assertEqual(bucket.take(), 1.0)
+        clock.sleep(10)
+        self.assertEqual(bucket.take(), 0.0)
+        self.assertEqual(bucket.level, 2.0)
+
+
+class CRateLimiterUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = CFakeClock()
+
+    def _rate_limiter(self, tokens, **kwargs):
+        return CRateLimiter(tokens, clock=self.clock, sleep=self.clock.sleep, **kwargs)
+
+    def test_parse_tokens(self):
+        self.assertEqual(parse_tokens(None), [])
+        self.assertEqual(parse_tokens(""), [])
+        self.assertEqual(parse_tokens("a"), ["a"])
+        self.assertEqual(parse_tokens(" a, b,,c "), ["a", "b", "c"])
+
+    def test_anonymous(self):
+        rate_limiter = self._rate_limiter([])
+        self.assertIsNone(rate_limiter.acquire().token)
+
+    def test_most_remaining_first(self):
+        rate_limiter = self._rate_limiter(["a", "b"])
+        state_a, state_b = rate_limiter.states
+        reset = str(int(self.clock() + 600))
+        rate_limiter.update(
+            state_a, make_response(200, {"X-RateLimit-Remaining": "10", "X-RateLimit-Reset": reset})
+        )
+        rate_limiter.update(
+            state_b, make_response(200, {"X-RateLimit-Remaining": "12", "X-RateLimit-Reset": reset})
+        )
+        self.assertEqual(
+            [rate_limiter.acquire().token for _ in range(5)], ["b", "b", "a", "b", "a"]
+        )
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_reset_passed(self):
+        rate_limiter = self._rate_limiter(["a"])
+        state = rate_limiter.states[0]
+        exhausted = make_response(
+            403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(self.clock() - 1))}
+        )
+        self.assertTrue(rate_limiter.update(state, exhausted))
+        self.clock.sleep(RESET_MARGIN)
+        self.assertIs(rate_limiter.acquire(), state)
+        self.assertIsNone(state.remaining)
+        self.assertEqual(self.clock.sleeps, [RESET_MARGIN])
+
+    def test_secondary_backoff(self):
+        rate_limiter = self._rate_limiter(["a"])
+        state = rate_limiter.states[0]
+        limited = make_response(
+            403, body=b'{"message": "You have exceeded a secondary rate limit"}'
+        )
+        self.assertTrue(rate_limiter.update(state, limited))
+        self.assertEqual(state.blocked_until, self.clock() + SECONDARY_BACKOFF)
+        self.assertTrue(rate_limiter.update(state, limited))
+        self.assertEqual(state.blocked_until, self.clock() + 2 * SECONDARY_BACKOFF)
+        rate_limiter.acquire()
+        self.assertEqual(self.clock.sleeps, [2 * SECONDARY_BACKOFF])
+
+        self.assertFalse(rate_limiter.update(state, make_response(200)))
+        self.assertEqual(state.backoff, SECONDARY_BACKOFF)
+
+        self.assertTrue(rate_limiter.update(state, make_response(429, {"Retry-After": "7"})))
+        self.assertEqual(state.blocked_until, self.clock() + 7)
+
+    def test_forbidden_not_retried(self):
+        rate_limiter = self._rate_limiter(["a"])
+        forbidden = make_response(403, body=b'{"message": "Resource not accessible"}')
+        self.assertFalse(rate_limiter.update(rate_limiter.states[0], forbidden))
+
+    def test_max_wait(self):
+        rate_limiter = self._rate_limiter(["a"], max_wait=60)
+        exhausted = make_response(
+            403,
+            {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(self.clock() + 600))},
+        )
+        self.assertTrue(rate_limiter.update(rate_limiter.states[0], exhausted))
+        with self.assertRaises(GithubException) as context:
+            rate_limiter.acquire()
+        self.assertEqual(context.exception.status, 403)
+
+    def test_resources_apart(self):
+        rate_limiter = self._rate_limiter(["a"], max_wait=60)
+        exhausted = {
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset": str(int(self.clock() + 600)),
+        }
+        state = rate_limiter.acquire(GRAPHQL)
+        self.assertEqual(state.resource, GRAPHQL)
+        rate_limiter.update(state, make_response(200, exhausted))
+        # The REST budget is untouched.
+        self.assertIs(rate_limiter.acquire(CORE), rate_limiter.states[0])
+        with self.assertRaises(GithubException):
+            rate_limiter.acquire(GRAPHQL)
+        # Recorded for the resource Github reports.
+        state = rate_limiter.acquire(CORE)
+        rate_limiter.update(
+            state, make_response(200, {"X-RateLimit-Resource": "search", **exhausted})
+        )
+        self.assertIsNone(state.remaining)
+        self.assertEqual(rate_limiter.resources["search"][0].remaining, 0)
+
+
+class CGithubAdapterRateLimitUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = CFakeClock()
+        self.tags = make_tags(10)
+
+    def _session(self, tokens, **kwargs):
+        rate_limiter = CRateLimiter(tokens, clock=self.clock, sleep=self.clock.sleep, **kwargs)
+        return new_session(CGithubAdapter(rate_limiter=rate_limiter))
+
+    def test_tokens_pooled_until_reset(self):
+        with CFakeGithub(self.tags) as fake:
+            fake.rate_limit = 2
+            fake.reset = int(self.clock() + 100)
+            session = self._session(["a", "b"])
+            url = f"{fake.url}/repos/torvalds/linux/tags"
+            for _ in range(4):
+                self.assertEqual(session.get(url).status_code, 200)
+            self.assertEqual(self.clock.sleeps, [])
+
+            # Both tokens are out of requests, the limiter waits for the reset.
+            self.clock.on_sleep = fake.used.clear
+            self.assertEqual(session.get(url).status_code, 200)
+            self.assertEqual(self.clock.sleeps, [100 + RESET_MARGIN])
+            self.assertEqual(
+                fake.authorizations,
+                ["token a", "token b", "token a", "token b", "token a"],
+            )
+
+    def test_graphql_budget_apart(self):
+        with CFakeGithub(self.tags) as fake:
+            fake.rate_limit = 1
+            fake.reset = int(self.clock() + 100)
+            session = self._session(["a"])
+            response = session.post(f"{fake.url}/graphql", json={"query": "{}", "variables": {}})
+            self.assertEqual(response.headers["X-RateLimit-Remaining"], "0")
+            # The GraphQL budget is spent, REST requests go on without waiting for its reset.
+            self.assertEqual(session.get(f"{fake.url}/repos/torvalds/linux/tags").status_code, 200)
+            self.assertEqual(self.clock.sleeps, [])
+
+    def test_secondary_limit_retried(self):
+        with CFakeGithub(self.tags) as fake:
+            fake.secondary_limited = 1
+            session = self._session(["a"])
+            response = session.get(f"{fake.url}/repos/torvalds/linux/tags")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.clock.sleeps, [2.0])
+            self.assertEqual(len(fake.requests), 2)
+
+    def test_own_token_kept(self):
+        with CFakeGithub(self.tags) as fake:
+            fake.rate_limit = 100
+            fake.reset = int(self.clock() + 100)
+            session = self._session(["a"])
+            url = f"{fake.url}/repos/torvalds/linux/tags"
+            self.assertEqual(session.get(url).status_code, 200)
+            rate_limiter = session.get_adapter(url).rate_limiter
+            self.assertEqual(rate_limiter.states[0].remaining, 99)
+            response = session.get(url, headers={"Authorization": "token app-token"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(fake.authorizations, ["token a", "token app-token"])
+            # Not accounted to the pool either.
+            self.assertEqual(rate_limiter.states[0].remaining, 99)
+
+    def test_max_retries(self):
+        with CFakeGithub(self.tags) as fake:
+            fake.secondary_limited = 10
+            session = self._session(["a"], max_retries=2)
+            response = session.get(f"{fake.url}/repos/torvalds/linux/tags")
+            self.assertEqual(response.status_code, 403)
+            self.assertEqual(len(fake.requests), 3)
+
+
+class CLinuxKernelRepoRateLimitUnitTest(unittest.TestCase):
+    def test_token_pool(self):
+        tags = make_tags(10)
+        with CFakeGithub(tags) as fake:
+            lk_repo = CLinuxKernelRepo("a,b", "1e28eed17697", backend="graphql", api_url=fake.url)
+            fake.rate_limit = 1
+            fake.reset = 2_000_000_000
+            self.assertEqual(len(lk_repo._load_tags()[0]), 10)
+            self.assertEqual(fake.authorizations, ["bearer a"])
+            # GraphQL spent a's GraphQL budget only.
+            lk_repo.tag_pages.get_page(1)
+            self.assertEqual(fake.authorizations, ["bearer a", "token a"])
+            lk_repo.tag_pages.get_page(2)
+            self.assertEqual(fake.authorizations, ["bearer a", "token a", "token b"])
@@ -0,0 +1,251 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+
+import requests
+from github import GithubException
+
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+from lk_compat_helper.errors import CCommitNotFoundError, CResolveError, from_github_exception
+from lk_compat_helper.graphql import parse_date
+from lk_compat_helper.resolver import (
+    RC,
+    RELEASE,
+    UNKNOWN,
+    UNMERGED,
+    CResolver,
+    Resolution,
+    to_record,
+)
+from lk_compat_helper.snapshot import write_snapshot
+from tests.fake_github import CFakeGithub, CSyntheticCommits, make_tags
+
+NUM_COMMITS = 100000
+
+
+class CResolutionUnitTest(unittest.TestCase):
+    def test_of(self):
+        self.assertEqual(Resolution.of("c", "v5.12"), Resolution("c", "v5.12", RELEASE))
+        self.assertEqual(Resolution.of("c", "v5.12-rc3"), Resolution("c", "v5.12-rc3", RC))
+        self.assertEqual(Resolution.of("c", "Unmerged"), Resolution("c", None, UNMERGED))
+        self.assertEqual(Resolution.of("c", "Unknown"), Resolution("c", None, UNKNOWN))
+        # Only in RCs so far.
+        rc_only = Resolution.of("c", "Unknown", lookup_failed=False)
+        self.assertEqual(rc_only, Resolution("c", None, RC))
+        self.assertEqual(rc_only.answer, "Unknown")
+        for tag in ("v5.12", "v5.12-rc3", "Unmerged", "Unknown"):
+            self.assertEqual(Resolution.of("c", tag).answer, tag)
+
+    def test_errors(self):
+        error = from_github_exception(GithubException(500, {"message": "Server Error"}, {}))
+        self.assertNotIsInstance(error, CCommitNotFoundError)
+        self.assertEqual((str(error), error.commit, error.status), ("Server Error", None, 500))
+        error = from_github_exception(GithubException(422, "No commit found", {}), "f00")
+        self.assertIsInstance(error, CCommitNotFoundError)
+        self.assertEqual(str(error), "f00: No commit found")
+
+
+class CResolverUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.tags = make_tags(100)
+        start = parse_date(self.tags[-1][2]) - timedelta(weeks=2)
+        end = parse_date(self.tags[0][2]) + timedelta(weeks=2)
+        self.synthetic = CSyntheticCommits(NUM_COMMITS, start, end)
+        self.commits = [self.synthetic.sha(idx) for idx in range(0, NUM_COMMITS, 4999)]
+
+    def _fake(self):
+        fake = CFakeGithub(self.tags)
+        fake.synthetic = self.synthetic
+        return fake
+
+    @staticmethod
+    def _resolver(fake, cache_dir=None, **kwargs):
+        return CResolver(None, cache_dir, api_url=fake.url, request_rate=10000, **kwargs)
+
+    def test_same_answers(self):
+        for kwargs in ({}, {"backend": "graphql"}):
+            with self._fake() as fake:
+                lk_repo = CLinuxKernelRepo(None, "", api_url=fake.url, request_rate=10000)
+                expected = list(lk_repo.get_tags_for_commits(self.commits))
+                resolver = self._resolver(fake, **kwargs)
+                resolutions = resolver.resolve_many(self.commits)
+                self.assertEqual([(r.commit, r.answer) for r in resolutions], expected)
+                # The newest commits are only in RCs.
+                self.assertEqual({r.status for r in resolutions}, {RELEASE, RC}, kwargs)
+                for resolution in resolutions:
+                    self.assertEqual(resolution.sha, resolution.commit)
+                    self.assertEqual(
+                        resolution.commit_date,
+                        parse_date(self.synthetic.date(int(resolution.sha[:8], 16))),
+                    )
+                self.assertEqual(resolver.resolve(self.commits[5][:10]).tag, expected[5][1])
+
+    def test_threads(self):
+        with self._fake() as fake:
+            resolver = self._resolver(fake)
+            expected = resolver.resolve_many(self.commits)
+            with ThreadPoolExecutor(8) as executor:
+                self.assertEqual(list(executor.map(resolver.resolve, self.commits)), expected)
+            # One tag listing for the resolver's lifetime.
+            self.assertEqual(len([r for r in fake.requests if "/tags" in r]), 1)
+            stats = resolver.repo.get_stats()["counters"]
+            self.assertEqual(stats["lookups"], 2 * len(self.commits))
+            resolver.refresh()
+            self.assertEqual(len([r for r in fake.requests if "/tags" in r]), 2)
+
+    def test_cached(self):
+        with self._fake() as fake, tempfile.TemporaryDirectory() as cache_dir:
+            expected = self._resolver(fake, cache_dir).resolve_many(self.commits)
+            num_requests = len(fake.requests)
+            resolver = self._resolver(fake, cache_dir)
+            self.assertEqual(resolver.resolve_many(self.commits), expected)
+            self.assertEqual([r for r in fake.requests[num_requests:] if "/commits/" in r], [])
+
+    def test_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "linux.lkts")
+            commit_date = parse_date(self.synthetic.date(0))
+            dated_tags = [(name, parse_date(date)) for name, _, date in self.tags]
+            write_snapshot(path, dated_tags, {self.commits[0]: commit_date})
+            resolver = CResolver(snapshot=path)
+            self.assertEqual(resolver.resolve(self.commits[0]).tag, "v2.0")
+            self.assertEqual([r.tag for r in resolver.resolve_iter(self.commits[:1], 4)], ["v2.0"])
+            self.assertEqual(
+                resolver.resolve_many(self.commits[:2]),
+                [
+                    Resolution(self.commits[0], "v2.0", RELEASE, None, commit_date),
+                    Resolution(self.commits[1], None, UNKNOWN),
+                ],
+            )
+
+    def test_errors(self):
+        with self._fake() as fake:
+            resolver = self._resolver(fake)
+            for commit in ("f" * 40, "v5.12-rc3"):
+                with self.assertRaises(CCommitNotFoundError) as context:
+                    resolver.resolve_many([self.commits[0], commit])
+                self.assertEqual(context.exception.commit, commit)
+                self.assertIsInstance(context.exception.__cause__, GithubException)
+            resolver = self._resolver(fake, repo_name="netdev/missing")
+            with self.assertRaises(CResolveError) as context:
+                resolver.refresh()
+            self.assertEqual(context.exception.status, 404)
+
+    def test_resolve_iter(self):
+        with self._fake() as fake:
+            fake.latency = 0.01
+            resolver = self._resolver(fake, backend="graphql")
+            expected = resolver.resolve_many(self.commits)
+            commits = self.commits[:5] + ["f" * 40] + self.commits[5:]
+            for ordered in (False, True):
+                # Read lazily, a generator is enough.
+                results = list(resolver.resolve_iter((c for c in commits), 4, ordered))
+                errors = [r for r in results if isinstance(r, CResolveError)]
+                self.assertEqual([e.commit for e in errors], ["f" * 40])
+                resolutions = [r for r in results if isinstance(r, Resolution)]
+                if ordered:
+                    self.assertIs(results[5], errors[0])
+                    self.assertEqual(resolutions, expected)
+                else:
+                    self.assertCountEqual(resolutions, expected)
+            self.assertEqual(list(resolver.resolve_iter([], 4)), [])
+
+    def test_iter_request_errors(self):
+        with self._fake() as fake:
+            resolver = self._resolver(fake)
+            fetch_commit = resolver.repo.fetch_commit
+
+            def fetch_or_fail(commit):
+                if commit == self.commits[1]:
+                    raise requests.ConnectionError("Connection reset by peer")
+                return fetch_commit(commit)
+
+            with mock.patch.object(resolver.repo, "fetch_commit", side_effect=fetch_or_fail):
+                results = list(resolver.resolve_iter(self.commits[:3], 2, ordered=True))
+            self.assertIsInstance(results[0], Resolution)
+            self.assertIsInstance(results[2], Resolution)
+            self.assertEqual(
+                to_record(results[1]),
+                {
+                    "commit": self.commits[1],
+                    "error": f"{self.commits[1]}: Connection reset by peer",
+                    "status": None,
+                },
+            )
+            timeout = requests.Timeout("Read timed out")
+            with mock.patch.object(resolver.repo, "get_tags_for_dates", side_effect=timeout):
+                (result,) = resolver.resolve_iter(self.commits[3:4], 2)
+            self.assertIsInstance(result, CResolveError)
+            self.assertEqual((result.commit, str(result)), (self.commits[3], "Read timed out"))
+
+    def test_to_record(self):
+        commit_date = parse_date("2021-03-20T08:33:34Z")
+        resolution = Resolution("1e28eed", "v5.12", RELEASE, "1e28eed" + "0" * 33, commit_date)
+        self.assertEqual(
+            json.loads(json.dumps(to_record(resolution))),
+            {
+                "commit": "1e28eed",
+                "tag": "v5.12",
+                "status": "release",
+                "sha": "1e28eed" + "0" * 33,
+                "commit_date": "2021-03-20T08:33:34Z",
+            },
+        )
+        self.assertEqual(to_record(Resolution("1e28eed", None, UNKNOWN))["commit_date"], None)
+        error = CCommitNotFoundError("1e28eed: No commit found", "1e28eed", 422)
+        self.assertEqual(
+            to_record(error),
+            {"commit": "1e28eed", "error": "1e28eed: No commit found", "status": 422},
+        )
+
+    def test_jsonl_stats(self):
+        with self._fake() as fake, tempfile.TemporaryDirectory() as cache_dir:
+            args = ["--api-url", fake.url, "--cache-dir", cache_dir, "--request-rate", "10000"]
+            args += ["-a", "token", "--no-daemon", "--jsonl", "--stats"]
+            for commit in self.commits[:3]:
+                args += ["-c", commit]
+            process = subprocess.run(
+                [sys.executable, "-m", "lk_compat_helper.commit_to_tag"] + args,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+                check=True,
+            )
+        records = [json.loads(line) for line in process.stdout.splitlines()]
+        self.assertEqual([record["commit"] for record in records], self.commits[:3])
+        self.assertIn('"http_requests": ', process.stderr)
+
+    def test_bulk(self):
+        with self._fake() as fake:
+            expected = self._resolver(fake).resolve_many(self.commits)
+            num_requests = len(fake.requests)
+            resolver = CResolver("token", api_url=fake.url, request_rate=10000, backend="graphql")
+            self.assertEqual(resolver.resolve_many(self.commits), expected)
+            # The tag listing and one commits query.
+            self.assertEqual(fake.requests[num_requests:], ["POST /graphql"] * 2)
+            with self.assertRaises(CCommitNotFoundError) as context:
+                resolver.resolve_many(self.commits[:3] + ["f" * 40])
+            self.assertEqual(context.exception.commit, "f" * 40)
+
+    def test_bulk_iter(self):
+        with self._fake() as fake:
+            expected = self._resolver(fake).resolve_many(self.commits)
+            num_requests = len(fake.requests)
+            resolver = CResolver("token", api_url=fake.url, request_rate=10000, backend="graphql")
+            results = list(resolver.resolve_iter(self.commits, 4, ordered=True))
+            self.assertEqual(results, expected)
+            # The tag listing and one commits query per window of 8 commits.
+            self.assertEqual(fake.requests[num_requests:], ["POST /graphql"] * 4)
+
+            resolver = CResolver("token", api_url=fake.url, request_rate=10000, backend="graphql")
+            failure = GithubException(502, {"message": "Server Error"}, None)
+            with mock.patch.object(resolver.repo, "prefetch_commits", side_effect=failure):
+                results = list(resolver.resolve_iter(self.commits[:3], 4, ordered=True))
+            # Fetched one by one instead.
+            self.assertEqual(results, expected[:3])
@@ -0,0 +1,159 @@
+import base64
+import json
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo, load_snapshot
+from lk_compat_helper.graphql import parse_date
+from lk_compat_helper.snapshot import (
+    HEADER,
+    MAGIC,
+    CSnapshot,
+    cached_commit_dates,
+    default_snapshot_path,
+    import_snapshot,
+    write_snapshot,
+)
+from lk_compat_helper.tag_index import TagEntry, to_epoch
+from lk_compat_helper.tag_timeline import CTagTimeline
+from lk_compat_helper.transport import CGithubAdapter, CResponseCache, new_session
+from tests.fake_github import CFakeGithub, make_tags
+
+SHAS = [
+    "1e28eed17697c1a5e13c6df0e41702d2b2c77c8a",
+    "1e28eed17697c1a5e13c6df0e41702d2b2c77c8b",
+    "a5e13c6df0e41702d2b2c77c8ad41677ebb065b3",
+    "a6000000000000000000000000000000000000ff",
+]
+
+
+class CSnapshotUnitTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        self.path = os.path.join(self.tmp_dir, "linux.lkts")
+        self.tags = [(name, parse_date(date)) for name, _, date in make_tags(100)]
+        self.commit_dates = {sha: self.tags[idx * 10][1] for idx, sha in enumerate(SHAS)}
+
+    def _open(self, path=None):
+        snapshot = CSnapshot(path or self.path)
+        self.addCleanup(snapshot.close)
+        return snapshot
+
+    def test_round_trip(self):
+        # Written in any order, searched newest first.
+        write_snapshot(self.path, reversed(self.tags), self.commit_dates)
+        snapshot = self._open()
+        timeline = CTagTimeline.from_tags([TagEntry(name, "", date) for name, date in self.tags])
+        self.assertEqual(snapshot.timeline.names, timeline.names)
+        for epoch in range(to_epoch(self.tags[-1][1]) - 1, to_epoch(self.tags[0][1]) + 2, 3600):
+            self.assertEqual(snapshot.timeline.lookup(epoch), timeline.lookup(epoch))
+        self.assertEqual(snapshot.timeline.lookup_many([0]), [timeline.lookup(0)])
+
+        for sha, date in self.commit_dates.items():
+            self.assertEqual(snapshot.commit_epoch(sha), to_epoch(date))
+        self.assertEqual(snapshot.commit_epoch("A5E13C6"), to_epoch(self.commit_dates[SHAS[2]]))
+        self.assertEqual(snapshot.commit_epoch("a6000"), to_epoch(self.commit_dates[SHAS[3]]))
+        # Ambiguous, too short, not a SHA and missing.
+        for commit in ("1e28eed17697", "a5e", "v5.12-rc3", "ffff", SHAS[0] + "0"):
+            self.assertIsNone(snapshot.commit_epoch(commit), commit)
+
+    def test_empty(self):
+        write_snapshot(self.path, [], {})
+        snapshot = self._open()
+        self.assertEqual(len(snapshot.timeline), 0)
+        self.assertIsNone(snapshot.commit_epoch(SHAS[0]))
+
+    def test_invalid(self):
+        write_snapshot(self.path, self.tags, self.commit_dates)
+        with open(self.path, "rb") as snapshot_file:
+            data = snapshot_file.read()
+        header = list(HEADER.unpack_from(data))
+        bad_version = HEADER.pack(*header[:1], 2, *header[2:]) + data[HEADER.size :]
+        for name, content in (
+            ("empty", b""),
+            ("short", MAGIC),
+            ("magic", b"LKTX" + data[4:]),
+            ("version", bad_version),
+            ("truncated", data[:-1]),
+        ):
+            path = os.path.join(self.tmp_dir, name)
+            with open(path, "wb") as snapshot_file:
+                snapshot_file.write(content)
+            with self.assertRaises(ValueError, msg=name):
+                CSnapshot(path)
+            with self.assertRaises(ValueError, msg=name):
+                import_snapshot(path, self.tmp_dir)
+        self.assertFalse(os.path.exists(default_snapshot_path(self.tmp_dir)))
+
+    def test_import(self):
+        write_snapshot(self.path, self.tags, self.commit_dates)
+        cache_dir = os.path.join(self.tmp_dir, "cache")
+        installed = import_snapshot(self.path, cache_dir)
+        self.assertEqual(installed, default_snapshot_path(cache_dir))
+        self.assertEqual(
+            self._open(installed).commit_epoch(SHAS[2]), self._open().commit_epoch(SHAS[2])
+        )
+
+    def test_cached_commit_dates(self):
+        tags = make_tags(10)
+        cache = CResponseCache(os.path.join(self.tmp_dir, "http"))
+        with CFakeGithub(tags) as fake:
+            session = new_session(CGithubAdapter(cache))
+            session.get(f"{fake.url}/repos/torvalds/linux/tags")
+            session.get(f"{fake.url}/repos/torvalds/linux/commits/{tags[2][1]}")
+            session.get(f"{fake.url}/repos/torvalds/linux/commits/{tags[3][1][:12]}")
+        git_commit = {"sha": SHAS[0], "committer": {"date": "2021-03-13T08:33:34Z"}}
+        cache.put(
+            "git",
+            {
+                "url": f"https://api.github.com/repos/torvalds/linux/git/commits/{SHAS[0]}",
+                "status": 200,
+                "body": base64.b64encode(json.dumps(git_commit).encode()).decode(),
+            },
+        )
+        self.assertEqual(
+            cached_commit_dates(cache),
+            {tags[2][1]: parse_date(tags[2][2]), SHAS[0]: parse_date("2021-03-13T08:33:34Z")},
+        )
+
+
+class CLinuxKernelRepoSnapshotUnitTest(unittest.TestCase):
+    def test_export_then_offline(self):
+        tags = make_tags(40)
+        commit = SHAS[2]
+        commit_date = parse_date(tags[10][2]) - timedelta(hours=1)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "linux.lkts")
+            with CFakeGithub(tags) as fake:
+                fake.commits[commit] = commit_date.strftime("%Y-%m-%dT%H:%M:%SZ")
+                lk_repo = CLinuxKernelRepo(None, commit, tmp_dir, api_url=fake.url)
+                online = lk_repo.get_tag()
+                # The tags' commits are cached too.
+                self.assertEqual(lk_repo.export_snapshot(path, [SHAS[2][:12]]), (40, 41))
+
+                lk_repo = CLinuxKernelRepo(None, commit, tmp_dir, api_url=fake.url)
+                self.assertEqual(lk_repo.export_snapshot(path), (40, 41))
+                num_requests = len(fake.requests)
+
+                lk_repo = CLinuxKernelRepo(None, commit, api_url=fake.url, snapshot=path)
+                self.assertEqual(lk_repo.get_tag(), online)
+                self.assertEqual(lk_repo.commit_date, commit_date)
+                with self.assertLogs("__main__", "ERROR"):
+                    self.assertEqual(
+                        list(lk_repo.get_tags_for_commits([SHAS[0]])), [(SHAS[0], "Unknown")]
+                    )
+                self.assertEqual(len(fake.requests), num_requests)
+                lk_repo.snapshot.close()
+
+                # Loaded by the caller, lk-get-tag reports its own errors.
+                snapshot = load_snapshot(path)
+                lk_repo = CLinuxKernelRepo(None, commit, api_url=fake.url, snapshot=snapshot)
+                self.assertIs(lk_repo.snapshot, snapshot)
+                self.assertEqual(lk_repo.get_tag(), online)
+                snapshot.close()
+            with self.assertRaises(ValueError):
+                load_snapshot(os.path.join(tmp_dir, "commits.sqlite"))
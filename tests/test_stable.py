@@ -0,0 +1,152 @@
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+from github import GithubException
+
+from lk_compat_helper.async_resolver import CAsyncResolver
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+from lk_compat_helper.graphql import parse_date
+from lk_compat_helper.stable import parse_series, upstream_commits
+from tests.fake_github import CFakeGithub, make_tags
+
+UPSTREAM = "5a3f0c9e2b7d41c6a8f9e0d1b2c3a4f5e6d7c8b9"
+
+
+class CStableUnitTest(unittest.TestCase):
+    def test_parse_series(self):
+        self.assertEqual(parse_series("5.10, v5.15,"), ["5.10", "5.15"])
+        for value in ("5", "5.10.1", "latest"):
+            with self.assertRaises(ValueError, msg=value):
+                parse_series(value)
+
+    def test_upstream_commits(self):
+        other = "0d02ec6b3136c73c09e7859f0d0e4e2c4c07b49b"
+        message = (
+            f"net: fix it\n\ncommit {UPSTREAM} upstream.\n\n"
+            f"[ Upstream commit {other.upper()} ]\n\nMentions {'1' * 40} in passing.\n"
+        )
+        self.assertEqual(upstream_commits(message), [UPSTREAM, other])
+
+
+class CLinuxKernelRepoStableUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.tags = make_tags(60)
+        # v2.3, its releases are a week apart from v2.0 onwards.
+        self.commit_date = parse_date(self.tags[30][2]) - timedelta(hours=1)
+
+    @staticmethod
+    def _tag_date(fake, name):
+        return next(parse_date(date) for tag, _, date in fake.stable_tags if tag == name)
+
+    def _fake(self):
+        fake = CFakeGithub(self.tags)
+        fake.commits[UPSTREAM] = self.commit_date.strftime("%Y-%m-%dT%H:%M:%SZ")
+        for series in ("2.0", "2.1", "2.2"):
+            release_date = next(
+                parse_date(date) for name, _, date in self.tags if name == f"v{series}"
+            )
+            fake.add_stable_series(series, release_date, 30)
+        fake.add_backport("2.2", UPSTREAM, 7)
+        # Committed before v2.1.16 was made but only queued for v2.1.19.
+        fake.add_backport("2.1", UPSTREAM, 19, self._tag_date(fake, "v2.1.15") + timedelta(hours=1))
+        # Not released yet.
+        fake.add_backport("2.0", UPSTREAM, 30, self._tag_date(fake, "v2.0.30") + timedelta(days=1))
+        return fake
+
+    def test_stable_tags(self):
+        with self._fake() as fake:
+            lk_repo = CLinuxKernelRepo(None, UPSTREAM[:12], api_url=fake.url)
+            tag = lk_repo.get_tag()
+            self.assertEqual(tag, "v2.3")
+            self.assertEqual(
+                lk_repo.get_stable_tags(tag, ["2.0", "2.1", "2.2", "2.3", "2.4"]),
+                {
+                    "2.0": "Unmerged",
+                    "2.1": "v2.1.19",
+                    "2.2": "v2.2.7",
+                    "2.3": "v2.3",
+                    "2.4": "v2.4",
+                },
+            )
+            # Github's commit search only covers the default branch, the stable branches are
+            # listed instead.
+            self.assertFalse([r for r in fake.requests if "/search/" in r])
+            listed = [r for r in fake.requests if "/commits?" in r]
+            self.assertEqual(len(listed), 4)
+            self.assertEqual(
+                [r for r in listed if "sha=linux-2.0.y" in r], listed[:2], "two windows for 2.0"
+            )
+
+    def test_branch_pages(self):
+        with self._fake() as fake, mock.patch("lk_compat_helper.stable.COMMITS_PER_PAGE", 1):
+            lk_repo = CLinuxKernelRepo(None, UPSTREAM, api_url=fake.url)
+            self.assertEqual(lk_repo.get_stable_tags("v2.3", ["2.1"]), {"2.1": "v2.1.19"})
+            # v2.1.14 to v2.1.18 and the backport in the first window, a page each and an empty one.
+            self.assertEqual(len([r for r in fake.requests if "/commits?" in r]), 7)
+
+    def test_async_resolver(self):
+        # A tag's commit, made after the series branched and never backported.
+        other = self.tags[25][1]
+        expected = {
+            UPSTREAM: {"2.1": "v2.1.19", "2.2": "v2.2.7"},
+            other: {"2.1": "Unmerged", "2.2": "Unmerged"},
+        }
+        for commits in ([UPSTREAM, other], [other, UPSTREAM]):
+            with self._fake() as fake:
+                lk_repo = CLinuxKernelRepo(None, "", api_url=fake.url, request_rate=10000)
+                resolver = CAsyncResolver(lk_repo)
+                stable_tags = {
+                    commit: lk_repo.get_stable_tags(
+                        tag, ["2.1", "2.2"], commit, resolver.details.get(commit)
+                    )
+                    for commit, tag in resolver.resolve_many(commits)
+                }
+                self.assertEqual(stable_tags, expected)
+                self.assertEqual(
+                    {commit: sha for commit, (sha, _) in resolver.details.items()},
+                    {UPSTREAM: UPSTREAM, other: other},
+                )
+
+    def test_other_commit(self):
+        with self._fake() as fake:
+            lk_repo = CLinuxKernelRepo(None, self.tags[25][1], api_url=fake.url)
+            lk_repo.get_tag()
+            stable_tags = lk_repo.get_stable_tags("v2.3", ["2.2"], UPSTREAM[:12])
+            self.assertEqual(stable_tags, {"2.2": "v2.2.7"})
+            self.assertEqual(lk_repo.commit_sha, UPSTREAM)
+
+    def test_series_indexed(self):
+        with self._fake() as fake, tempfile.TemporaryDirectory() as cache_dir:
+            for _ in range(2):
+                lk_repo = CLinuxKernelRepo(None, UPSTREAM, cache_dir, api_url=fake.url)
+                self.assertEqual(lk_repo.get_stable_tags("v2.3", ["2.2"]), {"2.2": "v2.2.7"})
+            # The series is listed once, its index answers the second run.
+            self.assertEqual(len([r for r in fake.requests if r.startswith("POST")]), 1)
+            self.assertTrue(os.path.exists(os.path.join(cache_dir, "stable", "v2.2.sqlite")))
+
+    def test_not_backported(self):
+        with self._fake() as fake:
+            lk_repo = CLinuxKernelRepo(None, self.tags[0][1], api_url=fake.url)
+            self.assertEqual(lk_repo.get_stable_tags("Unknown", ["2.2"]), {"2.2": "Unmerged"})
+            self.assertEqual(lk_repo.commit_sha, self.tags[0][1])
+
+    def test_queued_after_last_release(self):
+        with self._fake() as fake:
+            fake.add_stable_series("1.9", self._tag_date(fake, "v2.0.1"), 30)
+            # Committed before v1.9.30 was made but queued after it.
+            fake.add_backport(
+                "1.9", UPSTREAM, 31, self._tag_date(fake, "v1.9.29") + timedelta(hours=1)
+            )
+            lk_repo = CLinuxKernelRepo(None, UPSTREAM, api_url=fake.url)
+            self.assertEqual(lk_repo.get_stable_tags("v2.3", ["1.9"]), {"1.9": "Unmerged"})
+
+    def test_errors(self):
+        with self._fake() as fake:
+            lk_repo = CLinuxKernelRepo(None, UPSTREAM, api_url=fake.url)
+            for path in (f"/repos/gregkh/linux/compare/{UPSTREAM}...v9.9.9", "/nothing"):
+                with self.assertRaises(GithubException) as context:
+                    lk_repo.stable._get(path)
+                self.assertEqual(context.exception.status, 404)
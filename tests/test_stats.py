@@ -0,0 +1,128 @@
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+from lk_compat_helper.graphql import parse_date
+from lk_compat_helper.rate_limit import CRateLimiter
+from lk_compat_helper.stats import CStats
+from lk_compat_helper.transport import CGithubAdapter, CResponseCache, new_session
+from tests.fake_github import CFakeGithub, make_tags
+
+
+class CStatsUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.stats = CStats(clock=lambda: self.now)
+
+    def _run_phase(self, name, seconds):
+        with self.stats.phase(name):
+            self.now += seconds
+
+    def test_report(self):
+        self.assertEqual(self.stats.report(), {"counters": {}, "gauges": {}, "phases": {}})
+        self.stats.count("http_requests")
+        self.stats.count("http_requests", 2)
+        self.stats.gauge("rate_limit_remaining", 4998)
+        self._run_phase("tag_listing", 0.5)
+        self._run_phase("commit_fetch", 0.25)
+        self._run_phase("commit_fetch", 0.25)
+        with self.assertRaises(ValueError):
+            with self.stats.phase("rc_walk"):
+                self.now += 1
+                raise ValueError()
+        self.assertEqual(
+            self.stats.report(),
+            {
+                "counters": {"http_requests": 3},
+                "gauges": {"rate_limit_remaining": 4998},
+                "phases": {
+                    "commit_fetch": {"calls": 2, "seconds": 0.5},
+                    "rc_walk": {"calls": 1, "seconds": 1.0},
+                    "tag_listing": {"calls": 1, "seconds": 0.5},
+                },
+            },
+        )
+
+    def test_prometheus(self):
+        self.assertEqual(self.stats.to_prometheus(), "\n")
+        self.stats.count("lookups")
+        self.stats.gauge("rate_limit_remaining", 12)
+        self._run_phase("commit_fetch", 0.5)
+        expected = [
+            "# TYPE lk_get_tag_lookups_total counter",
+            "lk_get_tag_lookups_total 1",
+            "# TYPE lk_get_tag_rate_limit_remaining gauge",
+            "lk_get_tag_rate_limit_remaining 12",
+            "# TYPE lk_get_tag_phase_calls_total counter",
+            'lk_get_tag_phase_calls_total{phase="commit_fetch"} 1',
+            "# TYPE lk_get_tag_phase_seconds_total counter",
+            'lk_get_tag_phase_seconds_total{phase="commit_fetch"} 0.5',
+        ]
+        self.assertEqual(self.stats.to_prometheus(), "\n".join(expected) + "\n")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "lk_get_tag.prom")
+            self.stats.write_prometheus(path)
+            with open(path) as prom_file:
+                self.assertEqual(prom_file.read(), self.stats.to_prometheus())
+            self.assertEqual(os.listdir(tmp_dir), ["lk_get_tag.prom"])
+
+
+class CGithubAdapterStatsUnitTest(unittest.TestCase):
+    def test_counted(self):
+        tags = make_tags(10)
+        stats = CStats()
+        with CFakeGithub(tags) as fake, tempfile.TemporaryDirectory() as cache_dir:
+            fake.secondary_limited = 1
+            rate_limiter = CRateLimiter([], sleep=lambda _: None)
+            adapter = CGithubAdapter(CResponseCache(cache_dir), rate_limiter, stats)
+            session = new_session(adapter)
+            for _ in range(2):
+                session.get(f"{fake.url}/repos/torvalds/linux/tags")
+                session.get(f"{fake.url}/repos/torvalds/linux/commits/{tags[0][1]}")
+            self.assertEqual(
+                stats.report()["counters"],
+                {
+                    "cache_hits": 1,
+                    "cache_not_modified": 1,
+                    "http_requests": 4,
+                    "rate_limited_retries": 1,
+                },
+            )
+            self.assertEqual(len(fake.requests), 4)
+
+
+class CLinuxKernelRepoStatsUnitTest(unittest.TestCase):
+    def test_lookup_phases(self):
+        tags = make_tags(40)
+        commit = "5a3f0c9e2b7d41c6a8f9e0d1b2c3a4f5e6d7c8b9"
+        commit_date = parse_date(tags[12][2]) - timedelta(hours=1)
+        with CFakeGithub(tags) as fake:
+            fake.commits[commit] = commit_date.strftime("%Y-%m-%dT%H:%M:%SZ")
+            fake.rate_limit = 100
+            fake.reset = 2_000_000_000
+            lk_repo = CLinuxKernelRepo(None, commit, api_url=fake.url)
+            self.assertEqual(lk_repo.get_tag(), "v2.3")
+            stats = lk_repo.get_stats()
+            self.assertEqual(stats["counters"]["lookups"], 1)
+            self.assertEqual(stats["counters"]["http_requests"], len(fake.requests))
+            self.assertEqual(
+                stats["counters"]["tag_probe_misses"],
+                lk_repo.probes.misses,
+            )
+            self.assertEqual(stats["gauges"]["rate_limit_remaining"], 100 - len(fake.requests))
+            self.assertEqual(
+                sorted(stats["phases"]),
+                ["binary_search", "commit_fetch", "linear_scan", "rc_walk", "tag_listing"],
+            )
+
+    def test_timeline_phase(self):
+        tags = make_tags(20)
+        with CFakeGithub(tags) as fake:
+            lk_repo = CLinuxKernelRepo(None, "1e28eed17697", backend="graphql", api_url=fake.url)
+            lk_repo.get_tags_for_dates([parse_date(tags[5][2])])
+            stats = lk_repo.get_stats()
+            self.assertEqual(sorted(stats["phases"]), ["tag_listing", "timeline_lookup"])
+            # Without a rate limit header, nothing is known about it.
+            self.assertEqual(stats["gauges"], {})
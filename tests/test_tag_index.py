@@ -0,0 +1,81 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from typing import Iterator, List
+from unittest.mock import patch
+
+from lk_compat_helper.tag_index import CTagIndex, TagEntry, default_cache_dir, from_epoch, to_epoch
+
+
+class CTagIndexUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "cache", "tags.sqlite")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _tags(self, names: List[str]) -> List[TagEntry]:
+        return [TagEntry(name, f"{idx:040x}", None) for idx, name in enumerate(names)]
+
+    def test_sync_keeps_newest_first(self):
+        tag_index = CTagIndex(self.path)
+        self.assertFalse(tag_index.is_fresh())
+        self.assertEqual(tag_index.sync(self._tags(["v5.12", "v5.11", "v5.10"])), 3)
+        self.assertTrue(tag_index.is_fresh())
+        self.assertEqual([tag.name for tag in tag_index.get_tags()], ["v5.12", "v5.11", "v5.10"])
+
+    def test_sync_stops_at_known_tag(self):
+        tag_index = CTagIndex(self.path)
+        tag_index.sync(self._tags(["v5.11", "v5.10"]))
+
+        def listing() -> Iterator[TagEntry]:
+            yield from self._tags(["v5.13-rc1", "v5.12", "v5.11"])
+            self.fail("Listed past the newest known tag")
+
+        self.assertEqual(tag_index.sync(listing()), 2)
+        self.assertEqual(
+            [tag.name for tag in tag_index.get_tags()], ["v5.13-rc1", "v5.12", "v5.11", "v5.10"]
+        )
+
+    def test_readers_during_sync(self):
+        tag_index = CTagIndex(self.path)
+        tag_index.sync(self._tags(["v5.11", "v5.10"]))
+        reader = CTagIndex(self.path)
+        # A sync in another connection, not committed yet.
+        writer = CTagIndex(self.path)
+        writer.db.execute("BEGIN IMMEDIATE")
+        writer.db.execute("INSERT INTO tags (seq, name, sha) VALUES (3, 'v5.12', '')")
+        self.assertEqual([tag.name for tag in reader.get_tags()], ["v5.11", "v5.10"])
+        writer.db.commit()
+        self.assertEqual([tag.name for tag in reader.get_tags()], ["v5.12", "v5.11", "v5.10"])
+        for index in (tag_index, reader, writer):
+            index.close()
+
+    def test_dates_persist(self):
+        tag_date = datetime(2021, 3, 28, 22, 48, 16)
+        tag_index = CTagIndex(self.path)
+        tag_index.sync(self._tags(["v5.12", "v5.11"]))
+        tag_index.set_date("v5.11", tag_date)
+        tag_index.close()
+
+        tag_index = CTagIndex(self.path)
+        self.assertEqual([tag.date for tag in tag_index.get_tags()], [None, tag_date])
+
+    def test_max_age(self):
+        tag_index = CTagIndex(self.path, max_age=0)
+        tag_index.sync([])
+        self.assertIsNotNone(tag_index.last_sync)
+        self.assertFalse(tag_index.is_fresh())
+
+    def test_epoch_round_trip(self):
+        now = int(time.time())
+        self.assertEqual(to_epoch(from_epoch(now)), now)
+
+    def test_default_cache_dir(self):
+        with patch.dict(os.environ, {"XDG_CACHE_HOME": self.tmp_dir.name}):
+            self.assertEqual(
+                default_cache_dir(), os.path.join(self.tmp_dir.name, "lk-compat-helper")
+            )
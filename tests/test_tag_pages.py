@@ -0,0 +1,103 @@
+import math
+import unittest
+from unittest.mock import patch, Mock
+
+from github import GithubException  # type: ignore
+
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+from lk_compat_helper.graphql import parse_date
+from lk_compat_helper.tag_index import TagEntry
+from lk_compat_helper.tag_pages import CTagPages
+from tests.fake_github import CFakeGithub, make_tags
+
+
+class CTagPagesUnitTest(unittest.TestCase):
+    def test_len_from_last_page(self):
+        with CFakeGithub(make_tags(1050)) as fake:
+            tag_pages = CTagPages("token", "torvalds/linux", fake.url)
+            self.assertEqual(len(tag_pages), 1050)
+            self.assertEqual(fake.pages, [1, 11])
+
+    def test_single_page(self):
+        tags = make_tags(3)
+        with CFakeGithub(tags) as fake:
+            tag_pages = CTagPages(None, "torvalds/linux", fake.url)
+            self.assertEqual(len(tag_pages), 3)
+            self.assertEqual(fake.pages, [1])
+            self.assertEqual(list(tag_pages), [TagEntry(name, sha, None) for name, sha, _ in tags])
+
+    def test_getitem_fetches_only_its_page(self):
+        tags = make_tags(1050)
+        with CFakeGithub(tags) as fake:
+            tag_pages = CTagPages(None, "torvalds/linux", fake.url)
+            len(tag_pages)
+            self.assertEqual(tag_pages[525].name, tags[525][0])
+            self.assertEqual(tag_pages[1049].name, tags[1049][0])
+            self.assertEqual(fake.pages, [1, 11, 6])
+            with self.assertRaises(IndexError):
+                tag_pages[1050]
+
+    def test_lru(self):
+        with CFakeGithub(make_tags(500)) as fake:
+            tag_pages = CTagPages(None, "torvalds/linux", fake.url, max_cached_pages=2)
+            tag_pages.get_page(1)
+            tag_pages.get_page(2)
+            tag_pages.get_page(1)
+            tag_pages.get_page(3)
+            self.assertEqual(list(tag_pages.pages), [1, 3])
+            tag_pages.get_page(2)
+            self.assertEqual(fake.pages, [1, 2, 3, 2])
+
+    def test_setitem_keeps_cached_dates(self):
+        with CFakeGithub(make_tags(150)) as fake:
+            tag_pages = CTagPages(None, "torvalds/linux", fake.url, max_cached_pages=1)
+            tag = tag_pages[120]._replace(date=parse_date("2021-03-28T22:48:16Z"))
+            tag_pages[120] = tag
+            self.assertEqual(tag_pages[120], tag)
+            # Page 1 is not cached anymore, nothing to update
+            tag_pages[0] = tag
+            self.assertNotEqual(tag_pages[0], tag)
+
+    def test_iter(self):
+        tags = make_tags(250)
+        with CFakeGithub(tags) as fake:
+            tag_pages = CTagPages(None, "torvalds/linux", fake.url)
+            self.assertEqual([tag.name for tag in tag_pages], [name for name, _, _ in tags])
+            self.assertEqual(fake.pages, [1, 2, 3])
+
+    def test_errors(self):
+        with CFakeGithub([]) as fake:
+            tag_pages = CTagPages(None, "torvalds/unknown", fake.url)
+            with self.assertRaises(GithubException) as ctx:
+                len(tag_pages)
+            self.assertEqual(ctx.exception.data["message"], "Not Found")
+
+            tag_pages = CTagPages(None, "torvalds/linux", f"{fake.url}/text")
+            with self.assertRaises(GithubException) as ctx:
+                len(tag_pages)
+            self.assertEqual(ctx.exception.status, 404)
+
+
+@patch("github.Github.get_repo", Mock())
+class CLinuxKernelRepoTagPagesUnitTest(unittest.TestCase):
+    @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_tag_commit_date")
+    @patch("lk_compat_helper.commit_to_tag.CLinuxKernelRepo._get_commit")
+    def test_get_tag_log_pages(self, mock_get_commit, mock_get_tag_commit_date):
+        tags = make_tags(1050)
+        tag_dates = {sha: parse_date(date) for _, sha, date in tags}
+        mock_get_commit.return_value.commit.committer.date = parse_date("2021-01-01T00:00:00Z")
+        mock_get_tag_commit_date.side_effect = tag_dates.get
+        with CFakeGithub(tags) as fake:
+            lk_repo = CLinuxKernelRepo(None, "1e28eed17697", api_url=fake.url)
+            self.assertEqual(lk_repo.get_tag(), "v7.1")
+            num_pages = math.ceil(len(tags) / 100)
+            self.assertLessEqual(len(set(fake.pages)), math.ceil(math.log2(num_pages)) + 2)
+            self.assertEqual(len(fake.pages), len(set(fake.pages)))
+
+    def test_list_tags(self):
+        tags = make_tags(250)
+        with CFakeGithub(tags) as fake:
+            lk_repo = CLinuxKernelRepo(None, "1e28eed17697", api_url=fake.url)
+            self.assertEqual(
+                [tag.name for tag in lk_repo._list_tags()], [name for name, _, _ in tags]
+            )
@@ -0,0 +1,30 @@
+import unittest
+from datetime import datetime
+from unittest.mock import Mock
+
+from lk_compat_helper.tag_index import TagEntry
+from lk_compat_helper.tag_probes import CTagProbes
+
+
+class CTagProbesUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.tags = [
+            TagEntry("v5.12", "a5e13c6df0e41702d2b2c77c8ad41677ebb065b3", None),
+            TagEntry("v5.11", "0d02ec6b3136c73c09e7859f0d0e4e2c4c07b49b", None),
+        ]
+        self.fetch_date = Mock(return_value=datetime(2021, 3, 28, 22, 48, 16))
+
+    def test_fetch_once(self):
+        probes = CTagProbes(self.fetch_date)
+        self.assertEqual(probes.get(self.tags, 1), (1616971696, "v5.11"))
+        self.assertEqual(probes.get(self.tags, 1), (1616971696, "v5.11"))
+        probes.get(self.tags, 0)
+        self.assertEqual(self.fetch_date.call_count, 2)
+        self.assertEqual((probes.hits, probes.misses), (1, 2))
+
+    def test_reset(self):
+        probes = CTagProbes(self.fetch_date)
+        probes.get(self.tags, 0)
+        probes.reset()
+        probes.get(self.tags, 0)
+        self.assertEqual(self.fetch_date.call_count, 2)
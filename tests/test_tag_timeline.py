@@ -0,0 +1,99 @@
+import unittest
+from datetime import datetime, timedelta
+
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+from lk_compat_helper.graphql import parse_date
+from lk_compat_helper.tag_index import TagEntry, from_epoch, to_epoch
+from lk_compat_helper.tag_timeline import CTagTimeline, numpy
+from tests.fake_github import make_tags
+
+
+def tag_entries(fake_tags):
+    return [TagEntry(name, sha, parse_date(date)) for name, sha, date in fake_tags]
+
+
+class CTagTimelineUnitTest(unittest.TestCase):
+    def _binary_search(self, tags, epoch):
+        lk_repo = CLinuxKernelRepo(None, "1e28eed17697")
+        lk_repo.tags = (tags, len(tags))
+        lk_repo.commit_date = from_epoch(epoch)
+        return lk_repo._get_tag()
+
+    def _assert_same_answers(self, tags):
+        timeline = CTagTimeline.from_tags(tags)
+        self.assertEqual(len(timeline), len(tags))
+        epochs = sorted({to_epoch(tag.date) + delta for tag in tags for delta in (-1, 0, 1)})
+        expected = [self._binary_search(tags, epoch) for epoch in epochs]
+        self.assertEqual([timeline.lookup(epoch) for epoch in epochs], expected)
+        self.assertEqual(timeline.lookup_many(epochs), expected)
+
+    def test_same_as_binary_search(self):
+        # Histories ending on a release and on RCs, down to a single tag.
+        for num_tags in (1, 2, 3, 7, 8, 9, 16, 50, 150):
+            with self.subTest(num_tags=num_tags):
+                self._assert_same_answers(tag_entries(make_tags(num_tags)))
+
+    def test_same_dates(self):
+        tags = tag_entries(make_tags(24))
+        # Tags made in the same second, as a release and its last RC sometimes are.
+        tags = [tag._replace(date=tags[idx - idx % 2].date) for idx, tag in enumerate(tags)]
+        self._assert_same_answers(tags)
+
+    def test_answers(self):
+        timeline = CTagTimeline.from_tags(tag_entries(make_tags(20)))
+        # v2.0-rc1 .. v2.0 .. v2.1-rc1 .. v2.1 .. v2.2-rc1 .. v2.2-rc4, a week apart.
+        start = to_epoch(datetime(2005, 6, 17))
+        week = 7 * 24 * 3600
+        self.assertEqual(timeline.lookup(start - 1), "v2.0")
+        self.assertEqual(timeline.lookup(start + 8 * week), "v2.1")
+        self.assertEqual(timeline.lookup(start + 15 * week + 1), "Unknown")
+        self.assertEqual(timeline.lookup(start + 20 * week), "Unknown")
+        timeline = CTagTimeline.from_tags(tag_entries(make_tags(16)))
+        self.assertEqual(timeline.lookup(start + 20 * week), "Unmerged")
+        self.assertEqual(timeline.rc.tolist(), [0] + [1] * 7 + [0] + [1] * 7)
+
+    @unittest.skipUnless(numpy, "NumPy is not installed")
+    def test_numpy_same_as_bisect(self):
+        tags = tag_entries(make_tags(40))
+        # Pairs of tags made in the same second.
+        tags = [tag._replace(date=tags[idx - idx % 2].date) for idx, tag in enumerate(tags)]
+        timeline = CTagTimeline.from_tags(tags)
+        self.assertIsNotNone(timeline.np_neg_epochs)
+        epochs = [to_epoch(tag.date) + delta for tag in tags for delta in (-1, 0, 1)]
+        # Before the first tag, after the last, and in no particular order.
+        epochs += [0, to_epoch(tags[0].date) + 10**9, epochs[5], epochs[0]]
+        self.assertEqual(timeline.lookup_many(epochs), [timeline.lookup(e) for e in epochs])
+        self.assertEqual(timeline.lookup_many([]), [])
+
+    def test_without_numpy(self):
+        timeline = CTagTimeline.from_tags(tag_entries(make_tags(20)))
+        epochs = [to_epoch(datetime(2005, 6, 17)) + delta for delta in (-1, 0, 1)]
+        expected = timeline.lookup_many(epochs)
+        timeline.np_neg_epochs = None
+        self.assertEqual(timeline.lookup_many(epochs), expected)
+
+    def test_not_a_timeline(self):
+        tags = tag_entries(make_tags(3))
+        self.assertIsNone(CTagTimeline.from_tags([]))
+        self.assertIsNone(CTagTimeline.from_tags(tags[:1] + [tags[1]._replace(date=None)]))
+        self.assertIsNone(CTagTimeline.from_tags(list(reversed(tags))))
+        self.assertIsNone(CTagTimeline.from_tags([(tag.name, tag.sha) for tag in tags]))
+
+
+class CLinuxKernelRepoTimelineUnitTest(unittest.TestCase):
+    def test_lookups_without_probes(self):
+        tags = tag_entries(make_tags(40))
+        lk_repo = CLinuxKernelRepo(None, "1e28eed17697")
+        lk_repo._get_tags = lambda: (tags, len(tags))
+        dates = [tags[0].date + timedelta(seconds=1)] + [tags[idx].date for idx in (0, 9, 17, 39)]
+        expected = ["Unmerged", "v2.4", "v2.3", "v2.2", "v2.0"]
+        self.assertEqual(lk_repo.get_tags_for_dates(dates), expected)
+        self.assertIsNotNone(lk_repo.timeline)
+        lk_repo.commit_date = dates[2]
+        self.assertEqual(lk_repo._get_tag(), "v2.3")
+        self.assertEqual(lk_repo.probes.misses, 0)
+
+        # Without the timeline, the binary search answers the same.
+        lk_repo.timeline = None
+        self.assertEqual(lk_repo.get_tags_for_dates(dates), expected)
+        self.assertGreater(lk_repo.probes.misses, 0)
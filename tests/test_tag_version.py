@@ -0,0 +1,59 @@
+import unittest
+from datetime import timedelta
+
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+from lk_compat_helper.graphql import parse_date
+from lk_compat_helper.tag_index import TagEntry
+from lk_compat_helper.tag_version import is_rc, parse_version, sort_by_version
+from tests.fake_github import CFakeGithub, make_tags
+
+
+class CTagVersionUnitTest(unittest.TestCase):
+    def test_parse_version(self):
+        self.assertEqual(parse_version("v5.12"), (5, 12, 0, 1, 0))
+        self.assertEqual(parse_version("v5.12-rc3"), (5, 12, 0, 0, 3))
+        self.assertEqual(parse_version("v2.6.39"), (2, 6, 39, 1, 0))
+        self.assertEqual(parse_version("v2.6.12-rc2"), (2, 6, 12, 0, 2))
+        for name in ("v2.6.11-tree", "5.12", "v5.12-rc", "v5", "v5.12.1.2", "latest"):
+            self.assertIsNone(parse_version(name), name)
+
+    def test_order(self):
+        names = ["v2.6.11", "v2.6.12-rc2", "v2.6.12", "v2.6.39", "v3.0-rc1", "v3.0", "v3.9"]
+        names += ["v3.10-rc9", "v3.10-rc10", "v3.10", "v5.12-rc3", "v5.12"]
+        versions = [parse_version(name) for name in names]
+        self.assertEqual(versions, sorted(versions))
+
+    def test_is_rc(self):
+        self.assertTrue(is_rc("v5.12-rc3"))
+        self.assertFalse(is_rc("v5.12"))
+        self.assertFalse(is_rc("v2.6.11-tree"))
+        # Not a version, same as the name test of the listing order.
+        self.assertTrue(is_rc("rc-test"))
+
+    def test_sort_by_version(self):
+        tags = [TagEntry(name, "", None) for name in ("v3.9", "v2.6.11-tree", "v3.10", "v3.10-rc1")]
+        self.assertEqual(
+            [tag.name for tag in sort_by_version(tags)], ["v3.10", "v3.10-rc1", "v3.9"]
+        )
+
+
+class CLinuxKernelRepoVersionOrderUnitTest(unittest.TestCase):
+    def test_listed_by_name(self):
+        tags = make_tags(200)
+        # Listed by name, v2.9 ahead of v2.19 and v3.0 ahead of v2.19.
+        listing = sorted(tags, key=lambda tag: tag[0], reverse=True)
+        release_idx = next(idx for idx, tag in enumerate(tags) if tag[0] == "v2.9")
+        commit = "5a3f0c9e2b7d41c6a8f9e0d1b2c3a4f5e6d7c8b9"
+        commit_date = parse_date(tags[release_idx][2]) - timedelta(hours=1)
+        with CFakeGithub(listing) as fake:
+            fake.commits[commit] = commit_date.strftime("%Y-%m-%dT%H:%M:%SZ")
+            lk_repo = CLinuxKernelRepo(None, commit, api_url=fake.url, tag_order="version")
+            self.assertEqual(lk_repo.get_tag(), "v2.9")
+            self.assertEqual(sorted(fake.pages), [1, 2])
+            # The commit and the probed tags, about log2(200).
+            commit_requests = [request for request in fake.requests if "/commits/" in request]
+            self.assertLessEqual(len(commit_requests), 1 + 10)
+            self.assertEqual([tag.name for tag in lk_repo.tags[0][:2]], ["v3.4", "v3.4-rc7"])
+
+            lk_repo = CLinuxKernelRepo(None, commit, api_url=fake.url)
+            self.assertNotEqual(lk_repo.get_tag(), "v2.9")
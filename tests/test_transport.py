@@ -0,0 +1,254 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import requests
+from github import Github, GithubException
+
+from lk_compat_helper.commit_to_tag import CLinuxKernelRepo
+from lk_compat_helper.graphql import parse_date
+from lk_compat_helper.rate_limit import CRateLimiter
+from lk_compat_helper.transport import (
+    CASSETTE_NAME,
+    CCassette,
+    CGithubAdapter,
+    CResponseCache,
+    new_session,
+)
+from tests.fake_github import CFakeGithub, CSyntheticCommits, make_tags
+
+
+class CGithubAdapterUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = CResponseCache(os.path.join(self.tmp_dir.name, "http"))
+        self.tags = make_tags(150)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_revalidate_with_etag(self):
+        with CFakeGithub(self.tags) as fake:
+            session = new_session(CGithubAdapter(self.cache))
+            url = f"{fake.url}/repos/torvalds/linux/tags?per_page=100&page=2"
+            first = session.get(url)
+            second = session.get(url)
+            self.assertEqual(len(fake.requests), 2)
+            self.assertEqual(fake.not_modified, 1)
+            self.assertEqual(second.status_code, 200)
+            self.assertEqual(second.json(), first.json())
+            self.assertEqual(second.headers["ETag"], first.headers["ETag"])
+
+    def test_accept_in_key(self):
+        with CFakeGithub(self.tags) as fake:
+            session = new_session(CGithubAdapter(self.cache))
+            url = f"{fake.url}/repos/torvalds/linux/tags"
+            session.get(url, headers={"Accept": "application/vnd.github.v3+json"})
+            session.get(url, headers={"Accept": b"application/vnd.github.v3+json"})
+            session.get(url, headers={"Accept": "application/vnd.github.raw"})
+            self.assertEqual(fake.not_modified, 1)
+
+    def test_commit_by_full_sha_without_request(self):
+        sha = self.tags[0][1]
+        with CFakeGithub(self.tags) as fake:
+            session = new_session(CGithubAdapter(self.cache))
+            first = session.get(f"{fake.url}/repos/torvalds/linux/commits/{sha}")
+            # A new session reading the same cache, as the next run would
+            session = new_session(CGithubAdapter(CResponseCache(self.cache.path)))
+            second = session.get(f"{fake.url}/repos/torvalds/linux/commits/{sha}")
+            self.assertEqual(len(fake.requests), 1)
+            self.assertEqual(second.json(), first.json())
+
+            # Abbreviated SHAs may become ambiguous, they are revalidated
+            session.get(f"{fake.url}/repos/torvalds/linux/commits/{sha[:12]}")
+            session.get(f"{fake.url}/repos/torvalds/linux/commits/{sha[:12]}")
+            self.assertEqual(len(fake.requests), 3)
+            self.assertEqual(fake.not_modified, 1)
+
+    def test_fetched_meanwhile(self):
+        with CFakeGithub(self.tags) as fake:
+            cache = CResponseCache(self.cache.path, os.path.join(self.tmp_dir.name, "locks"))
+            session = new_session(CGithubAdapter(cache))
+            url = f"{fake.url}/repos/torvalds/linux/tags"
+            first = session.get(url)
+            # Another run got the listing while this one waited for the lock.
+            entry = cache.get(f"{url} */*")
+            with patch.object(cache, "get", side_effect=[None, entry]):
+                self.assertEqual(session.get(url).json(), first.json())
+            self.assertEqual(len(fake.requests), 1)
+            self.assertEqual(fake.not_modified, 0)
+
+    def test_not_cached(self):
+        with CFakeGithub(self.tags) as fake:
+            session = new_session(CGithubAdapter(self.cache))
+            for _ in range(2):
+                session.get(f"{fake.url}/repos/torvalds/linux/commits/1e28eed17697")
+                session.post(f"{fake.url}/graphql", json={"query": "{}", "variables": {}})
+            self.assertEqual(len(fake.requests), 4)
+            self.assertEqual(os.listdir(self.cache.path), [])
+
+            session = new_session(CGithubAdapter())
+            session.get(f"{fake.url}/repos/torvalds/linux/tags")
+            session.get(f"{fake.url}/repos/torvalds/linux/tags")
+            self.assertEqual(fake.not_modified, 0)
+
+    def test_corrupted_entry(self):
+        with CFakeGithub(self.tags) as fake:
+            session = new_session(CGithubAdapter(self.cache))
+            url = f"{fake.url}/repos/torvalds/linux/tags"
+            session.get(url)
+            for name in os.listdir(self.cache.path):
+                with open(os.path.join(self.cache.path, name), "w") as entry_file:
+                    entry_file.write("{")
+            self.assertEqual(session.get(url).status_code, 200)
+            self.assertEqual(fake.not_modified, 0)
+
+
+class CCassetteUnitTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, "cassette")
+        self.cache_dir = tmp_dir.name
+        self.tags = make_tags(10)
+
+    def test_replayed_in_order(self):
+        with CFakeGithub(self.tags) as fake:
+            url = f"{fake.url}/repos/torvalds/linux/tags"
+            cache = CResponseCache(os.path.join(self.cache_dir, "record"))
+            session = new_session(CGithubAdapter(cache, cassette=CCassette(self.path)))
+            recorded = [session.get(url).json() for _ in range(2)]
+            self.assertEqual(fake.not_modified, 1)
+
+        sleeps = []
+        cassette = CCassette(self.path, replay=True, latency=True, sleep=sleeps.append)
+        cache = CResponseCache(os.path.join(self.cache_dir, "replay"))
+        session = new_session(CGithubAdapter(cache, cassette=cassette))
+        # The responses as recorded, then the last one again.
+        self.assertEqual([session.get(url).json() for _ in range(3)], recorded + recorded[1:])
+        self.assertEqual(os.listdir(cache.path), [])
+        self.assertEqual(len(sleeps), 3)
+        self.assertEqual(sleeps[1], sleeps[2])
+        with self.assertRaises(GithubException) as context:
+            session.get(f"{url}?page=2")
+        self.assertEqual(context.exception.status, 404)
+
+    def test_recorded_on_warm_cache(self):
+        sha = self.tags[3][1]
+        with CFakeGithub(self.tags) as fake:
+            url = f"{fake.url}/repos/torvalds/linux/commits/{sha}"
+            cache = CResponseCache(os.path.join(self.cache_dir, "warm"))
+            new_session(CGithubAdapter(cache)).get(url)
+            # Answered by the cache, recorded all the same.
+            session = new_session(CGithubAdapter(cache, cassette=CCassette(self.path)))
+            recorded = session.get(url).json()
+            self.assertEqual(len(fake.requests), 1)
+
+        cold = CResponseCache(os.path.join(self.cache_dir, "cold"))
+        # Would wait before any request.
+        rate_limiter = CRateLimiter([], burst=0, sleep=lambda _: self.fail("Replay paced"))
+        cassette = CCassette(self.path, replay=True)
+        session = new_session(CGithubAdapter(cold, rate_limiter, cassette=cassette))
+        self.assertEqual(session.get(url).json(), recorded)
+        self.assertEqual(os.listdir(cold.path), [])
+
+    def test_new_recording(self):
+        with CFakeGithub(self.tags) as fake:
+            for _ in range(2):
+                session = new_session(CGithubAdapter(cassette=CCassette(self.path)))
+                session.get(f"{fake.url}/repos/torvalds/linux/tags")
+        with open(os.path.join(self.path, CASSETTE_NAME)) as cassette_file:
+            self.assertEqual(len(cassette_file.readlines()), 1)
+
+    def test_replay_missing(self):
+        with self.assertRaises(OSError):
+            CCassette(self.path, replay=True)
+
+
+class CLinuxKernelRepoTransportUnitTest(unittest.TestCase):
+    def test_pygithub_through_cache(self):
+        tags = make_tags(10)
+        with CFakeGithub(tags) as fake, tempfile.TemporaryDirectory() as cache_dir:
+            for _ in range(2):
+                lk_repo = CLinuxKernelRepo(None, "1e28eed17697", cache_dir, api_url=fake.url)
+                self.assertEqual(lk_repo._get_tag_commit_date(tags[3][1]), parse_date(tags[3][2]))
+            self.assertEqual(len(fake.requests), 1)
+            self.assertIsInstance(lk_repo.session, requests.Session)
+
+    def test_other_pygithub_clients_alone(self):
+        tags = make_tags(10)
+        with CFakeGithub(tags) as fake, tempfile.TemporaryDirectory() as cache_dir:
+            lk_repo = CLinuxKernelRepo("lk-token", "", cache_dir, api_url=fake.url)
+            other_repo = CLinuxKernelRepo("other-token", "", api_url=fake.url)
+            client = Github("app-token", base_url=fake.url)
+            commit = client.get_repo("torvalds/linux", lazy=True).get_commit(tags[3][1])
+            self.assertEqual(commit.sha, tags[3][1])
+            self.assertEqual(lk_repo._get_tag_commit_date(tags[3][1]), parse_date(tags[3][2]))
+            # Neither cached nor counted nor sent with another client's token.
+            self.assertEqual(len(fake.requests), 2)
+            self.assertEqual(fake.authorizations, ["token app-token", "token lk-token"])
+            self.assertEqual(lk_repo.stats.counters["http_requests"], 1)
+            self.assertNotIn("http_requests", other_repo.stats.counters)
+
+    def test_synthetic_commits(self):
+        tags = make_tags(40)
+        start = parse_date(tags[-1][2])
+        commits = CSyntheticCommits(1000000, start, start + timedelta(weeks=44))
+        commit = commits.sha(300000)
+        with CFakeGithub(tags) as fake:
+            fake.synthetic = commits
+            fake.latency = 0.01
+            lk_repo = CLinuxKernelRepo(None, commit[:12], api_url=fake.url)
+            self.assertEqual(lk_repo.get_tag(), "v2.1")
+            self.assertEqual(lk_repo.commit_date, datetime(2005, 9, 17, 9, 36))
+            self.assertGreater(fake.bytes_sent, 0)
+            # Not a commit, beyond the history and too short to tell.
+            for missing in (commit[:8] + "0" * 32, f"{1000000:08x}", commit[:7]):
+                self.assertIsNone(commits.lookup(missing), missing)
+
+    def test_record_replay(self):
+        tags = make_tags(40)
+        commit = "5a3f0c9e2b7d41c6a8f9e0d1b2c3a4f5e6d7c8b9"
+        with tempfile.TemporaryDirectory() as path:
+            for backend in ("rest", "graphql"):
+                with CFakeGithub(tags) as fake:
+                    fake.commits[commit] = tags[12][2]
+                    cassette = CCassette(path)
+                    lk_repo = CLinuxKernelRepo(
+                        "secret", commit, api_url=fake.url, backend=backend, cassette=cassette
+                    )
+                    recorded = lk_repo.get_tag()
+                    num_requests = len(fake.requests)
+                with open(os.path.join(path, CASSETTE_NAME)) as cassette_file:
+                    self.assertNotIn("secret", cassette_file.read())
+
+                # The server is gone, every request is answered from the cassette.
+                lk_repo = CLinuxKernelRepo(
+                    None,
+                    commit,
+                    api_url=fake.url,
+                    backend=backend,
+                    cassette=CCassette(path, replay=True),
+                )
+                self.assertEqual(lk_repo.get_tag(), recorded)
+                self.assertEqual(lk_repo.get_stats()["counters"]["http_requests"], num_requests)
+
+    def test_record_replay_cache_dir(self):
+        tags = make_tags(40)
+        commit = tags[12][1]
+        with tempfile.TemporaryDirectory() as path, tempfile.TemporaryDirectory() as cache_dir:
+            with CFakeGithub(tags) as fake:
+                # Warm, the recording still makes every request of the lookup.
+                CLinuxKernelRepo(None, commit, cache_dir, api_url=fake.url).get_tag()
+                lk_repo = CLinuxKernelRepo(
+                    None, commit, cache_dir, api_url=fake.url, cassette=CCassette(path)
+                )
+                recorded = lk_repo.get_tag()
+            with tempfile.TemporaryDirectory() as cold_dir:
+                lk_repo = CLinuxKernelRepo(
+                    None, commit, cold_dir, api_url=fake.url, cassette=CCassette(path, replay=True)
+                )
+                self.assertEqual(lk_repo.get_tag(), recorded)
+                self.assertEqual(os.listdir(cold_dir), [])